@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la API: throughput, latencia y memoria por endpoint, tamaño y concurrencia
+
+Corre la app en el proceso (ASGI, sin red) o contra un servidor ya levantado
+(--url) y barre endpoint × tamaño de imagen × concurrencia con las imágenes de
+testing/ y docs/examples/. Cada escenario reporta throughput, p50/p95/p99 y el
+pico de RSS en JSON. Cada petición lleva bytes distintos (un contador al final
+del JPEG) para que el cache de resultados no convierta el benchmark en HITs.
+
+Con --baseline compara contra un reporte anterior y termina con código 1 si
+algún escenario empeoró más que --threshold.
+
+Uso:
+    python benchmarks/bench_api.py                                # en proceso
+    python benchmarks/bench_api.py --url http://localhost:8000    # servidor local
+    python benchmarks/bench_api.py --output bench.json
+    python benchmarks/bench_api.py --baseline bench.json --threshold 10
+
+Requiere httpx. En proceso la app se configura con las mismas variables de
+entorno que el servicio (MODEL_NAME, INFERENCE_BACKEND, ...).
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import psutil
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+SAMPLE_DIRS = [ROOT / "testing", ROOT / "docs" / "examples"]
+
+ENDPOINTS = ["/detect", "/detect-visual", "/detect-batch"]
+BATCH_IMAGES = 4  # Imágenes por petición de /detect-batch
+
+# Métricas comparadas con el baseline: (campo, True si más alto es mejor)
+COMPARED_METRICS = [
+    ("throughput_rps", True),
+    ("p50_ms", False),
+    ("p95_ms", False),
+    ("p99_ms", False),
+    ("peak_rss_mb", False),
+]
+
+
+def load_samples() -> list:
+    return [p.read_bytes() for d in SAMPLE_DIRS for p in sorted(d.glob("*.jpg"))]
+
+
+def resize_sample(image_bytes: bytes, size: int) -> bytes:
+    """Re-encodear la muestra con su lado mayor en size píxeles (0 = original)"""
+    if not size:
+        return image_bytes
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    ratio = size / max(image.size)
+    image = image.resize((max(1, round(image.width * ratio)), max(1, round(image.height * ratio))),
+                         Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def percentile(values: list, p: float) -> float:
+    """Percentil por rango más cercano sobre valores ordenados"""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summarize(latencies: list, statuses: dict, elapsed: float, peak_rss: int) -> dict:
+    latencies = sorted(latencies)
+    ok = statuses.get("200", 0)
+    return {
+        "requests": len(latencies),
+        "errors": len(latencies) - ok,
+        "status_codes": statuses,
+        "throughput_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.mean(latencies), 2) if latencies else None,
+        "p50_ms": round(percentile(latencies, 50), 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 2) if latencies else None,
+        "peak_rss_mb": round(peak_rss / 2**20, 1) if peak_rss else None,
+    }
+
+
+class RssSampler:
+    """
+    Pico de RSS durante un escenario
+
+    En proceso suma este proceso y sus hijos (workers de INFERENCE_EXECUTOR=process);
+    contra un servidor lee process_resident_memory_bytes de /metrics.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, live: bool, interval: float = 0.2):
+        self.client = client
+        self.live = live
+        self.interval = interval
+        self.peak = 0
+        self._task = None
+
+    async def sample(self) -> int:
+        if self.live:
+            response = await self.client.get("/metrics")
+            for line in response.text.splitlines():
+                if line.startswith("process_resident_memory_bytes "):
+                    return int(float(line.split()[1]))
+            return 0
+        process = psutil.Process()
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+
+    async def _run(self):
+        while True:
+            try:
+                self.peak = max(self.peak, await self.sample())
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.peak = 0
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> int:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return self.peak
+
+
+class RequestFactory:
+    """Peticiones de un endpoint con bytes únicos (evita HITs del cache de resultados)"""
+
+    def __init__(self, endpoint: str, images: list, unique: bool = True):
+        self.endpoint = endpoint
+        self.images = images
+        self.unique = unique
+        self.counter = 0
+
+    def _image(self) -> bytes:
+        image = self.images[self.counter % len(self.images)]
+        self.counter += 1
+        # Los decodificadores JPEG ignoran los bytes después del marcador EOI
+        return image + self.counter.to_bytes(8, "big") if self.unique else image
+
+    def files(self) -> list:
+        count = BATCH_IMAGES if self.endpoint == "/detect-batch" else 1
+        field = "files" if self.endpoint == "/detect-batch" else "file"
+        return [(field, (f"bench_{i}.jpg", self._image(), "image/jpeg")) for i in range(count)]
+
+
+async def send(client: httpx.AsyncClient, factory: RequestFactory) -> tuple:
+    files = factory.files()
+    start = time.perf_counter()
+    try:
+        response = await client.post(factory.endpoint, files=files)
+        await response.aread()
+        status = str(response.status_code)
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    return (time.perf_counter() - start) * 1000, status
+
+
+async def run_scenario(client: httpx.AsyncClient, sampler: RssSampler, factory: RequestFactory,
+                       concurrency: int, requests: int, warmup: int) -> dict:
+    """Lanzar requests peticiones con concurrency clientes en paralelo"""
+    for _ in range(warmup):
+        await send(client, factory)
+
+    latencies = []
+    statuses = {}
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            latency, status = await send(client, factory)
+            latencies.append(latency)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    sampler.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    peak_rss = await sampler.stop()
+    return summarize(latencies, statuses, elapsed, peak_rss)
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float):
+    """Esperar a que el modelo esté cargado y calentado (/ready)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"La API no quedó lista en {timeout:.0f}s")
+
+
+async def run_benchmark(args, client: httpx.AsyncClient) -> list:
+    await wait_ready(client, args.ready_timeout)
+    sampler = RssSampler(client, live=bool(args.url))
+    samples = load_samples()
+    results = []
+    for size in args.sizes:
+        images = [resize_sample(sample, size) for sample in samples]
+        for endpoint in args.endpoints:
+            factory = RequestFactory(endpoint, images, unique=not args.cache)
+            for concurrency in args.concurrency:
+                result = {"endpoint": endpoint, "image_size": size or None, "concurrency": concurrency}
+                result.update(await run_scenario(client, sampler, factory, concurrency,
+                                                 args.requests, args.warmup))
+                print(f"{endpoint:<15} size={size or 'orig':<5} c={concurrency:<3} "
+                      f"{result['throughput_rps']:>7.2f} req/s  p50 {result['p50_ms']}ms  "
+                      f"p99 {result['p99_ms']}ms  errores {result['errors']}", file=sys.stderr)
+                results.append(result)
+    return results
+
+
+async def benchmark(args) -> list:
+    timeout = httpx.Timeout(args.timeout)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+            return await run_benchmark(args, client)
+
+    # En proceso: la app corre en este event loop, con su arranque y apagado
+    sys.path.insert(0, str(ROOT / "src"))
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+            return await run_benchmark(args, client)
+
+
+def scenario_key(result: dict) -> tuple:
+    return result["endpoint"], result["image_size"], result["concurrency"]
+
+
+def compare(results: list, baseline: dict, threshold: float) -> dict:
+    """
+    Cambio porcentual de cada métrica contra el baseline
+
+    Una métrica es regresión si empeoró más de threshold % (menos throughput,
+    más latencia o más memoria). Los escenarios sin par en el baseline se ignoran.
+    """
+    previous = {scenario_key(result): result for result in baseline["results"]}
+    scenarios = []
+    for result in results:
+        before = previous.get(scenario_key(result))
+        if before is None:
+            continue
+        changes = {}
+        regressions = []
+        for metric, higher_is_better in COMPARED_METRICS:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            changes[metric] = round(change, 1)
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(metric)
+        scenarios.append({
+            "endpoint": result["endpoint"],
+            "image_size": result["image_size"],
+            "concurrency": result["concurrency"],
+            "change_pct": changes,
+            "regressions": regressions,
+        })
+    return {
+        "baseline_commit": baseline.get("environment", {}).get("commit"),
+        "threshold_pct": threshold,
+        "scenarios": scenarios,
+        "regressed": sum(1 for scenario in scenarios if scenario["regressions"]),
+    }
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "memory_mb": round(psutil.virtual_memory().total / 2**20),
+    }
+
+
+def int_list(value: str) -> list:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default=None, help="Servidor a medir (default: app en proceso)")
+    parser.add_argument("--endpoints", default="/detect",
+                        type=lambda value: [item.strip() for item in value.split(",") if item.strip()],
+                        help=f"Endpoints separados por coma ({', '.join(ENDPOINTS)})")
+    parser.add_argument("--sizes", default="640,1280,1920", type=int_list,
+                        help="Lado mayor de las imágenes enviadas (0 = original)")
+    parser.add_argument("--concurrency", default="1,4", type=int_list, help="Clientes en paralelo")
+    parser.add_argument("--requests", type=int, default=40, help="Peticiones medidas por escenario")
+    parser.add_argument("--warmup", type=int, default=3, help="Peticiones descartadas por escenario")
+    parser.add_argument("--cache", action="store_true", help="Repetir bytes idénticos (mide HITs del cache)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Timeout por petición en segundos")
+    parser.add_argument("--ready-timeout", type=float, default=300.0, help="Espera máxima a /ready")
+    parser.add_argument("--output", default=None, help="Guardar el reporte JSON en este archivo")
+    parser.add_argument("--baseline", default=None, help="Reporte anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Empeoramiento tolerado en %%")
+    args = parser.parse_args()
+
+    unknown = [endpoint for endpoint in args.endpoints if endpoint not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Endpoints inválidos: {', '.join(unknown)} (opciones: {', '.join(ENDPOINTS)})")
+
+    report = {
+        "mode": "live" if args.url else "in_process",
+        "target": args.url,
+        "environment": environment(),
+        "config": {
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "cache": args.cache,
+            "batch_images": BATCH_IMAGES,
+            "samples": len(load_samples()),
+        },
+        "results": asyncio.run(benchmark(args)),
+    }
+    if args.baseline:
+        report["comparison"] = compare(report["results"], json.loads(Path(args.baseline).read_text()),
+                                       args.threshold)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    print(output)
+
+    if report.get("comparison", {}).get("regressed"):
+        for scenario in report["comparison"]["scenarios"]:
+            if scenario["regressions"]:
+                print(f"⚠️  Regresión en {scenario['endpoint']} size={scenario['image_size']} "
+                      f"c={scenario['concurrency']}: {', '.join(scenario['regressions'])}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark de estrategia de memoria: gc.collect() por petición vs marca de agua
+
+Simula el camino de una petición (lectura del upload, decodificación y, si hay
+un modelo disponible, inferencia) con las dos estrategias y reporta latencia y
+RSS en JSON.
+
+Uso:
+    python benchmarks/bench_memory.py                      # solo decodificación
+    python benchmarks/bench_memory.py --model yolov5n.pt   # con inferencia
+"""
+
+import argparse
+import gc
+import io
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import psutil
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from memory import BufferPool, BufferReader, MemoryManager, detect_memory_limit  # noqa: E402
+
+SAMPLE_DIRS = [ROOT / "testing", ROOT / "docs" / "examples"]
+
+
+def load_samples() -> list:
+    return [p.read_bytes() for d in SAMPLE_DIRS for p in sorted(d.glob("*.jpg"))]
+
+
+def legacy_cleanup():
+    """Comportamiento anterior: gc completo + caché CUDA en cada petición"""
+    gc.collect()
+    try:
+        import torch
+        torch.cuda.empty_cache()
+    except Exception:
+        pass
+
+
+def run_legacy(samples, iterations, model):
+    for i in range(iterations):
+        data = bytes(samples[i % len(samples)])  # file.read() asigna bytes nuevos
+        img = Image.open(io.BytesIO(data)).convert("RGB")
+        if model is not None:
+            model(img, verbose=False)
+        del img, data
+        legacy_cleanup()
+        yield
+
+
+def run_managed(samples, iterations, model, manager, pool):
+    for i in range(iterations):
+        sample = samples[i % len(samples)]
+        upload = pool.acquire(len(sample))
+        upload.view[:] = sample  # readinto del upload sobre un buffer reutilizado
+        img = Image.open(BufferReader(upload.view)).convert("RGB")
+        upload.release()
+        if model is not None:
+            model(img, verbose=False)
+        del img
+        manager.maybe_collect()
+        yield
+
+
+def measure(name, steps) -> dict:
+    process = psutil.Process()
+    latencies = []
+    peak = process.memory_info().rss
+    while True:
+        start = time.perf_counter()
+        try:
+            next(steps)
+        except StopIteration:
+            break
+        latencies.append((time.perf_counter() - start) * 1000)
+        peak = max(peak, process.memory_info().rss)
+    latencies.sort()
+    return {
+        "strategy": name,
+        "iterations": len(latencies),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "p50_ms": round(latencies[len(latencies) // 2], 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "final_rss_mb": round(process.memory_info().rss / 2**20, 1),
+        "peak_rss_mb": round(peak / 2**20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--model", default=None, help="Modelo YOLO (opcional, requiere ultralytics)")
+    args = parser.parse_args()
+
+    model = None
+    if args.model:
+        from ultralytics import YOLO
+        model = YOLO(args.model)
+        model.fuse()
+
+    samples = load_samples()
+    manager = MemoryManager(detect_memory_limit())
+    pool = BufferPool(32 * 2**20)
+
+    report = {
+        "model": args.model,
+        "samples": len(samples),
+        "results": [
+            measure("gc_per_request", run_legacy(samples, args.iterations, model)),
+            measure("watermark", run_managed(samples, args.iterations, model, manager, pool)),
+        ],
+        "memory_manager": manager.stats(),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark de /detect-visual: latencia y tamaño de salida por formato
+
+Compara el render anterior (copia de la imagen + PNG optimize=True) con el
+render en el lugar y cache de glifos en PNG, JPEG y WebP. Las detecciones son
+sintéticas (o las de un modelo real si se pasa --model) y se reporta en JSON.
+
+Uso:
+    python benchmarks/bench_render.py
+    python benchmarks/bench_render.py --boxes 50 --quality 75
+    python benchmarks/bench_render.py --model yolov5n.pt
+"""
+
+import argparse
+import io
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import ImageDraw
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from imaging import decode_image  # noqa: E402
+from rendering import BOX_COLORS, RENDER_FORMATS, draw_detections, encode_image  # noqa: E402
+
+SAMPLE_DIRS = [ROOT / "testing", ROOT / "docs" / "examples"]
+
+
+def load_samples() -> list:
+    return [p.read_bytes() for d in SAMPLE_DIRS for p in sorted(d.glob("*.jpg"))]
+
+
+def synthetic_objects(size: tuple, boxes: int, seed: int = 0) -> dict:
+    """Detecciones al azar en coordenadas de la imagen original"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    x1 = rng.uniform(0, width * 0.8, boxes)
+    y1 = rng.uniform(0, height * 0.8, boxes)
+    x2 = x1 + rng.uniform(20, width * 0.2, boxes)
+    y2 = y1 + rng.uniform(20, height * 0.2, boxes)
+    return {
+        "class": [f"class_{i}" for i in rng.integers(0, 80, boxes)],
+        "confidence": np.round(np.sort(rng.uniform(0.4, 1.0, boxes))[::-1], 3).tolist(),
+        "bbox": np.rint(np.stack([x1, y1, x2, y2], 1)).astype(int).tolist(),
+    }
+
+
+def model_objects(model, image_bytes: bytes) -> dict:
+    """Detecciones reales del modelo (mismo post-procesado que la API)"""
+    from main import extract_objects
+    decoded = decode_image(image_bytes, 640)
+    return extract_objects(model(decoded.array, verbose=False)[0], decoded.scale)
+
+
+def legacy_render(decoded, objects: dict) -> int:
+    """Render anterior: copia completa, textbbox por caja y PNG optimize=True"""
+    img_copy = decoded.image.copy()
+    sx, sy = decoded.scale
+    draw = ImageDraw.Draw(img_copy)
+    for idx, (class_name, conf, bbox) in enumerate(zip(objects["class"], objects["confidence"], objects["bbox"])):
+        x1, y1, x2, y2 = bbox[0] / sx, bbox[1] / sy, bbox[2] / sx, bbox[3] / sy
+        color = BOX_COLORS[idx % len(BOX_COLORS)]
+        draw.rectangle([x1, y1, x2, y2], outline=color, width=3)
+        label = f"{class_name} {conf:.2f}"
+        text_bbox = draw.textbbox((x1, y1 - 20), label)
+        draw.rectangle([text_bbox[0], text_bbox[1], text_bbox[2] + 5, text_bbox[3] + 5], fill=color)
+        draw.text((x1, y1 - 20), label, fill=(255, 255, 255))
+    buffer = io.BytesIO()
+    img_copy.save(buffer, format="PNG", optimize=True)
+    return len(buffer.getvalue())
+
+
+def fast_render(decoded, objects: dict, fmt: str, quality: int) -> int:
+    draw_detections(decoded.image, objects, decoded.scale)
+    buffer = io.BytesIO()
+    encode_image(decoded.image, buffer, fmt, quality)
+    return len(buffer.getvalue())
+
+
+def measure(name, render, cases, iterations, max_side) -> dict:
+    latencies = []
+    sizes = []
+    for i in range(iterations):
+        image_bytes, objects = cases[i % len(cases)]
+        # Decodificación fuera de la medición (igual para todas las variantes)
+        decoded = decode_image(image_bytes, max_side, keep_image=True)
+        start = time.perf_counter()
+        sizes.append(render(decoded, objects))
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "variant": name,
+        "iterations": len(latencies),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "p50_ms": round(latencies[len(latencies) // 2], 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "mean_kb": round(statistics.mean(sizes) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--boxes", type=int, default=10, help="Detecciones sintéticas por imagen")
+    parser.add_argument("--quality", type=int, default=85, help="Calidad JPEG/WebP")
+    parser.add_argument("--max-side", type=int, default=1920, help="MAX_IMAGE_SIZE de la API")
+    parser.add_argument("--model", default=None, help="Modelo YOLO (opcional, requiere ultralytics)")
+    args = parser.parse_args()
+
+    samples = load_samples()
+    if args.model:
+        from ultralytics import YOLO
+        model = YOLO(args.model)
+        cases = [(sample, model_objects(model, sample)) for sample in samples]
+    else:
+        cases = [
+            (sample, synthetic_objects(decode_image(sample, args.max_side).original_size, args.boxes, seed))
+            for seed, sample in enumerate(samples)
+        ]
+
+    results = [measure("legacy_png_optimize", legacy_render, cases, args.iterations, args.max_side)]
+    for fmt in RENDER_FORMATS:
+        results.append(measure(
+            fmt, lambda decoded, objects, fmt=fmt: fast_render(decoded, objects, fmt, args.quality),
+            cases, args.iterations, args.max_side
+        ))
+
+    report = {
+        "model": args.model,
+        "samples": len(samples),
+        "boxes": None if args.model else args.boxes,
+        "quality": args.quality,
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
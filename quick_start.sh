@@ -56,14 +56,20 @@ case "${1:-help}" in
             $IMAGE_NAME
         
         print_success "Container started: $CONTAINER_NAME"
-        print_info "Wait 2-3 seconds for startup..."
-        sleep 2
+        print_info "Waiting for model load and warm-up..."
         
-        # Check health
-        if curl -s $API_URL/health > /dev/null; then
-            print_success "API is responding on $API_URL"
+        # Check readiness (/ready returns 503 until the model is loaded and warmed up)
+        for i in $(seq 1 60); do
+            if curl -sf $API_URL/ready > /dev/null; then
+                break
+            fi
+            sleep 2
+        done
+        
+        if curl -sf $API_URL/ready > /dev/null; then
+            print_success "API is ready on $API_URL"
         else
-            print_error "API not responding yet. Check logs: docker logs $CONTAINER_NAME"
+            print_error "API not ready yet. Check logs: docker logs $CONTAINER_NAME"
         fi
         ;;
 
@@ -196,6 +202,7 @@ ${GREEN}Examples:${NC}
 ${GREEN}API Endpoints:${NC}
 
   GET  $API_URL/health        - Health check
+  GET  $API_URL/ready         - Readiness (model loaded)
   GET  $API_URL/              - API info
   POST $API_URL/detect        - Detect objects
 
@@ -0,0 +1,101 @@
+"""
+Extracción de imágenes desde archivos zip/tar subidos a /detect-batch
+"""
+
+import io
+import os
+import tarfile
+import zipfile
+import zlib
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".gif", ".tif", ".tiff"}
+
+ARCHIVE_CONTENT_TYPES = {
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/x-tar",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-gtar",
+}
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz")
+
+
+class ArchiveError(Exception):
+    """Archivo comprimido inválido o que excede los límites"""
+
+
+def is_archive(filename: str, content_type: str) -> bool:
+    """Detectar si un upload es un zip/tar por content type o extensión"""
+    if content_type in ARCHIVE_CONTENT_TYPES:
+        return True
+    return (filename or "").lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def is_image_name(name: str) -> bool:
+    """Filtrar miembros del archivo por extensión de imagen"""
+    return os.path.splitext(name.lower())[1] in IMAGE_EXTENSIONS
+
+
+def extract_images(data: bytes, max_files: int, max_bytes: int) -> list:
+    """
+    Extraer las imágenes de un zip o tar
+
+    Args:
+        data: Contenido del archivo
+        max_files: Máximo de imágenes a extraer
+        max_bytes: Máximo de bytes descomprimidos en total
+
+    Returns:
+        Lista de (nombre, bytes) en el orden del archivo
+
+    Raises:
+        ArchiveError: Si el archivo no es válido o excede los límites
+    """
+    if zipfile.is_zipfile(io.BytesIO(data)):
+        try:
+            return _extract_zip(data, max_files, max_bytes)
+        except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+            raise ArchiveError(f"Zip corrupto: {e}") from e
+        except (RuntimeError, NotImplementedError) as e:
+            # Miembros cifrados o con compresión no soportada
+            raise ArchiveError(f"Zip no soportado: {e}") from e
+    try:
+        return _extract_tar(data, max_files, max_bytes)
+    except tarfile.TarError as e:
+        raise ArchiveError(f"Archivo no soportado (se espera zip o tar): {e}")
+
+
+def _check_limits(count: int, total: int, max_files: int, max_bytes: int):
+    if count > max_files:
+        raise ArchiveError(f"El archivo contiene más de {max_files} imágenes")
+    if total > max_bytes:
+        raise ArchiveError(f"El archivo descomprimido supera {max_bytes // (1024 * 1024)}MB")
+
+
+def _extract_zip(data: bytes, max_files: int, max_bytes: int) -> list:
+    images = []
+    total = 0
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not is_image_name(info.filename):
+                continue
+            # Validar con el tamaño declarado antes de descomprimir
+            total += info.file_size
+            _check_limits(len(images) + 1, total, max_files, max_bytes)
+            images.append((info.filename, archive.read(info)))
+    return images
+
+
+def _extract_tar(data: bytes, max_files: int, max_bytes: int) -> list:
+    images = []
+    total = 0
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as archive:
+        for member in archive:
+            if not member.isfile() or not is_image_name(member.name):
+                continue
+            total += member.size
+            _check_limits(len(images) + 1, total, max_files, max_bytes)
+            images.append((member.name, archive.extractfile(member).read()))
+    return images
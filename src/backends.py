@@ -0,0 +1,296 @@
+"""
+Backends de inferencia
+
+El modelo se puede servir con PyTorch o exportado a ONNX Runtime, OpenVINO o
+TorchScript. Los formatos exportados se generan una sola vez (en el primer
+arranque) y se guardan en EXPORT_DIR; todos se cargan a través de ultralytics,
+así que los resultados tienen la misma forma que con PyTorch. Con PyTorch se
+cachea también el checkpoint ya fusionado, así no se fusiona en cada arranque.
+
+ultralytics (y con él torch) se importa recién al cargar un modelo: importar
+este módulo es barato y la API puede aceptar conexiones mientras carga.
+
+Verificar paridad contra PyTorch:
+    python backends.py --backend onnx --images ../testing ../docs/examples
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# backend -> (formato de export de ultralytics, sufijo del artefacto exportado)
+BACKEND_FORMATS = {
+    "torch": (None, ""),
+    "onnx": ("onnx", ".onnx"),
+    "openvino": ("openvino", "_openvino_model"),
+    "torchscript": ("torchscript", ".torchscript"),
+}
+
+
+class InferenceBackend:
+    """
+    Modelo YOLO listo para inferencia con un backend concreto
+
+    Args:
+        name: Backend (torch, onnx, openvino, torchscript)
+        model: Instancia YOLO de ultralytics
+        weights: Ruta de los pesos o del modelo exportado
+        quantize: Modo de cuantización aplicado ("" = float)
+    """
+
+    def __init__(self, name: str, model, weights: str, quantize: str = ""):
+        self.name = name
+        self.model = model
+        self.weights = weights
+        self.quantize = quantize
+
+    @property
+    def names(self) -> dict:
+        return self.model.names
+
+    @property
+    def supports_batching(self) -> bool:
+        """TorchScript se exporta con forma fija (batch 1)"""
+        return self.dynamic_shape
+
+    @property
+    def dynamic_shape(self) -> bool:
+        """False si el modelo solo acepta el batch e imgsz del export (TorchScript)"""
+        return self.name != "torchscript"
+
+    def predict(self, images, **kwargs):
+        """Inferencia sobre una imagen o lista de imágenes"""
+        return self.model(images, verbose=False, **kwargs)
+
+    def info(self) -> dict:
+        return {"backend": self.name, "weights": self.weights, "quantize": self.quantize or None}
+
+
+def export_path(model_name: str, backend: str, imgsz: int, export_dir: str, tag: str = "") -> Path:
+    """Ruta del artefacto exportado en el cache de exports"""
+    _, suffix = BACKEND_FORMATS[backend]
+    tag = f"_{tag}" if tag else ""
+    return Path(export_dir) / f"{Path(model_name).stem}_{imgsz}{tag}{suffix}"
+
+
+def export_model(model_name: str, backend: str, imgsz: int, export_dir: str,
+                 tag: str = "", **export_args) -> Path:
+    """
+    Exportar el modelo al formato del backend, reutilizando el export si ya existe
+
+    Args:
+        tag: Distingue variantes del mismo formato en el cache (ej: "fp16")
+        export_args: Argumentos extra para YOLO.export (ej: half=True)
+    """
+    target = export_path(model_name, backend, imgsz, export_dir, tag)
+    if target.exists():
+        logger.info(f"📦 Usando export cacheado: {target}")
+        return target
+
+    from ultralytics import YOLO
+
+    fmt, _ = BACKEND_FORMATS[backend]
+    logger.info(f"🔧 Exportando {model_name} a {fmt} (imgsz={imgsz}), solo la primera vez...")
+    start = time.time()
+    # dynamic: batch y tamaño variables (necesario para el micro-batching)
+    dynamic = backend in ("onnx", "openvino")
+    exported = YOLO(model_name).export(format=fmt, imgsz=imgsz, dynamic=dynamic, **export_args)
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(exported), str(target))
+    logger.info(f"✅ Export listo en {(time.time() - start):.1f}s: {target}")
+    return target
+
+
+def fused_path(model_name: str, export_dir: str) -> Path:
+    """Ruta del checkpoint PyTorch ya fusionado en el cache de exports"""
+    return Path(export_dir) / f"{Path(model_name).stem}_fused.pt"
+
+
+def load_fused(model_name: str, export_dir: str):
+    """
+    Cargar el modelo PyTorch con capas Conv+BN fusionadas
+
+    El primer arranque carga los pesos originales (descargándolos si hace
+    falta), fusiona y guarda el checkpoint en EXPORT_DIR; los siguientes lo
+    cargan directo, sin descarga ni fusión.
+    """
+    from ultralytics import YOLO
+
+    cached = fused_path(model_name, export_dir)
+    if cached.exists():
+        try:
+            model = YOLO(str(cached))
+            logger.info(f"📦 Usando pesos fusionados cacheados: {cached}")
+            return model
+        except Exception as e:
+            # Checkpoint corrupto o de otra versión de ultralytics: regenerar
+            logger.warning(f"⚠️ Checkpoint fusionado inválido ({e}), regenerando")
+            cached.unlink(missing_ok=True)
+
+    # Cargar modelo YOLO (se descarga automáticamente si no existe)
+    model = YOLO(model_name)
+    # Configurar modelo para inferencia óptima
+    model.fuse()  # Fusionar capas para mejor velocidad
+    try:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        model.save(str(cached))
+        logger.info(f"💾 Pesos fusionados guardados en {cached}")
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo cachear el checkpoint fusionado: {e}")
+    return model
+
+
+def load_backend(model_name: str, backend: str = "torch", imgsz: int = 640,
+                 export_dir: str = "exports", quantize: str = "",
+                 calibration_dir: str = "") -> InferenceBackend:
+    """
+    Cargar el modelo con el backend pedido
+
+    Args:
+        quantize: Modo de cuantización (ver quantization.QUANTIZE_MODES), "" = float
+        calibration_dir: Imágenes de calibración para quantize="static"
+
+    Raises:
+        ValueError: Si el backend no existe o no soporta la cuantización pedida
+    """
+    if backend not in BACKEND_FORMATS:
+        raise ValueError(f"Backend inválido: {backend} (opciones: {', '.join(BACKEND_FORMATS)})")
+
+    if quantize:
+        from quantization import load_quantized
+        return load_quantized(model_name, backend, quantize, imgsz, export_dir, calibration_dir)
+
+    if backend == "torch":
+        return InferenceBackend(backend, load_fused(model_name, export_dir), model_name)
+
+    from ultralytics import YOLO
+
+    weights = export_model(model_name, backend, imgsz, export_dir)
+    return InferenceBackend(backend, YOLO(str(weights), task="detect"), str(weights))
+
+
+# ==================== PARIDAD ====================
+
+def result_arrays(result) -> tuple:
+    """(xyxy, conf, cls) como arrays NumPy de un resultado YOLO"""
+    if result.boxes is None or len(result.boxes) == 0:
+        return np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=int)
+    data = result.boxes.data.cpu().numpy()
+    return data[:, :4], data[:, 4], data[:, 5].astype(int)
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU entre dos conjuntos de cajas xyxy (N x M)"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match_detections(reference, candidate, iou_threshold: float = 0.5) -> dict:
+    """
+    Emparejar detecciones de la misma clase por IoU (greedy por confianza)
+
+    Returns:
+        Dict con matched, reference, candidate, f1 y mean_iou
+    """
+    ref_boxes, ref_conf, ref_cls = reference
+    cand_boxes, _, cand_cls = candidate
+    iou = box_iou(ref_boxes, cand_boxes)
+    iou[ref_cls[:, None] != cand_cls[None, :]] = 0
+
+    matched_ious = []
+    available = np.ones(len(cand_boxes), dtype=bool)
+    for i in np.argsort(-ref_conf):
+        overlaps = np.where(available, iou[i], 0)
+        if len(overlaps) == 0:
+            break
+        j = int(np.argmax(overlaps))
+        if overlaps[j] >= iou_threshold:
+            available[j] = False
+            matched_ious.append(float(overlaps[j]))
+
+    matched = len(matched_ious)
+    total = len(ref_boxes) + len(cand_boxes)
+    return {
+        "matched": matched,
+        "reference": len(ref_boxes),
+        "candidate": len(cand_boxes),
+        "f1": round(2 * matched / total, 3) if total else 1.0,
+        "mean_iou": round(float(np.mean(matched_ious)), 3) if matched_ious else None,
+    }
+
+
+def sample_images(paths: list) -> list:
+    """Listar imágenes JPG/PNG de una lista de archivos o directorios"""
+    images = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            images.extend(sorted(p for p in path.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png")))
+        elif path.exists():
+            images.append(path)
+    return images
+
+
+def check_parity(reference: InferenceBackend, candidate: InferenceBackend, images: list,
+                 conf: float = 0.4, imgsz: int = 640) -> dict:
+    """Comparar detecciones y latencia de dos backends sobre imágenes de muestra"""
+    per_image = []
+    for path in images:
+        timings = {}
+        outputs = {}
+        for label, backend in (("reference", reference), ("candidate", candidate)):
+            start = time.perf_counter()
+            result = backend.predict(str(path), conf=conf, imgsz=imgsz)[0]
+            timings[label] = (time.perf_counter() - start) * 1000
+            outputs[label] = result_arrays(result)
+        per_image.append({
+            "image": path.name,
+            **match_detections(outputs["reference"], outputs["candidate"]),
+            "reference_ms": round(timings["reference"], 1),
+            "candidate_ms": round(timings["candidate"], 1),
+        })
+
+    matched = sum(r["matched"] for r in per_image)
+    total = sum(r["reference"] + r["candidate"] for r in per_image)
+    return {
+        "reference": reference.info(),
+        "candidate": candidate.info(),
+        "images": len(per_image),
+        "f1": round(2 * matched / total, 3) if total else 1.0,
+        "per_image": per_image,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verificar paridad de un backend contra PyTorch")
+    parser.add_argument("--model", default=os.getenv("MODEL_NAME", "yolov5n.pt"))
+    parser.add_argument("--backend", required=True, choices=[b for b in BACKEND_FORMATS if b != "torch"])
+    parser.add_argument("--imgsz", type=int, default=int(os.getenv("DECODE_SIZE", "640")))
+    parser.add_argument("--conf", type=float, default=float(os.getenv("CONFIDENCE", "0.4")))
+    parser.add_argument("--export-dir", default=os.getenv("EXPORT_DIR", "exports"))
+    parser.add_argument("--images", nargs="+", default=["../testing", "../docs/examples"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    reference = load_backend(args.model, "torch")
+    candidate = load_backend(args.model, args.backend, args.imgsz, args.export_dir)
+    report = check_parity(reference, candidate, sample_images(args.images), args.conf, args.imgsz)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
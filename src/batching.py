@@ -0,0 +1,102 @@
+"""
+Micro-batching dinámico
+
+Agrupa peticiones concurrentes en un solo forward pass del modelo: junta hasta
+max_size imágenes o espera como máximo max_wait_ms desde la primera, ejecuta el
+batch en el pool de inferencia y devuelve a cada llamador su propio resultado.
+"""
+
+import asyncio
+import logging
+from collections import Counter
+
+from profiling import current_profile
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Agrupador de peticiones para inferencia en batch
+
+    Args:
+        run_batch: Función bloqueante run_batch(items, key) -> lista de resultados (uno por item)
+        pool: InferencePool donde se ejecuta cada batch
+        max_size: Máximo de imágenes por batch (1 = sin batching)
+        max_wait_ms: Espera máxima desde la primera imagen del batch
+    """
+
+    def __init__(self, run_batch, pool, max_size: int = 4, max_wait_ms: float = 10.0):
+        self.run_batch = run_batch
+        self.pool = pool
+        self.max_size = max(1, max_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+
+        # Solo se agrupan items con la misma key (ej: mismo umbral de confianza)
+        self._pending = {}
+        self._timers = {}
+        self._tasks = set()
+
+        self.batches = 0
+        self.images = 0
+        self.histogram = Counter()
+
+    async def submit(self, item, key=None):
+        """Encolar un item y esperar su resultado"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((item, future, current_profile()))
+
+        if len(batch) >= self.max_size:
+            self._flush(key)
+        elif len(batch) == 1:
+            self._timers[key] = loop.call_later(self.max_wait, self._flush, key)
+
+        return await future
+
+    def _flush(self, key):
+        """Despachar el batch pendiente de una key"""
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if not batch:
+            return
+
+        task = asyncio.ensure_future(self._dispatch(key, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, key, batch):
+        """Ejecutar un batch en el pool y repartir resultados"""
+        items = [item for item, _, _ in batch]
+        self.batches += 1
+        self.images += len(items)
+        self.histogram[len(items)] += 1
+
+        # La tarea hereda el contexto de quien despachó: el batch se registra
+        # explícitamente en el perfil de cada petición que agrupa (una vez por perfil)
+        profiles = list({id(profile): profile for _, _, profile in batch if profile is not None}.values())
+        try:
+            results = await self.pool.run(self.run_batch, items, key, profiles=profiles)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """Tamaño de batch observado"""
+        return {
+            "max_size": self.max_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "images": self.images,
+            "avg_batch_size": round(self.images / self.batches, 2) if self.batches else 0.0,
+            "histogram": {str(size): count for size, count in sorted(self.histogram.items())},
+        }
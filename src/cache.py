@@ -0,0 +1,233 @@
+"""
+Cache de resultados por contenido de imagen
+
+Cámaras fijas y clientes que reintentan envían imágenes idénticas byte a byte.
+El cache guarda las detecciones por hash de la imagen más los parámetros que
+afectan el resultado (modelo, confianza, tamaño máximo), en un LRU acotado por
+bytes con TTL opcional y un segundo nivel opcional en disco. Las entradas se
+guardan serializadas (JSON) y se decodifican en cada acierto: el presupuesto
+cuenta lo que realmente ocupan, no un árbol de dicts varias veces más grande.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    LRU de detecciones con presupuesto de memoria en bytes
+
+    Args:
+        max_bytes: Presupuesto de memoria (0 desactiva el cache)
+        ttl: Segundos de validez de cada entrada (0 = sin vencimiento)
+        disk_dir: Directorio del nivel en disco (None = solo memoria)
+        disk_max_bytes: Presupuesto del nivel en disco
+    """
+
+    def __init__(self, max_bytes: int, ttl: float = 0, disk_dir: str = None,
+                 disk_max_bytes: int = 0):
+        self.max_bytes = max(0, max_bytes)
+        self.ttl = max(0.0, ttl)
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = max(0, disk_max_bytes)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, size, JSON)
+        self._bytes = 0
+        self._disk_entries = OrderedDict()  # key -> size (orden LRU aproximado por mtime)
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if self.enabled and self.disk_dir:
+            self._load_disk_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(image_bytes: bytes, *params) -> str:
+        """Hash de la imagen + parámetros que afectan el resultado"""
+        digest = hashlib.blake2b(image_bytes, digest_size=16)
+        digest.update(repr(params).encode())
+        return digest.hexdigest()
+
+    def lookup(self, image_bytes: bytes, *params) -> tuple:
+        """
+        Buscar el resultado de una imagen (bloqueante: hashea y puede leer disco)
+
+        Returns:
+            (key, value) con value None si no está en cache
+        """
+        key = self.make_key(image_bytes, *params)
+        return key, self.get(key)
+
+    def get(self, key: str):
+        """Obtener una entrada (memoria y luego disco)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size, payload = entry
+                if expires_at and expires_at < now:
+                    self._remove(key)
+                    self.expirations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(payload)
+
+        payload = self._disk_get(key) if self.disk_dir else None
+        value = None
+        if payload is not None:
+            try:
+                value = json.loads(payload)
+            except ValueError:
+                self._disk_remove(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        # Promover a memoria
+        self._memory_put(key, payload)
+        return value
+
+    def put(self, key: str, value):
+        """Guardar una entrada (bloqueante si hay nivel en disco)"""
+        if not self.enabled:
+            return
+        payload = json.dumps(value)
+        self._memory_put(key, payload)
+        if self.disk_dir:
+            self._disk_put(key, payload)
+
+    def _memory_put(self, key: str, payload: str):
+        size = sys.getsizeof(payload)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, payload)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    # ==================== NIVEL EN DISCO ====================
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _load_disk_index(self):
+        """Indexar entradas existentes (sobreviven reinicios del contenedor)"""
+        os.makedirs(self.disk_dir, exist_ok=True)
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".json"):
+                stat = os.stat(os.path.join(self.disk_dir, name))
+                files.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+        logger.info(f"💾 Cache en disco: {len(files)} entradas en {self.disk_dir}")
+
+    def _disk_get(self, key: str):
+        """JSON de una entrada en disco (None si no está o venció)"""
+        with self._lock:
+            if key not in self._disk_entries:
+                return None
+        path = self._disk_path(key)
+        try:
+            if self.ttl and time.time() - os.path.getmtime(path) > self.ttl:
+                self._disk_remove(key)
+                with self._lock:
+                    self.expirations += 1
+                return None
+            with open(path) as f:
+                payload = f.read()
+        except (OSError, ValueError):
+            self._disk_remove(key)
+            return None
+        with self._lock:
+            if key in self._disk_entries:
+                self._disk_entries.move_to_end(key)
+        return payload
+
+    def _disk_put(self, key: str, payload: str):
+        size = len(payload)
+        if self.disk_max_bytes and size > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"No se pudo escribir cache en disco: {e}")
+            return
+
+        evicted = []
+        with self._lock:
+            self._disk_bytes -= self._disk_entries.pop(key, 0)
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+            while self.disk_max_bytes and self._disk_bytes > self.disk_max_bytes:
+                oldest, oldest_size = self._disk_entries.popitem(last=False)
+                self._disk_bytes -= oldest_size
+                evicted.append(oldest)
+                self.evictions += 1
+        for oldest in evicted:
+            self._unlink(oldest)
+
+    def _disk_remove(self, key: str):
+        with self._lock:
+            self._disk_bytes -= self._disk_entries.pop(key, 0)
+        self._unlink(key)
+
+    def _unlink(self, key: str):
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        """Contadores de hit/miss/eviction"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl,
+                "disk_entries": len(self._disk_entries) if self.disk_dir else 0,
+                "disk_bytes": self._disk_bytes if self.disk_dir else 0,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
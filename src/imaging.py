@@ -0,0 +1,133 @@
+"""
+Decodificación rápida de imágenes
+
+Los JPEG grandes se decodifican directamente cerca del tamaño de destino usando
+el escalado DCT del decoder (draft mode), en lugar de decodificar a resolución
+completa y reducir después. El modelo recibe un array NumPy BGR contiguo, que
+es lo que ultralytics espera, así no vuelve a convertir la imagen.
+"""
+
+import math
+import time
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from memory import BufferReader
+
+RESAMPLE_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+
+
+class DecodedImage(NamedTuple):
+    """Imagen lista para inferencia"""
+    array: np.ndarray                 # BGR HWC uint8 contiguo (entrada del modelo)
+    original_size: Tuple[int, int]    # (ancho, alto) del archivo subido
+    scale: Tuple[float, float]        # Factor decodificada -> original (x, y)
+    image: Optional[Image.Image]      # Imagen PIL RGB (solo si se pidió, para dibujar)
+    timings: dict                     # Segundos por etapa (decode, resize)
+    offset: Tuple[float, float] = (0.0, 0.0)  # Esquina de la región (ROI) en la original
+
+
+def target_size(size: tuple, max_side: int) -> tuple:
+    """Tamaño que entra en max_side conservando la proporción"""
+    width, height = size
+    ratio = max_side / max(width, height)
+    if ratio >= 1:
+        return size
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+
+def probe_size(image_bytes) -> tuple:
+    """(ancho, alto) de una imagen leyendo solo el header"""
+    return Image.open(BufferReader(memoryview(image_bytes))).size
+
+
+def decode_image(image_bytes, max_side: int, resample: str = "bilinear",
+                 keep_image: bool = False, roi: Optional[tuple] = None) -> DecodedImage:
+    """
+    Decodificar una imagen con su lado mayor acotado a max_side
+
+    Args:
+        image_bytes: Contenido del archivo (bytes o memoryview)
+        max_side: Lado mayor máximo de la imagen decodificada
+        resample: Filtro para el ajuste final (ver RESAMPLE_FILTERS)
+        keep_image: Devolver también la imagen PIL (para dibujar encima)
+        roi: Región (x1, y1, x2, y2) de la original a decodificar; max_side
+            se aplica a la región, así que un recorte gana resolución
+    """
+    start = time.perf_counter()
+    img = Image.open(BufferReader(memoryview(image_bytes)))
+    original_size = img.size
+    region = roi or (0, 0, *original_size)
+    region_size = (region[2] - region[0], region[3] - region[1])
+    size = target_size(region_size, max_side)
+
+    if size != region_size and img.format == "JPEG":
+        # Escalado DCT: decodifica a 1/2, 1/4 o 1/8 quedando la región >= size
+        ratio = max(size[0] / region_size[0], size[1] / region_size[1])
+        img.draft("RGB", (math.ceil(original_size[0] * ratio), math.ceil(original_size[1] * ratio)))
+
+    offset = (0.0, 0.0)
+    if roi:
+        # La región en coordenadas de lo que entregó el decoder (con draft es más chico)
+        dx, dy = img.size[0] / original_size[0], img.size[1] / original_size[1]
+        box = (round(region[0] * dx), round(region[1] * dy), round(region[2] * dx), round(region[3] * dy))
+        img = img.crop(box)
+        offset = (box[0] / dx, box[1] / dy)
+        region_size = ((box[2] - box[0]) / dx, (box[3] - box[1]) / dy)
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    else:
+        img.load()
+    decoded = time.perf_counter()
+
+    if img.size != size:
+        img = img.resize(size, RESAMPLE_FILTERS[resample])
+
+    # RGB -> BGR contiguo en una sola copia
+    array = np.ascontiguousarray(np.asarray(img)[:, :, ::-1])
+    scale = (region_size[0] / size[0], region_size[1] / size[1])
+    # Los tiempos viajan con el resultado: en modo process el worker no ve las métricas
+    timings = {"decode": decoded - start, "resize": time.perf_counter() - decoded}
+
+    return DecodedImage(array, original_size, scale, img if keep_image else None, timings, offset)
+
+
+def decode_array(array: np.ndarray, max_side: int, resample: str = "bilinear",
+                 roi: Optional[tuple] = None) -> DecodedImage:
+    """
+    Adaptar un frame BGR ya decodificado (ej: OpenCV) al mismo resultado que decode_image
+
+    Args:
+        array: Frame BGR HWC uint8
+        max_side: Lado mayor máximo
+        resample: Filtro del ajuste (ver RESAMPLE_FILTERS)
+        roi: Región (x1, y1, x2, y2) del frame a usar
+    """
+    start = time.perf_counter()
+    height, width = array.shape[:2]
+    offset = (0.0, 0.0)
+    if roi:
+        x1, y1, x2, y2 = roi
+        array = array[y1:y2, x1:x2]
+        offset = (float(x1), float(y1))
+    region_size = array.shape[1::-1]
+    size = target_size(region_size, max_side)
+
+    if size != region_size:
+        # PIL redimensiona por canal, el orden BGR no importa
+        array = np.asarray(Image.fromarray(array).resize(size, RESAMPLE_FILTERS[resample]))
+    array = np.ascontiguousarray(array)
+    scale = (region_size[0] / size[0], region_size[1] / size[1])
+    timings = {"resize": time.perf_counter() - start}
+
+    return DecodedImage(array, (width, height), scale, None, timings, offset)
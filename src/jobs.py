@@ -0,0 +1,245 @@
+"""
+Cola persistente de trabajos asíncronos
+
+POST /jobs guarda las imágenes y los parámetros y responde enseguida con un
+id; un runner en segundo plano procesa los trabajos de a uno. El estado vive
+en SQLite y las imágenes en archivos junto a la base (JOBS_DIR), así un
+reinicio del contenedor no pierde trabajos: los que quedaron a medias vuelven
+a la cola al arrancar.
+"""
+
+import ipaddress
+import json
+import logging
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import urllib.request
+import uuid
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import urlsplit
+
+from streams import host_allowed
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    filenames TEXT NOT NULL,
+    webhook TEXT,
+    processed INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    results TEXT,
+    error TEXT,
+    webhook_status TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+
+def validate_webhook(url: str, allowed_hosts=()) -> str:
+    """
+    Verificar la URL del webhook (bloqueante: resuelve el host)
+
+    Con allowed_hosts solo se aceptan esos hosts (o host:puerto); sin lista,
+    solo hosts que resuelven a direcciones públicas: el servidor no hace POST
+    a loopback, la red privada, link-local (metadata de la nube) ni reservadas.
+
+    Raises:
+        ValueError: Si no es http(s) o el destino no está permitido
+    """
+    if not url.lower().startswith(("http://", "https://")):
+        raise ValueError("webhook debe ser una URL http(s)")
+    if allowed_hosts:
+        if not host_allowed(url, allowed_hosts):
+            raise ValueError("El host del webhook no está en JOBS_WEBHOOK_ALLOWED_HOSTS")
+        return url
+    try:
+        parts = urlsplit(url)
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or 80, proto=socket.IPPROTO_TCP)
+    except (ValueError, UnicodeError, socket.gaierror) as e:
+        raise ValueError(f"Host del webhook inválido: {e}") from None
+    for *_, sockaddr in addresses:
+        if not ipaddress.ip_address(sockaddr[0].split("%")[0]).is_global:
+            raise ValueError("El webhook apunta a una dirección privada, loopback o link-local "
+                             "(permitirla con JOBS_WEBHOOK_ALLOWED_HOSTS)")
+    return url
+
+
+class _NoRedirects(urllib.request.HTTPRedirectHandler):
+    """Una redirección del webhook es un error (podría apuntar a un host no permitido)"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def post_webhook(url: str, body: dict, timeout: float = 10, allowed_hosts=()) -> int:
+    """
+    POST JSON al webhook de un trabajo (bloqueante); devuelve el status HTTP
+
+    El destino se vuelve a validar antes de enviar: el DNS pudo cambiar desde
+    que se encoló el trabajo.
+    """
+    validate_webhook(url, allowed_hosts)
+    request = urllib.request.Request(
+        url, data=json.dumps(body, ensure_ascii=False).encode("utf-8"),
+        headers={"Content-Type": "application/json"}, method="POST"
+    )
+    with urllib.request.build_opener(_NoRedirects()).open(request, timeout=timeout) as response:
+        return response.status
+
+
+class JobStore:
+    """
+    Trabajos en SQLite e imágenes en JOBS_DIR/payloads/<id>/
+
+    Los métodos son bloqueantes (correr con run_in_threadpool); una sola
+    conexión compartida protegida por un lock.
+
+    Args:
+        directory: Directorio de la base y las imágenes (montar como volumen)
+        ttl: Segundos que se conservan los trabajos terminados (0 = siempre)
+    """
+
+    def __init__(self, directory: str, ttl: float = 86400):
+        self.directory = Path(directory)
+        self.payload_dir = self.directory / "payloads"
+        self.payload_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.directory / "jobs.db"), check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def create(self, images: list, params: dict, webhook: Optional[str] = None) -> str:
+        """Guardar un trabajo nuevo (lista de (filename, bytes)) y devolver su id"""
+        job_id = uuid.uuid4().hex
+        payload = self.payload_dir / job_id
+        payload.mkdir()
+        for index, (_, image_bytes) in enumerate(images):
+            (payload / f"{index:05d}").write_bytes(image_bytes)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, params, filenames, webhook, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, "queued", json.dumps(params), json.dumps([name for name, _ in images]),
+                 webhook, time.time())
+            )
+        return job_id
+
+    def claim(self) -> Optional[dict]:
+        """Tomar el trabajo en cola más antiguo y marcarlo running (None si no hay)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (time.time(), row["id"])
+            )
+        return self.get(row["id"])
+
+    def images(self, job: dict) -> Iterator[tuple]:
+        """(index, filename, bytes) de las imágenes del trabajo, leídas de a una"""
+        payload = self.payload_dir / job["id"]
+        for index, filename in enumerate(job["filenames"]):
+            yield index, filename, (payload / f"{index:05d}").read_bytes()
+
+    def progress(self, job_id: str, processed: int):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET processed = ? WHERE id = ?", (processed, job_id))
+
+    def finish(self, job_id: str, results: list):
+        """Guardar los resultados y borrar las imágenes"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', results = ?, processed = ?, finished_at = ? WHERE id = ?",
+                (json.dumps(results, ensure_ascii=False), len(results), time.time(), job_id)
+            )
+        shutil.rmtree(self.payload_dir / job_id, ignore_errors=True)
+
+    def fail(self, job_id: str, error: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (error, time.time(), job_id)
+            )
+        shutil.rmtree(self.payload_dir / job_id, ignore_errors=True)
+
+    def set_webhook_status(self, job_id: str, status: str):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (status, job_id))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["filenames"] = json.loads(job["filenames"])
+        job["results"] = json.loads(job["results"]) if job["results"] else None
+        return job
+
+    def recover(self, max_attempts: int = 3) -> tuple:
+        """
+        Devolver a la cola los trabajos que quedaron running (reinicio a mitad de trabajo)
+        
+        Los que ya se intentaron max_attempts veces se marcan failed: un trabajo
+        que tumba el proceso no vuelve a la cola para siempre.
+        
+        Returns:
+            (trabajos devueltos a la cola, ids de los marcados failed)
+        """
+        with self._lock:
+            failed = [row["id"] for row in self._conn.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND attempts >= ?", (max_attempts,)
+            ).fetchall()]
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                "WHERE status = 'running' AND attempts >= ?",
+                (f"Interrumpido {max_attempts} veces (reinicio del servicio)", time.time(), max_attempts)
+            )
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', processed = 0 WHERE status = 'running'"
+            ).rowcount
+        for job_id in failed:
+            shutil.rmtree(self.payload_dir / job_id, ignore_errors=True)
+        return requeued, failed
+
+    def purge(self) -> int:
+        """Borrar los trabajos terminados hace más de ttl segundos"""
+        if not self.ttl:
+            return 0
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - self.ttl,)
+            ).rowcount
+
+    def counts(self) -> dict:
+        """Trabajos por estado"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,77 +1,384 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse, StreamingResponse
-from ultralytics import YOLO
+from fastapi import FastAPI, File, Header, Query, Response, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pathlib import Path
+from typing import List, Optional
+import asyncio
+import collections
+import hmac
 import io
+import json
 import logging
 import time
 import os
-import gc
-import psutil
-from PIL import Image, ImageDraw
+import shutil
+import signal
+import tempfile
+import numpy as np
+
+from archives import ArchiveError, extract_images, is_archive
+from backends import BACKEND_FORMATS, check_parity, load_backend, result_arrays, sample_images
+from batching import MicroBatcher
+from cache import ResultCache
+from jobs import JobStore, post_webhook, validate_webhook
+from imaging import RESAMPLE_FILTERS, DecodedImage, decode_array, decode_image, probe_size
+from memory import BufferPool, MemoryManager, PooledBuffer, detect_memory_limit
+from metrics import STARTUP_SECONDS, MetricsMiddleware, observe_stage, registry
+from models import ModelRegistry
+from startup import NotReadyError, StartupTracker
+from profiling import ProfileStore, ProfilingMiddleware, current_profile, parse_modes
+from options import InferenceOptions, OptionLimits, OptionsError, build_options, clip_roi, parse_roi
+from rendering import RENDER_FORMATS, ChunkStream, draw_detections, encode_image, negotiate_format
+from tracking import TrackerRegistry
+from tiling import fit_size, merge_detections, tile_windows
+from streams import (FrameSampler, StreamError, frame_change, frame_signature, is_mjpeg, is_video,
+                     open_file, open_source)
+from workers import InferencePool, PoolSaturatedError
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="YOLO Light API", version="1.0.0")
+app.add_middleware(MetricsMiddleware)
 
-# Variable global para el modelo
-model = None
+# Modelo por defecto (siempre cargado) y registro de modelos
+backend = None
 model_name = os.getenv("MODEL_NAME", "yolov5n.pt")
+# Modelos que se pueden pedir con ?model= además de MODEL_NAME (ej: "yolov5s.pt,yolov11n.pt")
+MODELS = [name.strip() for name in os.getenv("MODELS", "").split(",") if name.strip()]
+MODEL_PRELOAD = [name.strip() for name in os.getenv("MODEL_PRELOAD", "").split(",") if name.strip()]  # Cargar al arrancar
+MODEL_MEMORY_MB = float(os.getenv("MODEL_MEMORY_MB", "0"))  # Presupuesto de los modelos cargados por proceso (0 = sin límite)
+if set(MODEL_PRELOAD) - {model_name, *MODELS}:
+    raise ValueError(f"MODEL_PRELOAD incluye modelos que no están en MODELS: {', '.join(set(MODEL_PRELOAD) - {model_name, *MODELS})}")
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")  # torch | onnx | openvino | torchscript
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")  # Cache de modelos exportados
+PARITY_SAMPLES = os.getenv("PARITY_SAMPLES", "")  # Directorio de imágenes para verificar paridad con torch
+QUANTIZE = os.getenv("QUANTIZE", "")  # "" (float) | dynamic | static (onnx) | fp16 (openvino)
+CALIBRATION_DIR = os.getenv("CALIBRATION_DIR", "")  # Imágenes de calibración para QUANTIZE=static
 CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE", "0.4"))
-MAX_IMAGE_SIZE = int(os.getenv("MAX_IMAGE_SIZE", "1920"))  # Redimensionar imágenes más grandes
+MAX_IMAGE_SIZE = int(os.getenv("MAX_IMAGE_SIZE", "1920"))  # Redimensionar imágenes más grandes (/detect-visual)
+DECODE_SIZE = int(os.getenv("DECODE_SIZE", "640"))  # Lado mayor al decodificar para /detect (imgsz del modelo)
+RESAMPLE = os.getenv("RESAMPLE", "bilinear")  # nearest | box | bilinear | hamming | bicubic | lanczos
+if INFERENCE_BACKEND not in BACKEND_FORMATS:
+    raise ValueError(f"INFERENCE_BACKEND inválido: {INFERENCE_BACKEND} (opciones: {', '.join(BACKEND_FORMATS)})")
+# Salida de /detect-visual (si el cliente no la pide por query ni Accept)
+RENDER_FORMAT = os.getenv("RENDER_FORMAT", "png")  # png | jpeg | webp
+RENDER_QUALITY = int(os.getenv("RENDER_QUALITY", "85"))  # JPEG/WebP
+# Inferencia por tiles (?tiled=true): imágenes grandes cortadas en ventanas solapadas
+TILE_SIZE = int(os.getenv("TILE_SIZE", "640"))  # Lado de cada tile (idealmente el imgsz del modelo)
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))  # Fracción de solapamiento entre tiles
+TILE_MAX = int(os.getenv("TILE_MAX", "16"))  # Máximo de imágenes por pasada (incluye la completa)
+TILE_MERGE_THRESHOLD = float(os.getenv("TILE_MERGE_THRESHOLD", "0.5"))  # IoS para fusionar cajas entre tiles
+TILE_FULL_IMAGE = os.getenv("TILE_FULL_IMAGE", "true").lower() in ("1", "true", "yes")  # Pasada extra de la imagen completa
+if not 0 <= TILE_OVERLAP < 1:
+    raise ValueError(f"TILE_OVERLAP inválido: {TILE_OVERLAP} (entre 0 y 1)")
+# Límites de los parámetros por petición (confidence, classes, max_det, imgsz, roi)
+MAX_DETECTIONS = int(os.getenv("MAX_DETECTIONS", "300"))  # Default y máximo de max_det
+MIN_CONFIDENCE = float(os.getenv("MIN_CONFIDENCE", "0.05"))  # Menos confianza = más cajas al NMS
+MIN_IMGSZ = int(os.getenv("MIN_IMGSZ", "160"))
+MAX_IMGSZ = int(os.getenv("MAX_IMGSZ", str(DECODE_SIZE)))  # Más grande = más latencia para todos
+MIN_ROI_SIZE = int(os.getenv("MIN_ROI_SIZE", "32"))  # Lado mínimo de la región de interés
+if MIN_IMGSZ > MAX_IMGSZ:
+    raise ValueError(f"MIN_IMGSZ ({MIN_IMGSZ}) no puede ser mayor que MAX_IMGSZ ({MAX_IMGSZ})")
+# Formatos de respuesta: objects (lista de dicts) | columns (arrays paralelos)
+RESPONSE_FORMATS = ("objects", "columns")
+if RENDER_FORMAT not in RENDER_FORMATS:
+    raise ValueError(f"RENDER_FORMAT inválido: {RENDER_FORMAT} (opciones: {', '.join(RENDER_FORMATS)})")
+if RESAMPLE not in RESAMPLE_FILTERS:
+    raise ValueError(f"RESAMPLE inválido: {RESAMPLE} (opciones: {', '.join(RESAMPLE_FILTERS)})")
+
+# Warm-up: inferencias de descarte al arrancar para que la primera petición real no pague
+# la inicialización del grafo y del allocator (por modelo cargado, tamaño y tamaño de batch)
+WARMUP_RUNS = int(os.getenv("WARMUP_RUNS", "2"))  # 0 = sin warm-up
+WARMUP_SIZES = [int(size) for size in os.getenv("WARMUP_SIZES", str(DECODE_SIZE)).split(",") if size.strip()]  # imgsz servidos
+
+# Pool de inferencia (fuera del event loop)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "8"))
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")  # thread | process
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))  # Threads de torch por worker (0 = cores / workers)
+INFERENCE_PIN_CORES = os.getenv("INFERENCE_PIN_CORES", "true").lower() in ("1", "true", "yes")  # Afinidad en modo process
+
+# Micro-batching: agrupar peticiones concurrentes en un solo forward pass
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "4"))
+BATCH_TIMEOUT_MS = float(os.getenv("BATCH_TIMEOUT_MS", "10"))
+
+# Límites de /detect-batch
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "64"))
+BATCH_MAX_ARCHIVE_MB = int(os.getenv("BATCH_MAX_ARCHIVE_MB", "256"))  # Descomprimido
+
+# Video / MJPEG (/detect-stream)
+STREAM_FPS = float(os.getenv("STREAM_FPS", "5"))  # Frames por segundo a procesar (0 = todos)
+STREAM_CHANGE_THRESHOLD = float(os.getenv("STREAM_CHANGE_THRESHOLD", "0.02"))  # Cambio mínimo (0-1) para re-detectar
+STREAM_MJPEG_FPS = float(os.getenv("STREAM_MJPEG_FPS", "25"))  # FPS de archivos MJPEG (no traen timestamps)
+STREAM_MAX_FRAMES = int(os.getenv("STREAM_MAX_FRAMES", "0"))  # Máximo de frames procesados por stream (0 = sin límite)
+STREAM_ALLOWED_DIR = os.getenv("STREAM_ALLOWED_DIR", "")  # Directorio de videos accesibles por ruta ("" = ninguno)
+# Hosts de cámaras accesibles por URL, ej: "192.168.1.50,camara.local:8080" ("" = ninguno)
+STREAM_ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv("STREAM_ALLOWED_HOSTS", "").split(",") if host.strip()}
+
+# WebSocket /ws/detect
+WS_MAX_IN_FLIGHT = int(os.getenv("WS_MAX_IN_FLIGHT", "4"))  # Frames en proceso por conexión
+
+# Seguimiento por cámara (/detect?stream_id=...): track_id persistentes y respuestas delta
+TRACK_MAX_STREAMS = int(os.getenv("TRACK_MAX_STREAMS", "64"))  # Cámaras seguidas a la vez (LRU)
+TRACK_TTL_S = float(os.getenv("TRACK_TTL_S", "300"))  # Olvidar una cámara sin frames por este tiempo
+TRACK_DETECT_EVERY = int(os.getenv("TRACK_DETECT_EVERY", "1"))  # Default de detect_every (1 = detectar siempre)
+TRACK_MAX_DETECT_EVERY = int(os.getenv("TRACK_MAX_DETECT_EVERY", "30"))
+TRACK_IOU = float(os.getenv("TRACK_IOU", "0.3"))  # IoU mínimo para asociar una detección a un track
+TRACK_MAX_AGE = int(os.getenv("TRACK_MAX_AGE", "3"))  # Detecciones sin asociar antes de quitar un track
+
+# Cache de resultados por contenido (0 desactiva)
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", "32"))
+CACHE_TTL_S = float(os.getenv("CACHE_TTL_S", "0"))  # 0 = sin vencimiento
+CACHE_DIR = os.getenv("CACHE_DIR", "")  # Vacío = solo memoria
+CACHE_DISK_MAX_MB = float(os.getenv("CACHE_DISK_MAX_MB", "256"))
+
+# Trabajos asíncronos (POST /jobs): cola persistente en SQLite
+JOBS_DIR = os.getenv("JOBS_DIR", "")  # Vacío = sin /jobs; montar como volumen para sobrevivir reinicios
+JOBS_TTL_S = float(os.getenv("JOBS_TTL_S", "86400"))  # Tiempo que se conservan los terminados (0 = siempre)
+JOBS_WEBHOOK_TIMEOUT_S = float(os.getenv("JOBS_WEBHOOK_TIMEOUT_S", "10"))
+JOBS_WEBHOOK_RETRIES = int(os.getenv("JOBS_WEBHOOK_RETRIES", "3"))
+# Hosts a los que se permite el webhook (ej: "192.168.1.10,n8n.local:5678"); vacío = solo direcciones públicas
+JOBS_WEBHOOK_ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv("JOBS_WEBHOOK_ALLOWED_HOSTS", "").split(",")
+                              if host.strip()}
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))  # Intentos de un trabajo interrumpido por reinicios
+
+# Perfilado por petición (ver /admin/profiles); sin header ni muestreo no hay costo
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "false").lower() in ("1", "true", "yes")  # Aceptar X-Profile
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # Fracción de peticiones perfiladas (0-1)
+PROFILE_SAMPLE_MODES = parse_modes(os.getenv("PROFILE_SAMPLE_MODES", "spans"))  # spans, sample, torch
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))  # Período del profiler de stacks
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))  # Perfiles guardados en memoria
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")  # X-Profile y /admin/profiles lo exigen
+if (PROFILE_HEADER or PROFILE_SAMPLE_RATE > 0) and not PROFILE_TOKEN:
+    # Los perfiles exponen stacks y tiempos internos, y X-Profile dispara profilers
+    raise ValueError("PROFILE_HEADER o PROFILE_SAMPLE_RATE requieren definir PROFILE_TOKEN")
+
+# Presupuesto de memoria: recolectar solo sobre GC_WATERMARK, rechazar sobre SHED_WATERMARK
+MEMORY_LIMIT_MB = float(os.getenv("MEMORY_LIMIT_MB", "0"))  # 0 = leer límite del cgroup
+GC_WATERMARK = float(os.getenv("GC_WATERMARK", "0.7"))
+SHED_WATERMARK = float(os.getenv("SHED_WATERMARK", "0.9"))
+BUFFER_POOL_MB = float(os.getenv("BUFFER_POOL_MB", "32"))
+
+inference_pool = InferencePool(INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE, INFERENCE_EXECUTOR,
+                               INFERENCE_THREADS, INFERENCE_PIN_CORES)
+memory_manager = MemoryManager(
+    int(MEMORY_LIMIT_MB * 1024 * 1024) or detect_memory_limit(),
+    GC_WATERMARK, SHED_WATERMARK
+)
+buffer_pool = BufferPool(int(BUFFER_POOL_MB * 1024 * 1024))
+DEFAULT_OPTIONS = InferenceOptions(CONFIDENCE_THRESHOLD, DECODE_SIZE, MAX_DETECTIONS, model=model_name)
+
+def load_model(name: str):
+    """Cargar un modelo con el backend configurado (los exportados se exportan solo la primera vez)"""
+    return load_backend(name, INFERENCE_BACKEND, DECODE_SIZE, EXPORT_DIR, QUANTIZE, CALIBRATION_DIR)
+
+models = ModelRegistry(load_model, [model_name, *MODELS], int(MODEL_MEMORY_MB * 1024 * 1024),
+                       pinned=[model_name])
+option_limits = OptionLimits(MIN_CONFIDENCE, MAX_DETECTIONS, MIN_IMGSZ, MAX_IMGSZ, MIN_ROI_SIZE)
+result_cache = ResultCache(
+    int(CACHE_MAX_MB * 1024 * 1024), CACHE_TTL_S, CACHE_DIR,
+    int(CACHE_DISK_MAX_MB * 1024 * 1024)
+)
+startup_state = StartupTracker()
+startup_task = None
+job_store = JobStore(JOBS_DIR, JOBS_TTL_S) if JOBS_DIR else None
+trackers = TrackerRegistry(TRACK_MAX_STREAMS, TRACK_TTL_S, iou_threshold=TRACK_IOU, max_age=TRACK_MAX_AGE)
+jobs_task = None
+jobs_wakeup = asyncio.Event()
+profile_store = ProfileStore(PROFILE_KEEP)
+if PROFILE_HEADER or PROFILE_SAMPLE_RATE > 0:
+    app.add_middleware(
+        ProfilingMiddleware, store=profile_store, header=PROFILE_HEADER,
+        sample_rate=PROFILE_SAMPLE_RATE, sample_modes=PROFILE_SAMPLE_MODES,
+        interval=PROFILE_INTERVAL_MS / 1000, token=PROFILE_TOKEN
+    )
+
+@registry.collector
+def service_metrics() -> list:
+    """Estado del pool, batching, cache y memoria al momento del scrape"""
+    pool = inference_pool.stats()
+    batching = batcher.stats()
+    cache = result_cache.stats()
+    metrics = [
+        ("yolo_pool_queue_depth", "gauge", "Trabajos esperando un worker", pool["queue_depth"]),
+        ("yolo_pool_in_flight", "gauge", "Trabajos en cola o en ejecución", pool["in_flight"]),
+        ("yolo_pool_utilization", "gauge", "Fracción de workers ocupados", pool["utilization"]),
+        ("yolo_pool_rejected_total", "counter", "Trabajos rechazados por cola llena", pool["rejected"]),
+        ("yolo_pool_restarts_total", "counter", "Pools de procesos recreados tras morir un worker", pool["restarts"]),
+        ("yolo_batches_total", "counter", "Forward passes ejecutados", batching["batches"]),
+        ("yolo_batch_images_total", "counter", "Imágenes procesadas en batches", batching["images"]),
+        ("yolo_cache_hits_total", "counter", "Aciertos del cache de resultados", cache["hits"]),
+        ("yolo_cache_misses_total", "counter", "Fallos del cache de resultados", cache["misses"]),
+        ("yolo_cache_evictions_total", "counter", "Entradas desalojadas del cache", cache["evictions"]),
+        ("process_resident_memory_bytes", "gauge", "RSS del proceso más la memoria privada de sus workers", memory_manager.rss()),
+        ("yolo_memory_limit_bytes", "gauge", "Límite de memoria del servicio", memory_manager.limit),
+        ("yolo_memory_collections_total", "counter", "Recolecciones de basura forzadas", memory_manager.collections),
+        ("yolo_memory_shed_total", "counter", "Peticiones rechazadas por memoria", memory_manager.shed),
+        ("yolo_models_loaded", "gauge", "Modelos cargados en el proceso principal (en modo process, los heredados por los workers)", len(models.loaded())),
+        ("yolo_models_memory_bytes", "gauge", "Memoria estimada de los modelos cargados", models.memory_bytes),
+        ("yolo_model_loads_total", "counter", "Cargas de modelos", models.loads),
+        ("yolo_model_evictions_total", "counter", "Modelos desalojados por presupuesto de memoria", models.evictions),
+        ("yolo_ready", "gauge", "1 si el arranque terminó y se acepta inferencia", int(startup_state.ready)),
+        ("yolo_tracked_streams", "gauge", "Cámaras con seguimiento activo", trackers.stats()["streams"]),
+        ("yolo_profiles_captured_total", "counter", "Peticiones perfiladas", profile_store.captured),
+    ]
+    if job_store is not None:
+        jobs = job_store.counts()
+        metrics += [
+            ("yolo_jobs_queued", "gauge", "Trabajos asíncronos en cola", jobs["queued"]),
+            ("yolo_jobs_running", "gauge", "Trabajos asíncronos en ejecución", jobs["running"]),
+        ]
+    return metrics
 
 @app.on_event("startup")
 async def startup():
-    """Cargar modelo YOLO en startup"""
-    global model, model_name
+    """Lanzar el arranque en segundo plano: la API acepta conexiones (liveness) mientras carga"""
+    global startup_task
+    logger.info("🚀 Iniciando YOLO Light API...")
+    startup_state.begin()
+    startup_task = asyncio.ensure_future(load_service())
+
+async def load_service():
+    """Cargar modelos, verificar paridad, calentar e iniciar el pool (cada etapa medida)"""
+    global backend, option_limits
     try:
-        logger.info("🚀 Iniciando YOLO Light API...")
-        logger.info(f"📦 Cargando modelo: {model_name}...")
+        with startup_state.stage("load"):
+            logger.info(f"📦 Cargando modelo: {model_name} (backend {INFERENCE_BACKEND})...")
+            backend = await run_in_threadpool(models.get, model_name)
+        
+        # Precargar el resto de MODEL_PRELOAD; los demás se cargan en su primer uso.
+        # En modo process se precargan todos antes del fork: los workers comparten
+        # sus páginas en vez de cargar cada uno su copia
+        preload = models.allowed if inference_pool.kind == "process" else MODEL_PRELOAD
+        if preload:
+            with startup_state.stage("preload"):
+                await run_in_threadpool(models.preload, preload)
+            missing = set(preload) - set(models.loaded())
+            if missing:
+                logger.warning(f"⚠️  MODEL_MEMORY_MB no alcanza para precargar {', '.join(sorted(missing))}: "
+                               f"se cargarán en su primer uso")
         
-        # Cargar modelo YOLO (se descarga automáticamente si no existe)
-        model = YOLO(model_name)
+        if PARITY_SAMPLES and (backend.name != "torch" or backend.quantize):
+            with startup_state.stage("parity"):
+                await run_in_threadpool(verify_parity)
         
-        # Configurar modelo para inferencia óptima
-        model.fuse()  # Fusionar capas para mejor velocidad
+        if not backend.supports_batching:
+            batcher.max_size = 1
+        # Con forma fija (torchscript) imgsz no se puede cambiar por petición
+        option_limits = option_limits._replace(dynamic_imgsz=backend.dynamic_shape)
         
+        if WARMUP_RUNS > 0:
+            with startup_state.stage("warmup"):
+                await run_in_threadpool(warm_up)
+        
+        # Iniciar pool después de cargar y calentar los modelos (los procesos los heredan)
+        with startup_state.stage("pool"):
+            inference_pool.start()
+        if inference_pool.kind == "process":
+            memory_manager.workers.start()
+        
+        startup_state.finish()
+        if job_store is not None:
+            start_jobs()
+        for phase, seconds in startup_state.phases.items():
+            STARTUP_SECONDS.set(round(seconds, 3), phase)
         logger.info(f"✅ Modelo {model_name} cargado correctamente")
         logger.info("📊 API lista para detección de objetos")
         
     except Exception as e:
-        logger.error(f"❌ Error al cargar modelo: {e}")
-        raise
+        logger.error(f"❌ Error al cargar modelo: {e}", exc_info=True)
+        startup_state.fail(e)
+        # Sin modelo el servicio no sirve: terminar para que el orquestador lo reinicie
+        os.kill(os.getpid(), signal.SIGTERM)
+
+def warm_up():
+    """Inferencias de descarte por modelo cargado, imgsz servido y tamaño de batch (bloqueante)"""
+    for name in models.loaded():
+        start = time.perf_counter()
+        for size in WARMUP_SIZES:
+            if size != DECODE_SIZE and not backend.dynamic_shape:
+                continue  # Forma fija: solo se sirve el imgsz del export
+            # Gris 4:3, la forma típica de una foto tras el letterbox
+            array = np.full((size * 3 // 4, size, 3), 114, dtype=np.uint8)
+            options = DEFAULT_OPTIONS._replace(model=name, imgsz=size)
+            for batch_size in sorted({1, batcher.max_size}):
+                for _ in range(WARMUP_RUNS):
+                    infer_batch([(array, (1.0, 1.0), (0.0, 0.0))] * batch_size, options)
+        logger.info(f"🔥 Warm-up {name} listo en {(time.perf_counter() - start):.1f}s "
+                    f"(imgsz {', '.join(map(str, WARMUP_SIZES))})")
+
+def verify_parity():
+    """Comparar el backend activo contra PyTorch sobre PARITY_SAMPLES (solo log)"""
+    reference = load_backend(model_name, "torch", export_dir=EXPORT_DIR)
+    report = check_parity(reference, backend, sample_images([PARITY_SAMPLES]),
+                          CONFIDENCE_THRESHOLD, DECODE_SIZE)
+    del reference
+    
+    level = logging.INFO if report["f1"] >= 0.9 else logging.WARNING
+    label = f"{backend.name}/{backend.quantize}" if backend.quantize else backend.name
+    logger.log(level, f"🔍 Paridad {label} vs torch: F1={report['f1']} en {report['images']} imágenes")
+    for row in report["per_image"]:
+        logger.log(level, f"   {row['image']}: {row['matched']}/{row['reference']} coincidencias, "
+                          f"{row['reference_ms']}ms → {row['candidate_ms']}ms")
 
-def optimize_image(img: Image.Image) -> Image.Image:
-    """Optimizar imagen para inferencia"""
-    # Redimensionar si es más grande que MAX_IMAGE_SIZE
-    if max(img.size) > MAX_IMAGE_SIZE:
-        img.thumbnail((MAX_IMAGE_SIZE, MAX_IMAGE_SIZE), Image.Resampling.LANCZOS)
-    return img
+@app.on_event("shutdown")
+async def shutdown():
+    """Detener el arranque si sigue en curso, el runner de trabajos y el pool de inferencia"""
+    for task in (startup_task, jobs_task):
+        if task is not None and not task.done():
+            task.cancel()
+    memory_manager.workers.stop()
+    inference_pool.shutdown()
 
 def cleanup_memory():
-    """Liberar memoria explícitamente"""
-    gc.collect()
-    # En GPU, también limpiar caché
-    try:
-        import torch
-        torch.cuda.empty_cache()
-    except:
-        pass
+    """Liberar memoria solo si el RSS cruzó la marca de agua"""
+    memory_manager.maybe_collect()
+
+async def read_upload(file: UploadFile) -> PooledBuffer:
+    """Leer un upload en un buffer reutilizable (liberar con release())"""
+    start = time.perf_counter()
+    if file.size is None or inference_pool.kind == "process":
+        # memoryview no es picklable: los workers process reciben bytes
+        upload = PooledBuffer.from_bytes(await file.read())
+    else:
+        upload = buffer_pool.acquire(file.size)
+        await file.seek(0)
+        n = await run_in_threadpool(file.file.readinto, upload.view)
+        upload.view = upload.view[:n]
+    record_timings({"upload_read": time.perf_counter() - start})
+    return upload
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint - muestra estado del modelo"""
+    """Liveness: responde mientras el proceso está vivo, también durante el arranque (ver /ready)"""
     try:
-        model_status = "loaded" if model is not None else "not_loaded"
-        model_ready = model is not None and hasattr(model, 'names')
+        model_status = "loaded" if backend is not None else "not_loaded"
+        model_ready = backend is not None and hasattr(backend, 'names')
         
         return {
-            "status": "healthy" if model_ready else "unhealthy",
+            "status": "healthy" if model_ready else ("unhealthy" if startup_state.error else "starting"),
             "model": model_name,
+            "backend": backend.name if backend is not None else INFERENCE_BACKEND,
+            "quantize": QUANTIZE or None,
             "model_status": model_status,
             "model_ready": model_ready,
+            "ready": startup_state.ready,
             "version": "1.0.0",
-            "classes": len(model.names) if model_ready else 0
+            "classes": len(backend.names) if model_ready else 0,
+            "startup": startup_state.stats(),
+            "models": models.stats(),
+            "inference_pool": inference_pool.stats(),
+            "batching": batcher.stats(),
+            "cache": result_cache.stats(),
+            "memory": {**memory_manager.stats(), "buffers": buffer_pool.stats()},
+            "jobs": job_store.counts() if job_store else None,
+            "tracking": trackers.stats(),
+            "profiling": {
+                "header": PROFILE_HEADER,
+                "sample_rate": PROFILE_SAMPLE_RATE,
+                **profile_store.stats()
+            }
         }
     except Exception as e:
         logger.error(f"Error en health check: {e}")
@@ -83,6 +390,101 @@ async def health_check():
             "error": str(e)
         }
 
+@app.get("/ready")
+async def readiness():
+    """Readiness: 200 cuando los modelos están cargados y calentados, 503 mientras arranca"""
+    status = startup_state.stats()
+    if not startup_state.ready:
+        return JSONResponse(status_code=503, content=status, headers={"Retry-After": "5"})
+    return status
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+def profile_lookup(profile_id: Optional[str], token: str):
+    """
+    Verificar X-Profile-Token y buscar un perfil
+    
+    Sin PROFILE_TOKEN el perfilado está apagado y /admin/profiles no existe (404).
+    
+    Returns:
+        (perfil o None, JSONResponse de error o None)
+    """
+    if not PROFILE_TOKEN:
+        return None, JSONResponse(
+            status_code=404,
+            content={
+                "success": False,
+                "error": "Perfilado deshabilitado (definir PROFILE_TOKEN)"
+            }
+        )
+    if not hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+        return None, JSONResponse(
+            status_code=403,
+            content={
+                "success": False,
+                "error": "Se requiere un X-Profile-Token válido"
+            }
+        )
+    if profile_id is None:
+        return None, None
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        return None, JSONResponse(
+            status_code=404,
+            content={
+                "success": False,
+                "error": "Perfil no encontrado (se guardan los últimos PROFILE_KEEP)"
+            }
+        )
+    return profile, None
+
+@app.get("/admin/profiles")
+async def list_profiles(x_profile_token: str = Header("")):
+    """Perfiles guardados, del más reciente al más viejo (desglose por etapa en ms)"""
+    _, error = profile_lookup(None, x_profile_token)
+    if error is not None:
+        return error
+    return {"profiles": profile_store.list(), **profile_store.stats()}
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, x_profile_token: str = Header("")):
+    """Un perfil con cada span (carril, inicio y duración) y los operadores de torch"""
+    profile, error = profile_lookup(profile_id, x_profile_token)
+    return error or profile.detail()
+
+@app.get("/admin/profiles/{profile_id}/trace")
+async def download_trace(profile_id: str, x_profile_token: str = Header("")):
+    """Chrome trace del perfil (abrir en chrome://tracing o ui.perfetto.dev)"""
+    profile, error = profile_lookup(profile_id, x_profile_token)
+    if error is not None:
+        return error
+    return JSONResponse(
+        profile.chrome_trace(),
+        headers={"Content-Disposition": f"attachment; filename=profile_{profile_id}.trace.json"}
+    )
+
+@app.get("/admin/profiles/{profile_id}/flamegraph")
+async def download_flamegraph(profile_id: str, x_profile_token: str = Header("")):
+    """Stacks muestreados en formato plegado (flamegraph.pl, inferno o speedscope)"""
+    profile, error = profile_lookup(profile_id, x_profile_token)
+    if error is not None:
+        return error
+    if not profile.stacks:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "success": False,
+                "error": "El perfil no tiene muestras de stack (pedir X-Profile: sample)"
+            }
+        )
+    return PlainTextResponse(
+        profile.folded(),
+        headers={"Content-Disposition": f"attachment; filename=profile_{profile_id}.folded"}
+    )
+
 @app.get("/")
 async def root():
     """API info endpoint"""
@@ -91,22 +493,534 @@ async def root():
         "version": "1.0.0",
         "description": "Lightweight YOLO object detection API for RPi4",
         "model": model_name,
-        "model_classes": len(model.names) if model is not None else 80,
+        "backend": INFERENCE_BACKEND,
+        "quantize": QUANTIZE or None,
+        "model_classes": len(backend.names) if backend is not None else 80,
+        "models": {"default": model_name, "available": models.allowed, "loaded": models.loaded()},
         "endpoints": {
             "POST /detect": "Detectar objetos en imagen → JSON",
             "POST /detect-visual": "Detectar objetos en imagen → Imagen con bounding boxes",
-            "GET /health": "Verificar estado de API",
+            "POST /detect-batch": "Detectar objetos en varias imágenes o zip/tar → NDJSON",
+            "GET /detect-stream": "Detectar objetos en un stream MJPEG/RTSP → SSE",
+            "POST /detect-stream": "Detectar objetos en un video o MJPEG subido → SSE",
+            "WS /ws/detect": "Detectar objetos en frames binarios por WebSocket → JSON",
+            "POST /jobs": "Encolar imágenes o zip/tar para detección asíncrona → id del trabajo",
+            "GET /jobs/{id}": "Estado y resultados de un trabajo",
+            "GET /health": "Verificar estado de API (liveness)",
+            "GET /ready": "Verificar que el modelo esté cargado y calentado (readiness)",
+            "GET /metrics": "Métricas en formato Prometheus",
+            "GET /admin/profiles": "Perfiles de peticiones (desglose por etapa, Chrome trace, flame graph)",
             "GET /": "Información de API"
         }
     }
 
+def extract_objects(detections, scale: tuple = (1.0, 1.0), offset: tuple = (0.0, 0.0)) -> dict:
+    """
+    Convertir resultados YOLO en columnas ordenadas por confianza (vectorizado)
+    
+    Args:
+        detections: Resultado YOLO de una imagen
+        scale: Factor (x, y) para llevar las coordenadas a la imagen original
+        offset: Esquina (x, y) de la región decodificada en la original (ROI)
+    
+    Returns:
+        Dict de arrays paralelos {class, confidence, bbox}; bbox es [x1, y1, x2, y2]
+    """
+    boxes = detections.boxes
+    if boxes is None or len(boxes) == 0:
+        return detection_columns(np.zeros((0, 6)), detections.names, scale, offset)
+    
+    # Una sola transferencia: [x1, y1, x2, y2, (id), conf, cls] por caja
+    return detection_columns(boxes.data.cpu().numpy(), detections.names, scale, offset)
+
+def detection_columns(data: np.ndarray, names: dict, scale: tuple = (1.0, 1.0),
+                      offset: tuple = (0.0, 0.0)) -> dict:
+    """
+    Columnas {class, confidence, bbox} a partir de un array [x1, y1, x2, y2, (id), conf, cls]
+    
+    Args:
+        data: Una fila por caja, en coordenadas de la imagen decodificada
+        names: Nombres de clase del modelo
+        scale: Factor (x, y) para llevar las coordenadas a la imagen original
+        offset: Esquina (x, y) de la región decodificada en la original (ROI)
+    """
+    if len(data) == 0:
+        return {"class": [], "confidence": [], "bbox": []}
+    data = data.astype(np.float64)
+    
+    # Ordenar por confianza (descendente, estable como list.sort)
+    data = data[np.argsort(-data[:, -2], kind="stable")]
+    
+    # Coordenadas en la imagen original
+    sx, sy = scale
+    ox, oy = offset
+    xyxy = np.rint(data[:, :4] * (sx, sy, sx, sy) + (ox, oy, ox, oy)).astype(int)
+    
+    return {
+        "class": [names.get(idx, f"unknown_{idx}") for idx in data[:, -1].astype(int).tolist()],
+        "confidence": np.round(data[:, -2], 3).tolist(),
+        "bbox": xyxy.tolist()
+    }
+
+def objects_to_records(columns: dict) -> list:
+    """Columnas → lista de objetos {class, confidence, bbox{x1..y2}[, track_id]} (formato objects)"""
+    records = [
+        {
+            "class": class_name,
+            "confidence": conf,
+            "bbox": {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
+        }
+        for class_name, conf, (x1, y1, x2, y2) in zip(columns["class"], columns["confidence"], columns["bbox"])
+    ]
+    for record, track_id in zip(records, columns.get("track_id", ())):
+        record["track_id"] = track_id
+    return records
+
+def decode_for_detection(image_bytes, max_side: int = DECODE_SIZE, roi: Optional[tuple] = None) -> DecodedImage:
+    """Decodificar cerca del tamaño de entrada del modelo, o solo la ROI (bloqueante, corre en el pool)"""
+    decoded = decode_image(image_bytes, max_side, RESAMPLE, roi=roi)
+    logger.info(f"Imagen cargada: {decoded.original_size} → {decoded.array.shape[1::-1]}")
+    return decoded
+
+def decode_for_render(image_bytes) -> DecodedImage:
+    """Decodificar a MAX_IMAGE_SIZE conservando la imagen para dibujar (bloqueante)"""
+    decoded = decode_image(image_bytes, MAX_IMAGE_SIZE, RESAMPLE, keep_image=True)
+    logger.info(f"Imagen cargada: {decoded.original_size} → {decoded.image.size}")
+    return decoded
+
+def decode_for_tiling(image_bytes) -> DecodedImage:
+    """Decodificar al mayor tamaño cuya grilla de tiles entra en TILE_MAX (bloqueante)"""
+    grid_budget = TILE_MAX - 1 if TILE_FULL_IMAGE else TILE_MAX
+    size = fit_size(probe_size(image_bytes), TILE_SIZE, TILE_OVERLAP, grid_budget)
+    decoded = decode_image(image_bytes, max(size), RESAMPLE)
+    logger.info(f"Imagen cargada para tiles: {decoded.original_size} → {decoded.array.shape[1::-1]}")
+    return decoded
+
+def infer_tiled(array: np.ndarray, scale: tuple, options: InferenceOptions) -> dict:
+    """
+    Inferencia por tiles de una imagen (bloqueante, corre en el pool)
+    
+    Todos los tiles (más la imagen completa si TILE_FULL_IMAGE) van en un
+    solo batch; las cajas se llevan a coordenadas de la imagen y se fusionan.
+    
+    Returns:
+        Dict {objects, inference_time_ms, timings, tiles}
+    """
+    windows = tile_windows(array.shape[1::-1], TILE_SIZE, TILE_OVERLAP)
+    crops = [np.ascontiguousarray(array[y1:y2, x1:x2]) for x1, y1, x2, y2 in windows]
+    if TILE_FULL_IMAGE and len(windows) > 1:
+        # Los objetos grandes quedan partidos en todos los tiles
+        windows.append((0, 0, array.shape[1], array.shape[0]))
+        crops.append(array)
+    
+    model = models.get(options.model)
+    inference_start = time.perf_counter()
+    kwargs = options.predict_kwargs()
+    if model.supports_batching:
+        results = model.predict(crops, **kwargs)
+    else:
+        results = [model.predict(crop, **kwargs)[0] for crop in crops]
+    inference_end = time.perf_counter()
+    
+    # Coordenadas de cada tile → imagen decodificada completa
+    parts = []
+    for result, (x1, y1, _, _) in zip(results, windows):
+        xyxy, confidence, cls = result_arrays(result)
+        parts.append(np.column_stack([xyxy + (x1, y1, x1, y1), confidence, cls]))
+    # max_det se aplica por tile en el modelo y otra vez al total fusionado
+    merged = merge_detections(parts, TILE_MERGE_THRESHOLD)[:options.max_det]
+    objects = detection_columns(merged, model.names, scale)
+    timings = {
+        "inference": inference_end - inference_start,
+        "postprocess": time.perf_counter() - inference_end
+    }
+    
+    del results, crops
+    cleanup_memory()
+    
+    return {"objects": objects, "inference_time_ms": timings["inference"] * 1000,
+            "timings": timings, "tiles": len(windows)}
+
+def infer_batch(items: list, options: InferenceOptions) -> list:
+    """
+    Ejecutar YOLO sobre un batch de imágenes (bloqueante, corre en el pool)
+    
+    Args:
+        items: Lista de (array BGR, escala y offset a la imagen original)
+        options: Modelo, confianza, imgsz, max_det y clases (se aplican en el modelo y su NMS)
+    
+    Returns:
+        Lista con un dict {objects, inference_time_ms, timings} por imagen
+    """
+    # Inferencia con YOLO (el modelo se carga aquí si todavía no estaba)
+    model = models.get(options.model)
+    inference_start = time.perf_counter()
+    results = model.predict([array for array, _, _ in items], **options.predict_kwargs())
+    inference_end = time.perf_counter()
+    
+    objects = [extract_objects(result, scale, offset) for result, (_, scale, offset) in zip(results, items)]
+    timings = {
+        "inference": inference_end - inference_start,
+        "postprocess": time.perf_counter() - inference_end
+    }
+    detections = [
+        {"objects": image_objects, "inference_time_ms": timings["inference"] * 1000, "timings": timings}
+        for image_objects in objects
+    ]
+    
+    # Limpiar memoria
+    del results
+    cleanup_memory()
+    
+    return detections
+
+batcher = MicroBatcher(infer_batch, inference_pool, BATCH_MAX_SIZE, BATCH_TIMEOUT_MS)
+
+def record_timings(timings: dict):
+    """Registrar en el proceso principal los tiempos medidos en el pool (y en el perfil, si hay)"""
+    for stage, seconds in timings.items():
+        observe_stage(stage, seconds)
+    profile = current_profile()
+    if profile is not None:
+        profile.stages(timings)
+
+async def inference_options(model=None, confidence=None, classes=None, max_det=None, imgsz=None,
+                            roi=None, tiled: bool = False) -> tuple:
+    """
+    Opciones de inferencia de una petición, validadas contra los límites del servidor
+    
+    Las clases se validan contra los nombres del modelo pedido; si nunca se
+    cargó en este proceso se carga acá (fuera del event loop).
+    
+    Returns:
+        (InferenceOptions, roi o None)
+    
+    Raises:
+        OptionsError: Si algún parámetro es inválido o excede los límites
+        NotReadyError: Si el servicio todavía está arrancando
+    """
+    startup_state.check()
+    model = model or model_name
+    if model not in models.allowed:
+        raise OptionsError(f"Modelo no disponible: {model} (opciones: {', '.join(models.allowed)})")
+    names = await run_in_threadpool(models.class_names, model)
+    options = build_options(DEFAULT_OPTIONS._replace(model=model), option_limits, names,
+                            confidence, classes, max_det, imgsz)
+    roi = parse_roi(roi, option_limits)
+    if tiled and (roi or options.imgsz != DEFAULT_OPTIONS.imgsz):
+        raise OptionsError("roi e imgsz no se combinan con tiled (los tiles usan TILE_SIZE)")
+    return options, roi
+
+async def detect_image(decoded: DecodedImage, options: InferenceOptions = DEFAULT_OPTIONS) -> dict:
+    """Inferencia batcheada de una imagen ya decodificada (se agrupa con las de iguales opciones)"""
+    item = (decoded.array, decoded.scale, decoded.offset)
+    profile = current_profile()
+    if profile is not None and profile.deep:
+        # Fuera del batcher: los profilers miden solo esta imagen, no las de otras peticiones
+        detection = (await inference_pool.run(infer_batch, [item], options))[0]
+    else:
+        detection = await batcher.submit(item, options)
+    record_timings(detection.pop("timings"))
+    return {**detection, "image_size": list(decoded.original_size), "model": options.model}
+
+async def cached_detection(image_bytes, render: bool = False,
+                           options: InferenceOptions = DEFAULT_OPTIONS, tiled: bool = False,
+                           roi: Optional[tuple] = None) -> tuple:
+    """
+    Detección con cache por contenido de imagen
+    
+    Args:
+        image_bytes: Contenido del archivo
+        render: Decodificar a MAX_IMAGE_SIZE conservando la imagen para dibujar
+        options: Opciones de inferencia de la petición (ver inference_options)
+        tiled: Inferencia por tiles a la mayor resolución que permita TILE_MAX
+        roi: Región (x1, y1, x2, y2) de la original; solo se decodifica e infiere ese recorte
+    
+    Returns:
+        (detection, decoded, cache_hit): decoded es None si el resultado salió
+        del cache o si se usaron tiles o ROI (la decodificación no sirve para dibujar)
+    
+    Raises:
+        OptionsError: Si la ROI queda fuera de la imagen
+    """
+    if roi:
+        roi = clip_roi(roi, await run_in_threadpool(probe_size, image_bytes), option_limits)
+        render = False  # El recorte no sirve para dibujar la imagen completa
+    if tiled:
+        decode_size = ("tiles", TILE_SIZE, TILE_OVERLAP, TILE_MAX, TILE_MERGE_THRESHOLD, TILE_FULL_IMAGE)
+    else:
+        decode_size = MAX_IMAGE_SIZE if render else options.imgsz
+    
+    key = None
+    if result_cache.enabled:
+        key, cached = await run_in_threadpool(
+            result_cache.lookup, image_bytes, INFERENCE_BACKEND, QUANTIZE,
+            options, decode_size, RESAMPLE, roi
+        )
+        if cached is not None:
+            return {**cached, "inference_time_ms": 0.0, "model": options.model}, None, True
+    
+    if tiled:
+        decoded = await inference_pool.run(decode_for_tiling, image_bytes)
+        record_timings(decoded.timings)
+        detection = await inference_pool.run(infer_tiled, decoded.array, decoded.scale, options)
+        record_timings(detection.pop("timings"))
+        detection["image_size"] = list(decoded.original_size)
+        detection["model"] = options.model
+        decoded = None
+    else:
+        if render:
+            decoded = await inference_pool.run(decode_for_render, image_bytes)
+        else:
+            decoded = await inference_pool.run(decode_for_detection, image_bytes, options.imgsz, roi)
+        record_timings(decoded.timings)
+        detection = await detect_image(decoded, options)
+        if roi:
+            detection["roi"] = list(roi)
+            decoded = None
+    
+    if key is not None:
+        await run_in_threadpool(result_cache.put, key, {
+            field: detection[field] for field in ("objects", "image_size", "tiles", "roi") if field in detection
+        })
+    return detection, decoded, False
+
+def render_detections(decoded: DecodedImage, objects: dict, fmt: str, quality: int,
+                      output: Optional[ChunkStream] = None) -> tuple:
+    """
+    Dibujar bounding boxes y codificar la imagen (bloqueante, corre en el pool)
+    
+    Args:
+        decoded: Imagen decodificada con keep_image (se dibuja encima, sin copiar)
+        objects: Columnas {class, confidence, bbox}
+        fmt: png | jpeg | webp
+        quality: Calidad JPEG/WebP
+        output: Canal para emitir los chunks a medida que se codifican; sin
+            canal (workers process) se devuelven los bytes completos
+    
+    Returns:
+        (bytes o None si se usó output, segundos por etapa {render, encode})
+    """
+    try:
+        render_start = time.perf_counter()
+        draw_detections(decoded.image, objects, decoded.scale)
+        
+        encode_start = time.perf_counter()
+        buffer = output if output is not None else io.BytesIO()
+        encode_image(decoded.image, buffer, fmt, quality)
+        timings = {
+            "render": encode_start - render_start,
+            "encode": time.perf_counter() - encode_start
+        }
+    except Exception as e:
+        if output is not None:
+            output.fail(e)
+        raise
+    
+    if output is not None:
+        output.close()
+        response_bytes = None
+    else:
+        response_bytes = buffer.getvalue()
+    
+    # Limpiar memoria
+    del buffer
+    cleanup_memory()
+    
+    return response_bytes, timings
+
+async def stream_render(decoded: DecodedImage, objects: dict, fmt: str, quality: int):
+    """
+    Dibujar y codificar en el pool devolviendo el body como iterable de chunks
+    
+    Espera el primer chunk antes de volver, así los errores de dibujo o de
+    cola llena llegan como excepción y no como un stream cortado.
+    """
+    if inference_pool.kind == "process":
+        # El canal no cruza procesos: el worker devuelve los bytes completos
+        response_bytes, timings = await inference_pool.run(render_detections, decoded, objects, fmt, quality)
+        record_timings(timings)
+        return iter([response_bytes])
+    
+    output = ChunkStream(asyncio.get_running_loop())
+    
+    def done(task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            output.fail(task.exception())
+        else:
+            record_timings(task.result()[1])
+    
+    job = asyncio.ensure_future(inference_pool.run(render_detections, decoded, objects, fmt, quality, output))
+    job.add_done_callback(done)
+    await output.ready()
+    return output
+
+def detection_response(detection: dict, start_time: float, response_format: str = "objects") -> dict:
+    """
+    Armar la respuesta JSON de /detect (misma forma para /detect-batch)
+    
+    Args:
+        response_format: "objects" (lista de dicts) o "columns" (arrays paralelos)
+    """
+    objects = detection["objects"]
+    if response_format == "objects":
+        objects = objects_to_records(objects)
+    total_time = (time.time() - start_time) * 1000
+    return {
+        "success": True,
+        "count": len(detection["objects"]["class"]),
+        "inference_time_ms": round(detection["inference_time_ms"], 1),
+        "total_time_ms": round(total_time, 1),
+        "model": detection.get("model", model_name),
+        "image_size": detection["image_size"],
+        **({"tiles": detection["tiles"]} if "tiles" in detection else {}),
+        **({"roi": detection["roi"]} if "roi" in detection else {}),
+        "objects": objects
+    }
+
+def tracking_options(stream_id: Optional[str], detect_every: Optional[int], delta: bool) -> int:
+    """
+    Validar los parámetros de seguimiento de /detect
+    
+    Returns:
+        detect_every efectivo
+    
+    Raises:
+        OptionsError: Si detect_every o delta vienen sin stream_id o fuera de límites
+    """
+    if not stream_id:
+        if detect_every is not None or delta:
+            raise OptionsError("detect_every y delta requieren stream_id")
+        return 1
+    if len(stream_id) > 128:
+        raise OptionsError("stream_id admite hasta 128 caracteres")
+    detect_every = TRACK_DETECT_EVERY if detect_every is None else detect_every
+    if not 1 <= detect_every <= TRACK_MAX_DETECT_EVERY:
+        raise OptionsError(f"detect_every debe estar entre 1 y {TRACK_MAX_DETECT_EVERY}")
+    return detect_every
+
+async def tracked_detection(stream_id: str, detect_every: int, image_bytes, options: InferenceOptions,
+                            tiled: bool, roi: Optional[tuple]) -> tuple:
+    """
+    Detección (o propagación) de un frame de una cámara seguida
+    
+    El detector corre cada detect_every frames; en los intermedios los tracks
+    avanzan con su filtro de Kalman sin decodificar la imagen.
+    
+    Returns:
+        (detection con objects de los tracks, tracker, detected, cache_hit)
+    """
+    tracker = trackers.get(stream_id)
+    async with tracker.lock:
+        detected = tracker.needs_detection(detect_every)
+        cache_hit = False
+        if detected:
+            detection, _, cache_hit = await cached_detection(image_bytes, options=options, tiled=tiled, roi=roi)
+            tracker.update(detection["objects"])
+        else:
+            detection = {
+                "inference_time_ms": 0.0,
+                "model": options.model,
+                "image_size": list(probe_size(image_bytes))
+            }
+            tracker.predict()
+        # Copia: la detección puede venir del cache y no se modifica
+        detection = {**detection, "objects": tracker.objects(detection["image_size"])}
+    return detection, tracker, detected, cache_hit
+
+def tracked_response(detection: dict, tracker, stream_id: str, detected: bool, start_time: float,
+                     response_format: str = "objects", delta: bool = False) -> dict:
+    """
+    Respuesta de /detect con seguimiento: objects con track_id, o solo los cambios
+    
+    Con delta, objects se reemplaza por added y moved (mismo esquema que
+    objects) y removed (track_id que desaparecieron) respecto de la última
+    respuesta de esa cámara; count sigue siendo el total de tracks.
+    """
+    content = detection_response(detection, start_time, response_format)
+    content.update({"stream_id": stream_id, "frame": tracker.frames, "detected": detected})
+    if not delta:
+        tracker.report(detection["objects"])
+        return content
+    del content["objects"]
+    changes = tracker.delta(detection["objects"])
+    if response_format == "objects":
+        changes["added"] = objects_to_records(changes["added"])
+        changes["moved"] = objects_to_records(changes["moved"])
+    content.update(changes)
+    return content
+
+def invalid_image_response(file: UploadFile) -> JSONResponse:
+    """Respuesta 400 para archivos que no son imagen"""
+    logger.warning(f"Invalid content type: {file.content_type}")
+    return JSONResponse(
+        status_code=400,
+        content={
+            "success": False,
+            "error": "El archivo debe ser una imagen (JPG, PNG, etc)"
+        }
+    )
+
+def invalid_format_response(response_format: str) -> JSONResponse:
+    """Respuesta 400 para un formato de respuesta desconocido"""
+    return JSONResponse(
+        status_code=400,
+        content={
+            "success": False,
+            "error": f"Formato inválido: {response_format} (opciones: {', '.join(RESPONSE_FORMATS)})"
+        }
+    )
+
+def invalid_options_response(e: OptionsError) -> JSONResponse:
+    """Respuesta 400 para opciones de inferencia inválidas o fuera de límites"""
+    logger.warning(f"Opciones rechazadas: {e}")
+    return JSONResponse(
+        status_code=400,
+        content={
+            "success": False,
+            "error": str(e)
+        }
+    )
+
+def saturated_response(e: PoolSaturatedError) -> JSONResponse:
+    """Respuesta 503 cuando la cola de inferencia está llena (o el servicio está arrancando)"""
+    logger.warning(f"⏳ {e}")
+    return JSONResponse(
+        status_code=503,
+        content={
+            "success": False,
+            "error": "Servicio arrancando, reintentar más tarde" if isinstance(e, NotReadyError)
+                     else "Servidor ocupado, reintentar más tarde"
+        },
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
 @app.post("/detect")
-async def detect_objects(file: UploadFile = File(...)):
+async def detect_objects(response: Response, file: UploadFile = File(...),
+                         format: str = Query("objects"), tiled: bool = Query(False),
+                         model: Optional[str] = Query(None), confidence: Optional[float] = Query(None),
+                         classes: Optional[str] = Query(None), max_det: Optional[int] = Query(None),
+                         imgsz: Optional[int] = Query(None), roi: Optional[str] = Query(None),
+                         stream_id: Optional[str] = Query(None), detect_every: Optional[int] = Query(None),
+                         delta: bool = Query(False)):
     """
     Detectar objetos en imagen usando YOLO
     
     Args:
         file: Archivo de imagen (JPG, PNG, etc)
+        format: "objects" (lista de dicts) o "columns" (arrays paralelos, más compacto)
+        tiled: Inferencia por tiles a alta resolución (objetos chicos en imágenes grandes)
+        model: Modelo a usar (MODEL_NAME o uno de MODELS; se carga en su primer uso)
+        confidence: Umbral de confianza (default CONFIDENCE, mínimo MIN_CONFIDENCE)
+        classes: Clases a detectar, separadas por coma (se filtran en el NMS del modelo)
+        max_det: Máximo de detecciones (default y tope MAX_DETECTIONS)
+        imgsz: Tamaño de entrada del modelo, múltiplo de 32 entre MIN_IMGSZ y MAX_IMGSZ
+        roi: Región x1,y1,x2,y2 (píxeles de la original): solo se procesa ese recorte
+        stream_id: Id de la cámara: activa el seguimiento (objects con track_id persistente)
+        detect_every: Con stream_id, correr el detector cada N frames y propagar los tracks en los demás
+        delta: Con stream_id, responder solo added/moved/removed respecto de la respuesta anterior
     
     Returns:
         JSON con objetos detectados, confianza y bounding boxes
@@ -114,82 +1028,43 @@ async def detect_objects(file: UploadFile = File(...)):
     try:
         # Validar tipo de archivo
         if not file.content_type or not file.content_type.startswith("image/"):
-            logger.warning(f"Invalid content type: {file.content_type}")
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "success": False,
-                    "error": "El archivo debe ser una imagen (JPG, PNG, etc)"
-                }
-            )
+            return invalid_image_response(file)
+        if format not in RESPONSE_FORMATS:
+            return invalid_format_response(format)
+        detect_every = tracking_options(stream_id, detect_every, delta)
+        options, roi = await inference_options(model, confidence, classes, max_det, imgsz, roi, tiled)
+        
+        # Rechazar antes de leer si la memoria está cerca del límite
+        memory_manager.admit()
         
         # Leer imagen
         logger.info(f"Procesando archivo: {file.filename}")
         start_time = time.time()
         
-        image_bytes = await file.read()
-        img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        
-        # Optimizar imagen
-        img = optimize_image(img)
-        logger.info(f"Imagen cargada: {img.size}")
-        
-        # Inferencia con YOLO
-        inference_start = time.time()
-        results = model(img, conf=CONFIDENCE_THRESHOLD, verbose=False)
-        inference_time = (time.time() - inference_start) * 1000
-        
-        # Procesar resultados
-        objects = []
-        detections = results[0]
-        
-        if detections.boxes is not None:
-            for box_data in detections.boxes:
-                # Extraer coordenadas
-                xyxy = box_data.xyxy[0].tolist()
-                x1, y1, x2, y2 = xyxy
-                
-                # Confianza
-                conf = float(box_data.conf[0])
-                
-                # Clase
-                cls_idx = int(box_data.cls[0])
-                class_name = detections.names.get(cls_idx, f"unknown_{cls_idx}")
-                
-                # Crear objeto de detección
-                objects.append({
-                    "class": class_name,
-                    "confidence": round(conf, 3),
-                    "bbox": {
-                        "x1": round(x1),
-                        "y1": round(y1),
-                        "x2": round(x2),
-                        "y2": round(y2)
-                    }
-                })
-        
-        # Ordenar por confianza (descendente)
-        objects.sort(key=lambda x: x['confidence'], reverse=True)
-        
-        total_time = (time.time() - start_time) * 1000
-        
-        logger.info(f"✅ Detección completada: {len(objects)} objetos en {inference_time:.1f}ms")
-        
-        response = {
-            "success": True,
-            "count": len(objects),
-            "inference_time_ms": round(inference_time, 1),
-            "total_time_ms": round(total_time, 1),
-            "model": model_name,
-            "image_size": list(img.size),
-            "objects": objects
-        }
+        upload = await read_upload(file)
+        try:
+            if stream_id:
+                detection, tracker, detected, cache_hit = await tracked_detection(
+                    stream_id, detect_every, upload.view, options, tiled, roi
+                )
+            else:
+                # Decodificación + inferencia fuera del event loop (o resultado cacheado)
+                detection, _, cache_hit = await cached_detection(upload.view, options=options, tiled=tiled, roi=roi)
+        finally:
+            upload.release()
+        response.headers["X-Cache"] = "HIT" if cache_hit else "MISS"
         
-        # Limpiar memoria
-        del img, results, detections
-        cleanup_memory()
+        logger.info(f"✅ Detección completada: {len(detection['objects']['class'])} objetos en {detection['inference_time_ms']:.1f}ms")
         
-        return response
+        if stream_id:
+            return tracked_response(detection, tracker, stream_id, detected, start_time, format, delta)
+        return detection_response(detection, start_time, format)
+    
+    except PoolSaturatedError as e:
+        return saturated_response(e)
+    
+    except OptionsError as e:
+        return invalid_options_response(e)
     
     except Exception as e:
         logger.error(f"❌ Error en detección: {e}", exc_info=True)
@@ -203,112 +1078,82 @@ async def detect_objects(file: UploadFile = File(...)):
         )
 
 @app.post("/detect-visual")
-async def detect_visual(file: UploadFile = File(...)):
+async def detect_visual(file: UploadFile = File(...), format: Optional[str] = Query(None),
+                        quality: Optional[int] = Query(None), tiled: bool = Query(False),
+                        model: Optional[str] = Query(None), confidence: Optional[float] = Query(None),
+                        classes: Optional[str] = Query(None), max_det: Optional[int] = Query(None),
+                        imgsz: Optional[int] = Query(None), roi: Optional[str] = Query(None),
+                        accept: str = Header("")):
     """
     Detectar objetos y retornar imagen con bounding boxes dibujados
     
     Args:
         file: Archivo de imagen (JPG, PNG, etc)
+        format: png | jpeg | webp (si falta se negocia con el header Accept)
+        quality: Calidad 1-100 para JPEG/WebP (default RENDER_QUALITY)
+        tiled: Inferencia por tiles a alta resolución
+        model, confidence, classes, max_det, imgsz, roi: Igual que /detect (se dibuja la imagen completa)
     
     Returns:
-        Imagen PNG con bounding boxes y etiquetas
+        Imagen con bounding boxes y etiquetas, emitida a medida que se codifica
     """
     try:
         # Validar tipo de archivo
         if not file.content_type or not file.content_type.startswith("image/"):
-            logger.warning(f"Invalid content type: {file.content_type}")
+            return invalid_image_response(file)
+        
+        render_format = format or negotiate_format(accept, RENDER_FORMAT)
+        quality = RENDER_QUALITY if quality is None else quality
+        if render_format not in RENDER_FORMATS or not 1 <= quality <= 100:
             return JSONResponse(
                 status_code=400,
                 content={
                     "success": False,
-                    "error": "El archivo debe ser una imagen (JPG, PNG, etc)"
+                    "error": f"Salida inválida: format debe ser {', '.join(RENDER_FORMATS)} y quality 1-100"
                 }
             )
+        _, media_type, extension = RENDER_FORMATS[render_format]
+        options, roi = await inference_options(model, confidence, classes, max_det, imgsz, roi, tiled)
+        
+        # Rechazar antes de leer si la memoria está cerca del límite
+        memory_manager.admit()
         
         # Leer imagen
         logger.info(f"Procesando visualización: {file.filename}")
-        start_time = time.time()
         
-        image_bytes = await file.read()
-        img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        
-        # Optimizar imagen
-        img = optimize_image(img)
-        img_copy = img.copy()
-        
-        logger.info(f"Imagen cargada: {img.size}")
-        
-        # Inferencia
-        inference_start = time.time()
-        results = model(img, conf=CONFIDENCE_THRESHOLD, verbose=False)
-        inference_time = (time.time() - inference_start) * 1000
-        
-        # Dibujar en la imagen
-        draw = ImageDraw.Draw(img_copy)
-        detections = results[0]
-        
-        # Colores para diferentes clases (ciclar)
-        colors = [
-            (255, 0, 0),      # Red
-            (0, 255, 0),      # Green
-            (0, 0, 255),      # Blue
-            (255, 255, 0),    # Yellow
-            (255, 0, 255),    # Magenta
-            (0, 255, 255),    # Cyan
-            (255, 165, 0),    # Orange
-            (128, 0, 128),    # Purple
-        ]
-        
-        count = 0
-        if detections.boxes is not None:
-            for idx, box_data in enumerate(detections.boxes):
-                # Extraer coordenadas
-                xyxy = box_data.xyxy[0].tolist()
-                x1, y1, x2, y2 = xyxy
-                
-                # Confianza y clase
-                conf = float(box_data.conf[0])
-                cls_idx = int(box_data.cls[0])
-                class_name = detections.names.get(cls_idx, f"unknown_{cls_idx}")
-                
-                # Seleccionar color
-                color = colors[idx % len(colors)]
-                
-                # Dibujar rectángulo
-                draw.rectangle([x1, y1, x2, y2], outline=color, width=3)
-                
-                # Dibujar etiqueta
-                label = f"{class_name} {conf:.2f}"
-                text_bbox = draw.textbbox((x1, y1 - 20), label)
-                
-                # Fondo para el texto
-                draw.rectangle([text_bbox[0], text_bbox[1], text_bbox[2] + 5, text_bbox[3] + 5], 
-                             fill=color)
-                
-                # Texto
-                draw.text((x1, y1 - 20), label, fill=(255, 255, 255))
-                count += 1
-        
-        total_time = (time.time() - start_time) * 1000
-        logger.info(f"✅ Visualización completada: {count} objetos en {inference_time:.1f}ms")
-        
-        # Convertir imagen a bytes
-        img_bytes = io.BytesIO()
-        img_copy.save(img_bytes, format="PNG", optimize=True)
-        img_bytes.seek(0)
+        upload = await read_upload(file)
+        try:
+            # Decodificación + inferencia fuera del event loop
+            detection, decoded, cache_hit = await cached_detection(
+                upload.view, render=True, options=options, tiled=tiled, roi=roi
+            )
+            if decoded is None:
+                # Resultado cacheado, por tiles o de una ROI: falta decodificar para dibujar
+                decoded = await inference_pool.run(decode_for_render, upload.view)
+                record_timings(decoded.timings)
+        finally:
+            upload.release()
         
-        response_bytes = img_bytes.getvalue()
+        # Dibujo + encoding fuera del event loop, emitiendo chunks a medida que salen
+        body = await stream_render(decoded, detection["objects"], render_format, quality)
         
-        # Limpiar memoria
-        del img, img_copy, results, detections, draw, img_bytes
-        cleanup_memory()
+        logger.info(f"✅ Visualización completada: {len(detection['objects']['class'])} objetos en {detection['inference_time_ms']:.1f}ms")
         
         return StreamingResponse(
-            iter([response_bytes]),
-            media_type="image/png",
-            headers={"Content-Disposition": f"attachment; filename=detected_{file.filename}"}
+            body,
+            media_type=media_type,
+            headers={
+                "Content-Disposition": f"attachment; filename=detected_{Path(file.filename or 'image').stem}.{extension}",
+                "X-Cache": "HIT" if cache_hit else "MISS"
+            }
         )
     
+    except PoolSaturatedError as e:
+        return saturated_response(e)
+    
+    except OptionsError as e:
+        return invalid_options_response(e)
+    
     except Exception as e:
         logger.error(f"❌ Error en visualización: {e}", exc_info=True)
         cleanup_memory()
@@ -320,6 +1165,799 @@ async def detect_visual(file: UploadFile = File(...)):
             }
         )
 
+async def detect_batch_entry(index: int, filename: str, image_bytes: bytes,
+                             response_format: str = "objects",
+                             options: InferenceOptions = DEFAULT_OPTIONS,
+                             roi: Optional[tuple] = None, tiled: bool = False) -> dict:
+    """Procesar una imagen de /detect-batch (o de un trabajo) sin propagar errores al stream"""
+    start_time = time.time()
+    try:
+        detection, _, _ = await cached_detection(image_bytes, options=options, tiled=tiled, roi=roi)
+        entry = detection_response(detection, start_time, response_format)
+    except PoolSaturatedError as e:
+        entry = {
+            "success": False,
+            "error": "Servidor ocupado, reintentar más tarde",
+            "retry_after": e.retry_after
+        }
+    except OptionsError as e:
+        # ROI fuera de esta imagen: las demás siguen
+        entry = {
+            "success": False,
+            "error": str(e)
+        }
+    except Exception as e:
+        logger.warning(f"Error procesando {filename}: {e}")
+        entry = {
+            "success": False,
+            "error": f"Error en detección: {str(e)}"
+        }
+    return {"index": index, "filename": filename, **entry}
+
+async def read_batch_uploads(files: List[UploadFile]) -> tuple:
+    """
+    Leer imágenes y archivos zip/tar de /detect-batch o /jobs
+    
+    Returns:
+        (lista de (filename, bytes), archivo que no es imagen ni archivo o None)
+    
+    Raises:
+        ArchiveError: Si se superan BATCH_MAX_FILES o BATCH_MAX_ARCHIVE_MB
+    """
+    images = []
+    for file in files:
+        data = await file.read()
+        if is_archive(file.filename, file.content_type):
+            images.extend(await run_in_threadpool(
+                extract_images, data, BATCH_MAX_FILES - len(images),
+                BATCH_MAX_ARCHIVE_MB * 1024 * 1024
+            ))
+        elif file.content_type and file.content_type.startswith("image/"):
+            images.append((file.filename, data))
+        else:
+            return images, file
+        
+        if len(images) > BATCH_MAX_FILES:
+            raise ArchiveError(f"Máximo {BATCH_MAX_FILES} imágenes por petición")
+    return images, None
+
+async def stream_batch_results(images: list, response_format: str = "objects",
+                               options: InferenceOptions = DEFAULT_OPTIONS, roi: Optional[tuple] = None):
+    """Emitir una línea JSON por imagen a medida que terminan"""
+    # Limitar imágenes en vuelo a un batch para no saturar la cola del pool
+    semaphore = asyncio.Semaphore(BATCH_MAX_SIZE)
+    
+    async def process(index, filename, image_bytes):
+        async with semaphore:
+            return await detect_batch_entry(index, filename, image_bytes, response_format, options, roi)
+    
+    tasks = [
+        asyncio.ensure_future(process(index, filename, image_bytes))
+        for index, (filename, image_bytes) in enumerate(images)
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            entry = await task
+            yield json.dumps(entry, ensure_ascii=False) + "\n"
+    finally:
+        # Cliente desconectado: cancelar lo pendiente
+        for task in tasks:
+            task.cancel()
+
+@app.post("/detect-batch")
+async def detect_batch(files: List[UploadFile] = File(...), format: str = Query("objects"),
+                       model: Optional[str] = Query(None), confidence: Optional[float] = Query(None),
+                       classes: Optional[str] = Query(None), max_det: Optional[int] = Query(None),
+                       imgsz: Optional[int] = Query(None), roi: Optional[str] = Query(None)):
+    """
+    Detectar objetos en varias imágenes en una sola petición
+    
+    Args:
+        files: Archivos de imagen y/o archivos zip/tar con imágenes
+        format: "objects" (lista de dicts) o "columns" (arrays paralelos)
+        model, confidence, classes, max_det, imgsz, roi: Igual que /detect, para todas las imágenes
+    
+    Returns:
+        Stream NDJSON: una línea por imagen (mismo esquema que /detect
+        más index y filename), en orden de finalización
+    """
+    if format not in RESPONSE_FORMATS:
+        return invalid_format_response(format)
+    try:
+        options, roi = await inference_options(model, confidence, classes, max_det, imgsz, roi)
+    except PoolSaturatedError as e:
+        return saturated_response(e)
+    except OptionsError as e:
+        return invalid_options_response(e)
+    
+    try:
+        # Rechazar antes de leer si la memoria está cerca del límite
+        memory_manager.admit()
+        
+        images, rejected = await read_batch_uploads(files)
+        if rejected is not None:
+            return invalid_image_response(rejected)
+    
+    except PoolSaturatedError as e:
+        return saturated_response(e)
+    
+    except ArchiveError as e:
+        logger.warning(f"Batch rechazado: {e}")
+        return JSONResponse(
+            status_code=400,
+            content={
+                "success": False,
+                "error": str(e)
+            }
+        )
+    
+    logger.info(f"Procesando batch: {len(images)} imágenes")
+    
+    return StreamingResponse(
+        stream_batch_results(images, format, options, roi),
+        media_type="application/x-ndjson"
+    )
+
+def start_jobs():
+    """Lanzar el runner de trabajos"""
+    global jobs_task
+    jobs_task = asyncio.ensure_future(run_jobs())
+
+async def recover_jobs():
+    """Devolver a la cola los trabajos interrumpidos por un reinicio (o fallarlos tras JOBS_MAX_ATTEMPTS)"""
+    requeued, failed = await run_in_threadpool(job_store.recover, JOBS_MAX_ATTEMPTS)
+    if requeued:
+        logger.info(f"📥 {requeued} trabajo(s) interrumpido(s) vuelven a la cola")
+    for job_id in failed:
+        logger.error(f"❌ Trabajo {job_id} interrumpido {JOBS_MAX_ATTEMPTS} veces: se marca fallido")
+        await notify_job(job_id)
+
+async def run_jobs():
+    """Procesar la cola de trabajos de a uno, para siempre"""
+    try:
+        await recover_jobs()
+    except Exception as e:
+        logger.error(f"❌ Error al recuperar trabajos: {e}", exc_info=True)
+    while True:
+        try:
+            await run_in_threadpool(job_store.purge)
+            job = await run_in_threadpool(job_store.claim)
+            if job is None:
+                # Esperar un trabajo nuevo (POST /jobs despierta el runner)
+                jobs_wakeup.clear()
+                try:
+                    await asyncio.wait_for(jobs_wakeup.wait(), timeout=60)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await process_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Un trabajo roto no queda running para siempre: se marca fallido y se avisa
+                logger.error(f"❌ Trabajo {job['id']} falló: {e}", exc_info=True)
+                await run_in_threadpool(job_store.fail, job["id"], f"Error en el trabajo: {e}")
+                await notify_job(job["id"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Error en el runner de trabajos: {e}", exc_info=True)
+            await asyncio.sleep(5)
+
+async def yield_to_interactive():
+    """
+    Esperar un worker libre antes de cada imagen de un trabajo
+    
+    Las peticiones síncronas (/detect, streams, WebSocket) tienen prioridad: un
+    trabajo solo usa workers ociosos, así una petición interactiva espera como
+    mucho la imagen del trabajo que ya está en curso.
+    """
+    while inference_pool.in_flight >= inference_pool.workers:
+        await asyncio.sleep(0.05)
+
+async def process_job(job: dict):
+    """Detectar las imágenes de un trabajo, guardar los resultados y avisar al webhook"""
+    params = job["params"]
+    start_time = time.time()
+    logger.info(f"🗂️  Trabajo {job['id']}: {len(job['filenames'])} imágenes")
+    try:
+        options, roi = await inference_options(params["model"], params["confidence"], params["classes"],
+                                               params["max_det"], params["imgsz"], params["roi"],
+                                               params["tiled"])
+    except OptionsError as e:
+        # Parámetros que dejaron de valer tras un reinicio (ej: modelo quitado de MODELS)
+        await run_in_threadpool(job_store.fail, job["id"], str(e))
+        await notify_job(job["id"])
+        return
+    
+    results = []
+    images = job_store.images(job)
+    while True:
+        item = await run_in_threadpool(next, images, None)
+        if item is None:
+            break
+        index, filename, image_bytes = item
+        while True:
+            await yield_to_interactive()
+            try:
+                memory_manager.admit()
+            except PoolSaturatedError as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            entry = await detect_batch_entry(index, filename, image_bytes, params["format"],
+                                             options, roi, params["tiled"])
+            if "retry_after" not in entry:
+                break
+            # Cola llena: el trabajo espera en lugar de fallar esa imagen
+            await asyncio.sleep(entry["retry_after"])
+        results.append(entry)
+        await run_in_threadpool(job_store.progress, job["id"], len(results))
+    
+    await run_in_threadpool(job_store.finish, job["id"], results)
+    logger.info(f"✅ Trabajo {job['id']} terminado en {(time.time() - start_time):.1f}s")
+    await notify_job(job["id"])
+
+def job_response(job: dict) -> dict:
+    """Estado de un trabajo (GET /jobs/{id} y cuerpo del webhook)"""
+    return {
+        "success": job["status"] != "failed",
+        "job_id": job["id"],
+        "status": job["status"],
+        "images": len(job["filenames"]),
+        "processed": job["processed"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "error": job["error"],
+        "webhook_status": job["webhook_status"],
+        "results": job["results"]
+    }
+
+async def notify_job(job_id: str):
+    """POST del estado final al webhook del trabajo, con reintentos"""
+    job = await run_in_threadpool(job_store.get, job_id)
+    if not job["webhook"]:
+        return
+    body = job_response(job)
+    status = None
+    for attempt in range(max(1, JOBS_WEBHOOK_RETRIES)):
+        try:
+            code = await run_in_threadpool(post_webhook, job["webhook"], body, JOBS_WEBHOOK_TIMEOUT_S,
+                                           JOBS_WEBHOOK_ALLOWED_HOSTS)
+            status = f"sent ({code})"
+            break
+        except Exception as e:
+            status = f"failed: {e}"
+            logger.warning(f"⚠️ Webhook del trabajo {job_id} falló (intento {attempt + 1}): {e}")
+            if attempt + 1 < JOBS_WEBHOOK_RETRIES:
+                await asyncio.sleep(2 ** attempt)
+    await run_in_threadpool(job_store.set_webhook_status, job_id, status)
+
+@app.post("/jobs")
+async def create_job(files: List[UploadFile] = File(...), format: str = Query("objects"),
+                     tiled: bool = Query(False), webhook: Optional[str] = Query(None),
+                     model: Optional[str] = Query(None), confidence: Optional[float] = Query(None),
+                     classes: Optional[str] = Query(None), max_det: Optional[int] = Query(None),
+                     imgsz: Optional[int] = Query(None), roi: Optional[str] = Query(None)):
+    """
+    Encolar imágenes (o zip/tar) para detección asíncrona
+    
+    Para trabajos que tardan más que el timeout HTTP del cliente: la respuesta
+    llega enseguida con el id; el resultado se consulta en GET /jobs/{id} o
+    llega por POST al webhook.
+    
+    Args:
+        files: Archivos de imagen y/o archivos zip/tar con imágenes
+        format: "objects" o "columns", igual que /detect-batch
+        tiled: Inferencia por tiles a alta resolución
+        webhook: URL http(s) que recibe el estado final del trabajo (opcional)
+        model, confidence, classes, max_det, imgsz, roi: Igual que /detect, para todas las imágenes
+    
+    Returns:
+        202 con job_id y la URL de estado
+    """
+    if job_store is None:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "success": False,
+                "error": "Trabajos asíncronos deshabilitados (JOBS_DIR)"
+            }
+        )
+    if format not in RESPONSE_FORMATS:
+        return invalid_format_response(format)
+    try:
+        if webhook:
+            await run_in_threadpool(validate_webhook, webhook, JOBS_WEBHOOK_ALLOWED_HOSTS)
+        # Validar ahora: el trabajo no debería fallar por parámetros después de encolado
+        await inference_options(model, confidence, classes, max_det, imgsz, roi, tiled)
+        
+        memory_manager.admit()
+        images, rejected = await read_batch_uploads(files)
+        if rejected is not None:
+            return invalid_image_response(rejected)
+    
+    except PoolSaturatedError as e:
+        return saturated_response(e)
+    
+    except OptionsError as e:
+        return invalid_options_response(e)
+    
+    except (ArchiveError, ValueError) as e:
+        logger.warning(f"Trabajo rechazado: {e}")
+        return JSONResponse(
+            status_code=400,
+            content={
+                "success": False,
+                "error": str(e)
+            }
+        )
+    
+    params = {"format": format, "tiled": tiled, "model": model, "confidence": confidence,
+              "classes": classes, "max_det": max_det, "imgsz": imgsz, "roi": roi}
+    job_id = await run_in_threadpool(job_store.create, images, params, webhook)
+    jobs_wakeup.set()
+    logger.info(f"📥 Trabajo {job_id} en cola: {len(images)} imágenes")
+    
+    return JSONResponse(
+        status_code=202,
+        content={
+            "success": True,
+            "job_id": job_id,
+            "status": "queued",
+            "images": len(images),
+            "status_url": f"/jobs/{job_id}"
+        },
+        headers={"Location": f"/jobs/{job_id}"}
+    )
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Estado de un trabajo y, si terminó, sus resultados (mismo esquema que /detect-batch)"""
+    job = await run_in_threadpool(job_store.get, job_id) if job_store is not None else None
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "success": False,
+                "error": "Trabajo no encontrado"
+            }
+        )
+    return job_response(job)
+
+def decode_frame(frame_data, max_side: int = DECODE_SIZE, roi: Optional[tuple] = None) -> tuple:
+    """Decodificar un frame de video/MJPEG (o su ROI) y calcular su firma (bloqueante, corre en el pool)"""
+    if isinstance(frame_data, np.ndarray):
+        if roi:
+            roi = clip_roi(roi, frame_data.shape[1::-1], option_limits)
+        decoded = decode_array(frame_data, max_side, RESAMPLE, roi)
+    else:
+        if roi:
+            roi = clip_roi(roi, probe_size(frame_data), option_limits)
+        decoded = decode_image(frame_data, max_side, RESAMPLE, roi=roi)
+    return decoded, frame_signature(decoded.array)
+
+def sse_event(event: str, data: dict) -> str:
+    """Formatear un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_detections(source, fps: float, change_threshold: float, max_frames: int,
+                            response_format: str = "objects", options: InferenceOptions = DEFAULT_OPTIONS,
+                            roi: Optional[tuple] = None):
+    """
+    Emitir eventos SSE con las detecciones de una fuente de video, en orden de frame
+    
+    Eventos:
+        detection: frame procesado (mismo esquema que /detect + frame y timestamp)
+        reused: frame casi igual al último procesado (valen sus detecciones)
+        error: frame que no se pudo procesar (el stream sigue)
+        end: resumen al terminar la fuente
+    """
+    loop = asyncio.get_running_loop()
+    frames = source.frames(FrameSampler(fps))
+    stats = {"sampled": 0, "processed": 0, "reused": 0, "errors": 0}
+    # Archivos: los frames se mandan de a un batch completo (un forward pass).
+    # En vivo esperar al siguiente frame solo suma latencia: se mandan de a uno.
+    group_size = 1 if source.live else batcher.max_size
+    group = []      # Frames decodificados que esperan completar el grupo
+    pending = collections.deque()  # Futures de eventos SSE, en orden de frame
+    last_signature = None
+    last_processed = None
+    started = 0
+    read = None     # Lectura de la fuente en curso
+    
+    def close_source():
+        try:
+            frames.close()
+        finally:
+            source.close()
+    
+    def frame_info(frame) -> dict:
+        return {"frame": frame.index, "timestamp": round(frame.timestamp, 3)}
+    
+    def ready_event(event: str) -> asyncio.Future:
+        future = loop.create_future()
+        future.set_result(event)
+        return future
+    
+    def error_event(frame, e: Exception) -> str:
+        stats["errors"] += 1
+        if isinstance(e, PoolSaturatedError):
+            return sse_event("error", {**frame_info(frame), "error": "Servidor ocupado, frame descartado"})
+        logger.warning(f"Error en frame {frame.index}: {e}")
+        return sse_event("error", {**frame_info(frame), "error": f"Error en detección: {str(e)}"})
+    
+    async def detect(frame, decoded) -> str:
+        start_time = time.time()
+        try:
+            detection = await detect_image(decoded, options)
+        except Exception as e:
+            return error_event(frame, e)
+        stats["processed"] += 1
+        return sse_event("detection", {**frame_info(frame), **detection_response(detection, start_time, response_format)})
+    
+    def flush_group():
+        # Todas en el mismo tick: el micro-batcher las junta en un batch
+        for frame, decoded, event in group:
+            pending.append(ready_event(event) if decoded is None else asyncio.ensure_future(detect(frame, decoded)))
+        group.clear()
+    
+    try:
+        while not max_frames or started < max_frames:
+            # Leer la fuente bloquea (red, decoder de video): fuera del event loop.
+            # shield: si el cliente se desconecta la lectura sigue y se sabe cuándo termina
+            read = asyncio.ensure_future(run_in_threadpool(next, frames, None))
+            try:
+                frame = await asyncio.shield(read)
+            except StreamError as e:
+                # Stream corrupto o cortado: avisar y entregar lo que ya está en vuelo
+                stats["errors"] += 1
+                logger.warning(f"Stream interrumpido: {e}")
+                yield sse_event("error", {"error": str(e)})
+                break
+            if frame is None:
+                break
+            stats["sampled"] += 1
+            
+            try:
+                decoded, signature = await inference_pool.run(decode_frame, frame.data, options.imgsz, roi)
+            except Exception as e:
+                group.append((frame, None, error_event(frame, e)))
+                continue
+            record_timings(decoded.timings)
+            
+            change = frame_change(last_signature, signature)
+            if change < change_threshold:
+                stats["reused"] += 1
+                group.append((frame, None, sse_event("reused", {
+                    **frame_info(frame),
+                    "reused_from": last_processed,
+                    "change": round(change, 4)
+                })))
+            else:
+                last_signature, last_processed = signature, frame.index
+                started += 1
+                group.append((frame, decoded, None))
+                if sum(decoded is not None for _, decoded, _ in group) >= group_size:
+                    flush_group()
+            
+            # Emitir lo que ya terminó; con más de un grupo en vuelo, esperar
+            while pending and (pending[0].done() or len(pending) > 2 * group_size):
+                yield await pending.popleft()
+        
+        flush_group()
+        while pending:
+            yield await pending.popleft()
+        yield sse_event("end", stats)
+    
+    finally:
+        for future in pending:
+            future.cancel()
+        if read is not None and not read.done():
+            # Un thread sigue bloqueado en next(frames): el generador está en ejecución
+            # y no se puede cerrar todavía; cerrar todo cuando vuelva esa lectura
+            read.add_done_callback(lambda _: loop.run_in_executor(None, close_source))
+        else:
+            await run_in_threadpool(close_source)
+        logger.info(f"🎞️ Stream terminado: {stats}")
+
+def stream_params_error(fps: float, change_threshold: float, max_frames: int,
+                        response_format: str) -> Optional[JSONResponse]:
+    """Respuesta 400 si los parámetros de /detect-stream son inválidos (None si están bien)"""
+    if response_format not in RESPONSE_FORMATS:
+        return invalid_format_response(response_format)
+    if fps < 0 or not 0 <= change_threshold <= 1 or max_frames < 0:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "success": False,
+                "error": "Parámetros inválidos: fps >= 0, change_threshold entre 0 y 1, max_frames >= 0"
+            }
+        )
+    return None
+
+def stream_response(source, fps: float, change_threshold: float, max_frames: int,
+                    response_format: str, options: InferenceOptions = DEFAULT_OPTIONS,
+                    roi: Optional[tuple] = None) -> StreamingResponse:
+    """Respuesta SSE para una fuente ya abierta"""
+    if STREAM_MAX_FRAMES:
+        max_frames = min(max_frames or STREAM_MAX_FRAMES, STREAM_MAX_FRAMES)
+    return StreamingResponse(
+        stream_detections(source, fps, change_threshold, max_frames, response_format, options, roi),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def stream_error_response(e: StreamError) -> JSONResponse:
+    """Respuesta 400 para fuentes de video inválidas"""
+    logger.warning(f"Stream rechazado: {e}")
+    return JSONResponse(
+        status_code=400,
+        content={
+            "success": False,
+            "error": str(e)
+        }
+    )
+
+def save_upload(file: UploadFile) -> str:
+    """Copiar un upload a un archivo temporal (OpenCV necesita una ruta)"""
+    with tempfile.NamedTemporaryFile(suffix=Path(file.filename or "").suffix, delete=False) as tmp:
+        file.file.seek(0)
+        shutil.copyfileobj(file.file, tmp)
+        return tmp.name
+
+@app.get("/detect-stream")
+async def detect_stream(source: str = Query(...), fps: float = Query(STREAM_FPS),
+                        change_threshold: float = Query(STREAM_CHANGE_THRESHOLD),
+                        max_frames: int = Query(0), format: str = Query("objects"),
+                        model: Optional[str] = Query(None), confidence: Optional[float] = Query(None),
+                        classes: Optional[str] = Query(None), max_det: Optional[int] = Query(None),
+                        imgsz: Optional[int] = Query(None), roi: Optional[str] = Query(None)):
+    """
+    Detectar objetos en un stream de cámara (MJPEG por HTTP, RTSP) o video local
+    
+    Args:
+        source: URL http(s) MJPEG o rtsp:// de un host de STREAM_ALLOWED_HOSTS, o ruta dentro de STREAM_ALLOWED_DIR
+        fps: Frames por segundo a procesar (0 = todos)
+        change_threshold: Cambio mínimo (0-1) respecto al último frame procesado
+        max_frames: Cortar después de N frames procesados (0 = hasta que termine)
+        format: "objects" o "columns"
+        model, confidence, classes, max_det, imgsz, roi: Igual que /detect (la ROI también
+            acota la comparación entre frames)
+    
+    Returns:
+        Stream SSE con eventos detection / reused / error / end
+    """
+    error = stream_params_error(fps, change_threshold, max_frames, format)
+    if error is not None:
+        return error
+    
+    try:
+        options, roi = await inference_options(model, confidence, classes, max_det, imgsz, roi)
+        memory_manager.admit()
+        frame_source = await run_in_threadpool(open_source, source, STREAM_MJPEG_FPS, STREAM_ALLOWED_DIR,
+                                               allowed_hosts=STREAM_ALLOWED_HOSTS)
+    except PoolSaturatedError as e:
+        return saturated_response(e)
+    except StreamError as e:
+        return stream_error_response(e)
+    except OptionsError as e:
+        return invalid_options_response(e)
+    
+    logger.info(f"🎞️ Procesando stream: {source} ({fps} fps)")
+    return stream_response(frame_source, fps, change_threshold, max_frames, format, options, roi)
+
+@app.post("/detect-stream")
+async def detect_stream_upload(file: UploadFile = File(...), fps: float = Query(STREAM_FPS),
+                               change_threshold: float = Query(STREAM_CHANGE_THRESHOLD),
+                               max_frames: int = Query(0), format: str = Query("objects"),
+                               model: Optional[str] = Query(None), confidence: Optional[float] = Query(None),
+                               classes: Optional[str] = Query(None), max_det: Optional[int] = Query(None),
+                               imgsz: Optional[int] = Query(None), roi: Optional[str] = Query(None)):
+    """
+    Detectar objetos en un archivo de video o MJPEG subido
+    
+    Args:
+        file: Video (mp4, avi, mkv, ...) o MJPEG (.mjpg, multipart/x-mixed-replace)
+        (resto igual que GET /detect-stream)
+    
+    Returns:
+        Stream SSE con eventos detection / reused / error / end
+    """
+    error = stream_params_error(fps, change_threshold, max_frames, format)
+    if error is not None:
+        return error
+    try:
+        options, roi = await inference_options(model, confidence, classes, max_det, imgsz, roi)
+    except PoolSaturatedError as e:
+        return saturated_response(e)
+    except OptionsError as e:
+        return invalid_options_response(e)
+    
+    mjpeg = is_mjpeg(file.filename, file.content_type)
+    if not mjpeg and not is_video(file.filename, file.content_type):
+        logger.warning(f"Invalid content type: {file.content_type}")
+        return JSONResponse(
+            status_code=400,
+            content={
+                "success": False,
+                "error": "El archivo debe ser un video o un stream MJPEG"
+            }
+        )
+    
+    try:
+        memory_manager.admit()
+        path = await run_in_threadpool(save_upload, file)
+        try:
+            frame_source = await run_in_threadpool(open_file, path, STREAM_MJPEG_FPS, mjpeg, True)
+        except StreamError:
+            os.unlink(path)
+            raise
+    except PoolSaturatedError as e:
+        return saturated_response(e)
+    except StreamError as e:
+        return stream_error_response(e)
+    
+    logger.info(f"🎞️ Procesando video: {file.filename} ({fps} fps)")
+    return stream_response(frame_source, fps, change_threshold, max_frames, format, options, roi)
+
+FRAME_ID_BYTES = 4  # Prefijo de cada frame binario: id uint32 big-endian
+
+SESSION_FIELDS = ("model", "confidence", "classes", "max_det", "imgsz", "roi", "format")
+
+async def session_settings(settings: dict, update: dict) -> tuple:
+    """
+    Validar y aplicar una actualización de la configuración de una sesión WebSocket
+    
+    Los campos en null vuelven al default del servidor.
+    
+    Returns:
+        (configuración vigente, (InferenceOptions, roi) para los frames)
+    
+    Raises:
+        ValueError: Si algún valor es inválido (OptionsError si excede los límites)
+    """
+    settings = {**settings, **{field: update[field] for field in SESSION_FIELDS if field in update}}
+    try:
+        if settings["format"] not in RESPONSE_FORMATS:
+            raise ValueError(f"Formato inválido: {settings['format']} (opciones: {', '.join(RESPONSE_FORMATS)})")
+        options, roi = await inference_options(settings["model"], settings["confidence"], settings["classes"],
+                                               settings["max_det"], settings["imgsz"], settings["roi"])
+    except TypeError as e:
+        # JSON del cliente con tipos inesperados (listas u objetos donde va un valor)
+        raise ValueError(f"Configuración inválida: {e}") from e
+    
+    # Devolver los valores efectivos (defaults aplicados, clases normalizadas)
+    names = models.class_names(options.model)
+    settings.update({
+        "model": options.model,
+        "confidence": options.conf,
+        "classes": [names[idx] for idx in options.classes] if options.classes else None,
+        "max_det": options.max_det,
+        "imgsz": options.imgsz,
+        "roi": list(roi) if roi else None
+    })
+    return settings, (options, roi)
+
+async def ws_detect_frame(frame_id: int, image_bytes: bytes, settings: dict, inference: tuple) -> dict:
+    """Procesar un frame de /ws/detect y armar el mensaje de respuesta"""
+    options, roi = inference
+    start_time = time.time()
+    try:
+        memory_manager.admit()
+        detection, _, _ = await cached_detection(image_bytes, options=options, roi=roi)
+    except PoolSaturatedError as e:
+        # Frame descartado: el cliente decide si reenviarlo
+        return {"type": "busy", "frame_id": frame_id, "retry_after": e.retry_after}
+    except OptionsError as e:
+        return {"type": "error", "frame_id": frame_id, "error": str(e)}
+    except Exception as e:
+        logger.warning(f"Error en frame {frame_id}: {e}")
+        return {"type": "error", "frame_id": frame_id, "error": f"Error en detección: {str(e)}"}
+    
+    return {"type": "detection", "frame_id": frame_id,
+            **detection_response(detection, start_time, settings["format"])}
+
+@app.websocket("/ws/detect")
+async def ws_detect(websocket: WebSocket, model: Optional[str] = Query(None),
+                    confidence: Optional[float] = Query(None), classes: Optional[str] = Query(None),
+                    max_det: Optional[int] = Query(None), imgsz: Optional[int] = Query(None),
+                    roi: Optional[str] = Query(None), format: str = Query("objects")):
+    """
+    Canal de detección por WebSocket con sesión persistente
+    
+    Mensajes del cliente:
+        binario: id de frame (uint32 big-endian, 4 bytes) + imagen JPG/PNG
+        texto: {"type": "config", "model"?, "confidence"?, "classes"?, "max_det"?, "imgsz"?, "roi"?, "format"?}
+    
+    Mensajes del servidor (JSON):
+        detection: mismo esquema que /detect más frame_id
+        busy: cola de inferencia llena, frame descartado (retry_after)
+        error: frame inválido o configuración rechazada
+        config: configuración vigente de la sesión
+    
+    Se procesan hasta WS_MAX_IN_FLIGHT frames a la vez por conexión; las
+    respuestas llegan en orden de finalización. Con todos los lugares
+    ocupados el servidor deja de leer el socket (backpressure por TCP).
+    """
+    await websocket.accept()
+    
+    send_lock = asyncio.Lock()
+    
+    async def send(message: dict):
+        async with send_lock:
+            await websocket.send_text(json.dumps(message, ensure_ascii=False))
+    
+    try:
+        settings, inference = await session_settings(
+            {field: None for field in SESSION_FIELDS},
+            {"model": model, "confidence": confidence, "classes": classes, "max_det": max_det,
+             "imgsz": imgsz, "roi": roi, "format": format}
+        )
+    except ValueError as e:
+        await send({"type": "error", "error": str(e)})
+        await websocket.close(code=1008)
+        return
+    except NotReadyError as e:
+        await send({"type": "busy", "retry_after": e.retry_after, "error": str(e)})
+        await websocket.close(code=1013)  # Try Again Later
+        return
+    await send({"type": "config", **settings})
+    
+    slots = asyncio.Semaphore(WS_MAX_IN_FLIGHT)
+    tasks = set()
+    
+    async def process(frame_id: int, image_bytes: bytes, frame_settings: dict, frame_inference: tuple):
+        try:
+            await send(await ws_detect_frame(frame_id, image_bytes, frame_settings, frame_inference))
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # El cliente se fue mientras se procesaba
+        finally:
+            slots.release()
+    
+    logger.info("🔌 Sesión WebSocket abierta")
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            
+            data = message.get("bytes")
+            if data is not None:
+                if len(data) <= FRAME_ID_BYTES:
+                    await send({"type": "error", "error": "Frame sin id o sin imagen"})
+                    continue
+                frame_id = int.from_bytes(data[:FRAME_ID_BYTES], "big")
+                # Sin lugares libres no se lee más del socket hasta que termine un frame
+                await slots.acquire()
+                task = asyncio.ensure_future(process(frame_id, data[FRAME_ID_BYTES:], settings, inference))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                continue
+            
+            try:
+                try:
+                    update = json.loads(message.get("text") or "")
+                except json.JSONDecodeError:
+                    update = None
+                if not isinstance(update, dict) or update.pop("type", "config") != "config":
+                    raise ValueError("Mensaje de texto inválido: se espera {\"type\": \"config\", ...}")
+                settings, inference = await session_settings(settings, update)
+            except ValueError as e:
+                await send({"type": "error", "error": str(e)})
+                continue
+            await send({"type": "config", **settings})
+    
+    except WebSocketDisconnect:
+        pass
+    
+    finally:
+        for task in tasks:
+            task.cancel()
+        logger.info("🔌 Sesión WebSocket cerrada")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
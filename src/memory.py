@@ -0,0 +1,306 @@
+"""
+Gestión de memoria con presupuesto
+
+En lugar de un gc.collect() completo por petición, se mide el RSS del proceso
+(y de sus workers) y solo se recolecta al cruzar una marca de agua. Cerca del
+límite del contenedor se rechaza trabajo nuevo antes de que el kernel mate el
+proceso por OOM. Los buffers de lectura de uploads se reutilizan entre
+peticiones para no fragmentar el heap con asignaciones grandes.
+"""
+
+import gc
+import io
+import logging
+import sys
+import threading
+import time
+
+import psutil
+
+from workers import PoolSaturatedError
+
+logger = logging.getLogger(__name__)
+
+# Límite por defecto si no hay cgroup (docker-compose: memory 1.5G)
+DEFAULT_LIMIT_BYTES = int(1.5 * 1024 ** 3)
+
+CGROUP_LIMIT_FILES = (
+    "/sys/fs/cgroup/memory.max",                    # cgroup v2
+    "/sys/fs/cgroup/memory/memory.limit_in_bytes",  # cgroup v1
+)
+
+
+class MemoryPressureError(PoolSaturatedError):
+    """El proceso está cerca del límite de memoria; se rechaza trabajo nuevo"""
+
+    def __init__(self, retry_after: int, rss: int, limit: int):
+        super().__init__(retry_after)
+        self.args = (f"Memoria cerca del límite ({rss // 2**20}MB de {limit // 2**20}MB), "
+                     f"reintentar en {retry_after}s",)
+
+
+def workers_memory(process: psutil.Process) -> int:
+    """Memoria privada (USS) de los workers del proceso (bloqueante: lee el smaps de cada uno)"""
+    memory = 0
+    for child in process.children(recursive=True):
+        try:
+            memory += child.memory_full_info().uss
+        except psutil.Error:
+            pass
+    return memory
+
+
+class WorkerMemorySampler:
+    """
+    Memoria privada de los workers, leída en un thread aparte
+
+    Los workers creados con fork comparten con el padre las páginas de los
+    modelos: sumar su RSS las contaría una vez por worker, así que de cada uno
+    se suma solo la USS. Leerla recorre el smaps del worker (milisegundos con
+    modelos grandes): se muestrea cada interval segundos fuera del event loop y
+    las peticiones leen el último valor.
+
+    Args:
+        process: Proceso cuyos hijos se miden
+        interval: Segundos entre muestras
+    """
+
+    def __init__(self, process: psutil.Process, interval: float = 2.0):
+        self._process = process
+        self.interval = interval
+        self.bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="worker-memory", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.bytes = workers_memory(self._process)
+            except psutil.Error:
+                pass
+            if self._stop.wait(self.interval):
+                return
+
+
+def detect_memory_limit() -> int:
+    """Leer el límite de memoria del contenedor (cgroup) o usar el default"""
+    for path in CGROUP_LIMIT_FILES:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < psutil.virtual_memory().total:
+            return int(value)
+    return DEFAULT_LIMIT_BYTES
+
+
+class MemoryManager:
+    """
+    Recolección y admisión guiadas por RSS
+
+    Args:
+        limit_bytes: Límite de memoria del contenedor
+        gc_watermark: Fracción del límite a partir de la cual se recolecta
+        shed_watermark: Fracción del límite a partir de la cual se rechaza trabajo
+        sample_interval: Segundos mínimos entre lecturas de RSS
+    """
+
+    def __init__(self, limit_bytes: int, gc_watermark: float = 0.7,
+                 shed_watermark: float = 0.9, sample_interval: float = 0.25):
+        self.limit = limit_bytes
+        self.gc_threshold = int(limit_bytes * gc_watermark)
+        self.shed_threshold = int(limit_bytes * shed_watermark)
+        self.sample_interval = sample_interval
+
+        self._process = psutil.Process()
+        self.workers = WorkerMemorySampler(self._process)
+        self._lock = threading.Lock()
+        self._rss = 0
+        self._sampled_at = 0.0
+        self.peak_rss = 0
+        self.collections = 0
+        self.shed = 0
+        self._cuda = None
+
+    def rss(self, fresh: bool = False) -> int:
+        """
+        RSS del proceso más la memoria privada de sus workers, muestreado como
+        máximo cada sample_interval (la de los workers la actualiza self.workers)
+        """
+        now = time.monotonic()
+        if not fresh and now - self._sampled_at < self.sample_interval:
+            return self._rss
+        with self._lock:
+            try:
+                rss = self._process.memory_info().rss + self.workers.bytes
+            except psutil.Error:
+                return self._rss
+            self._rss = rss
+            self._sampled_at = now
+            self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    def collect(self):
+        """Recolección completa (y caché CUDA si hay GPU)"""
+        gc.collect()
+        if self._cuda is None:
+            torch = sys.modules.get("torch")
+            self._cuda = torch is not None and torch.cuda.is_available()
+        if self._cuda:
+            sys.modules["torch"].cuda.empty_cache()
+        self.collections += 1
+
+    def maybe_collect(self) -> bool:
+        """Recolectar solo si el RSS cruzó la marca de agua"""
+        if self.rss() < self.gc_threshold:
+            return False
+        self.collect()
+        self.rss(fresh=True)
+        return True
+
+    def admit(self):
+        """
+        Verificar que haya memoria para una petición nueva
+
+        Raises:
+            MemoryPressureError: Si el RSS sigue sobre el umbral tras recolectar
+        """
+        if self.rss() < self.shed_threshold:
+            return
+        self.collect()
+        rss = self.rss(fresh=True)
+        if rss >= self.shed_threshold:
+            self.shed += 1
+            raise MemoryPressureError(2, rss, self.limit)
+
+    def stats(self) -> dict:
+        mb = 1024 * 1024
+        return {
+            "rss_mb": round(self.rss() / mb, 1),
+            "peak_rss_mb": round(self.peak_rss / mb, 1),
+            "limit_mb": round(self.limit / mb, 1),
+            "gc_watermark_mb": round(self.gc_threshold / mb, 1),
+            "shed_watermark_mb": round(self.shed_threshold / mb, 1),
+            "collections": self.collections,
+            "shed": self.shed,
+        }
+
+
+class PooledBuffer:
+    """Buffer prestado por BufferPool; liberar con release() al terminar"""
+
+    def __init__(self, pool, buffer: bytearray, size: int):
+        self._pool = pool
+        self._buffer = buffer
+        self.view = memoryview(buffer)[:size]
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PooledBuffer":
+        """Envolver bytes comunes (release() no hace nada)"""
+        buffer = cls.__new__(cls)
+        buffer._pool = None
+        buffer._buffer = None
+        buffer.view = data
+        return buffer
+
+    def release(self):
+        if self._buffer is not None:
+            self.view.release()
+            self._pool._give_back(self._buffer)
+            self._buffer = None
+
+
+class BufferPool:
+    """
+    Pool de bytearrays reutilizables, agrupados en tamaños potencia de 2
+
+    Args:
+        max_bytes: Total máximo retenido en el pool (lo demás se libera)
+        min_size: Tamaño mínimo de buffer
+    """
+
+    def __init__(self, max_bytes: int, min_size: int = 256 * 1024):
+        self.max_bytes = max_bytes
+        self.min_size = min_size
+        self._free = {}
+        self._free_bytes = 0
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.allocated = 0
+
+    def _bucket(self, size: int) -> int:
+        bucket = self.min_size
+        while bucket < size:
+            bucket *= 2
+        return bucket
+
+    def acquire(self, size: int) -> PooledBuffer:
+        """Obtener un buffer de al menos size bytes"""
+        bucket = self._bucket(size)
+        with self._lock:
+            free = self._free.get(bucket)
+            if free:
+                self._free_bytes -= bucket
+                self.reused += 1
+                return PooledBuffer(self, free.pop(), size)
+            self.allocated += 1
+        return PooledBuffer(self, bytearray(bucket), size)
+
+    def _give_back(self, buffer: bytearray):
+        with self._lock:
+            if self._free_bytes + len(buffer) > self.max_bytes:
+                return
+            self._free.setdefault(len(buffer), []).append(buffer)
+            self._free_bytes += len(buffer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pooled_mb": round(self._free_bytes / (1024 * 1024), 1),
+                "reused": self.reused,
+                "allocated": self.allocated,
+            }
+
+
+class BufferReader(io.RawIOBase):
+    """Lector de solo lectura sobre un memoryview, sin copiar el contenido completo"""
+
+    def __init__(self, view: memoryview):
+        super().__init__()
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        chunk = self._view[self._pos:self._pos + len(b)]
+        n = len(chunk)
+        b[:n] = chunk
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = len(self._view) + offset
+        self._pos = max(0, self._pos)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
@@ -0,0 +1,252 @@
+"""
+Métricas en formato Prometheus
+
+Histogramas, contadores y gauges mínimos (sin dependencias) más un middleware
+ASGI que cuenta peticiones por endpoint y status. Observar un valor es una
+búsqueda binaria y un incremento bajo lock, así que la instrumentación en el
+camino caliente cuesta microsegundos.
+"""
+
+import bisect
+import threading
+import time
+
+import psutil
+
+
+# Buckets en segundos: de 1ms a 10s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Contador monotónico con labels"""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """Valor instantáneo con labels"""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Histograma acumulativo con labels (para p50/p99 vía histogram_quantile)"""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [counts por bucket..., +Inf, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {series[-1]}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Conjunto de métricas + collectors que se evalúan al hacer scrape"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self._register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self._register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self._register(Histogram(*args, **kwargs))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Registrar fn() -> lista de (nombre, tipo, ayuda, valor) evaluada en cada scrape"""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, kind, help, value in collect():
+                lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "yolo_stage_duration_seconds",
+    "Duración de cada etapa del pipeline de detección",
+    ("stage",),
+)
+REQUESTS_TOTAL = registry.counter(
+    "yolo_requests_total",
+    "Peticiones HTTP por endpoint y status",
+    ("endpoint", "status"),
+)
+REQUEST_SECONDS = registry.histogram(
+    "yolo_request_duration_seconds",
+    "Duración total de las peticiones HTTP por endpoint",
+    ("endpoint",),
+)
+REQUESTS_IN_FLIGHT = registry.gauge(
+    "yolo_requests_in_flight",
+    "Peticiones HTTP en curso",
+)
+STARTUP_SECONDS = registry.gauge(
+    "yolo_startup_phase_seconds",
+    "Duración de cada etapa del arranque (imports, load, warmup, ...)",
+    ("phase",),
+)
+
+
+def observe_stage(stage: str, seconds: float):
+    """Registrar la duración de una etapa (upload_read, decode, resize, inference, ...)"""
+    STAGE_SECONDS.observe(seconds, stage)
+
+
+_process = psutil.Process()
+_cpu_lock = threading.Lock()
+_worker_cpu = {}     # worker (psutil.Process: pid + hora de creación) -> CPU vista en el último scrape
+_reaped_cpu = 0.0    # CPU acumulada de workers que ya no existen (murieron o se recrearon)
+
+
+@registry.collector
+def process_metrics() -> list:
+    """
+    CPU del proceso y sus workers al momento del scrape (la memoria la reporta el servicio)
+
+    La CPU de un worker que muere se suma a un acumulado con el último valor
+    visto: el contador no baja cuando el pool se recrea (rate() sigue sirviendo).
+    """
+    global _reaped_cpu
+    try:
+        children = _process.children(recursive=True)
+    except psutil.Error:
+        children = []
+    current = {}
+    for child in children:
+        try:
+            times = child.cpu_times()
+            current[child] = times.user + times.system
+        except psutil.Error:
+            pass
+    try:
+        times = _process.cpu_times()
+        cpu = times.user + times.system
+    except psutil.Error:
+        cpu = 0.0
+    with _cpu_lock:
+        _reaped_cpu += sum(seconds for child, seconds in _worker_cpu.items() if child not in current)
+        _worker_cpu.clear()
+        _worker_cpu.update(current)
+        cpu += _reaped_cpu + sum(current.values())
+    return [
+        ("process_cpu_seconds_total", "counter", "Tiempo de CPU del proceso y sus workers", round(cpu, 3)),
+    ]
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: cuenta peticiones, duración e in-flight por endpoint"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # Template de la ruta (no el path crudo) para acotar la cardinalidad
+            label = getattr(scope.get("route"), "path", "unmatched")
+            REQUESTS_TOTAL.inc(label, str(status))
+            REQUEST_SECONDS.observe(time.perf_counter() - start, label)
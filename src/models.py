@@ -0,0 +1,183 @@
+"""
+Registro de modelos en el proceso
+
+Varios modelos YOLO pueden convivir en un solo servicio (ej: yolov5n para las
+rutas rápidas y uno más grande donde importa la precisión) sin pagar un
+contenedor con su propio torch por cada uno. Cada modelo se carga en su primer
+uso (o al arrancar si se precarga), se desaloja por LRU cuando el total supera
+el presupuesto de memoria y tiene su propio lock: dos peticiones concurrentes
+no lo cargan dos veces y la carga de uno no frena a los que ya están listos.
+
+En modo process cada worker tiene su propio registro: hereda (fork) los
+modelos cargados antes de iniciar el pool, con sus páginas compartidas, y carga
+por su cuenta los que se hayan desalojado; el presupuesto es por proceso. Las
+clases de cada modelo se recuerdan al cargarlo: validar una petición no lo
+vuelve a cargar aunque se haya desalojado.
+"""
+
+import gc
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownModelError(ValueError):
+    """Modelo que no está en la lista de modelos permitidos"""
+
+
+class LoadedModel:
+    """Modelo cargado y lo que costó cargarlo"""
+
+    def __init__(self, backend, memory_bytes: int, load_seconds: float):
+        self.backend = backend
+        self.memory_bytes = memory_bytes
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.uses = 0
+
+
+class ModelRegistry:
+    """
+    Modelos cargados bajo demanda con desalojo LRU
+
+    Args:
+        loader: Función bloqueante loader(nombre) -> InferenceBackend
+        allowed: Modelos que se pueden pedir (el resto se rechaza)
+        budget_bytes: Memoria máxima del conjunto de modelos (0 = sin límite)
+        pinned: Modelos que nunca se desalojan (el default)
+    """
+
+    def __init__(self, loader: Callable, allowed: Iterable[str], budget_bytes: int = 0,
+                 pinned: Iterable[str] = ()):
+        self.loader = loader
+        self.allowed = list(dict.fromkeys(allowed))
+        self.budget = budget_bytes
+        self.pinned = set(pinned)
+
+        self._models = OrderedDict()  # nombre -> LoadedModel, del menos al más usado
+        self._locks = {}              # nombre -> lock de carga
+        self._names = {}              # nombre -> clases, se recuerdan aunque se desaloje
+        self._lock = threading.Lock()  # Protege _models y _locks
+        self._process = psutil.Process()
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, name: str):
+        """
+        Backend del modelo, cargándolo si hace falta (bloqueante)
+
+        Raises:
+            UnknownModelError: Si el modelo no está permitido
+        """
+        with self._lock:
+            entry = self._touch(name)
+            if entry is not None:
+                return entry.backend
+            if name not in self.allowed:
+                raise UnknownModelError(f"Modelo no disponible: {name} (opciones: {', '.join(self.allowed)})")
+            load_lock = self._locks.setdefault(name, threading.Lock())
+
+        with load_lock:
+            # Otra petición pudo terminar de cargarlo mientras se esperaba el lock
+            with self._lock:
+                entry = self._touch(name)
+                if entry is not None:
+                    return entry.backend
+
+            entry = self._load(name)
+            with self._lock:
+                self._models[name] = entry
+                self._names[name] = entry.backend.names
+                entry.uses += 1
+                evicted = self._evict(keep=name)
+
+        if evicted:
+            # Los pesos se liberan cuando terminan las inferencias que los usan
+            gc.collect()
+        return entry.backend
+
+    def preload(self, names: Iterable[str]):
+        """Cargar modelos de antemano (al arrancar)"""
+        for name in names:
+            self.get(name)
+
+    def class_names(self, name: str) -> dict:
+        """Clases del modelo (bloqueante): solo se carga si nunca se cargó en este proceso"""
+        names = self._names.get(name)
+        return names if names is not None else self.get(name).names
+
+    def _touch(self, name: str):
+        """Marcar como usado recién (con _lock tomado); None si no está cargado"""
+        entry = self._models.get(name)
+        if entry is not None:
+            self._models.move_to_end(name)
+            entry.last_used = time.time()
+            entry.uses += 1
+        return entry
+
+    def _load(self, name: str) -> LoadedModel:
+        logger.info(f"📦 Cargando modelo: {name}...")
+        # Memoria estimada por RSS: el primer modelo incluye el runtime (torch, onnxruntime)
+        rss_before = self._process.memory_info().rss
+        start = time.perf_counter()
+        backend = self.loader(name)
+        load_seconds = time.perf_counter() - start
+        memory_bytes = max(0, self._process.memory_info().rss - rss_before)
+        self.loads += 1
+        logger.info(f"✅ Modelo {name} cargado en {load_seconds:.1f}s (~{memory_bytes // 2**20}MB)")
+        return LoadedModel(backend, memory_bytes, load_seconds)
+
+    def _evict(self, keep: str) -> list:
+        """Desalojar los menos usados hasta entrar en el presupuesto (con _lock tomado)"""
+        evicted = []
+        for name in list(self._models):
+            if not self.budget or self.memory_bytes <= self.budget:
+                break
+            if name == keep or name in self.pinned:
+                continue
+            entry = self._models.pop(name)
+            self.evictions += 1
+            evicted.append(name)
+            logger.info(f"♻️  Modelo {name} desalojado (LRU, ~{entry.memory_bytes // 2**20}MB)")
+        return evicted
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(entry.memory_bytes for entry in self._models.values())
+
+    def loaded(self) -> list:
+        """Modelos cargados, del más al menos usado recientemente"""
+        with self._lock:
+            return list(reversed(self._models))
+
+    def stats(self) -> dict:
+        mb = 1024 * 1024
+        with self._lock:
+            loaded = [
+                {
+                    "name": name,
+                    "backend": entry.backend.name,
+                    "memory_mb": round(entry.memory_bytes / mb, 1),
+                    "load_time_s": round(entry.load_seconds, 2),
+                    "uses": entry.uses,
+                    "idle_s": round(time.time() - entry.last_used, 1),
+                    "pinned": name in self.pinned,
+                }
+                for name, entry in reversed(self._models.items())
+            ]
+            memory = self.memory_bytes
+        return {
+            "available": self.allowed,
+            "loaded": loaded,
+            "memory_mb": round(memory / mb, 1),
+            "budget_mb": round(self.budget / mb, 1) if self.budget else None,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
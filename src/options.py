@@ -0,0 +1,144 @@
+"""
+Parámetros de inferencia por petición
+
+Modelo, confianza, clases, máximo de detecciones, imgsz y región de interés
+(ROI) se pueden pedir por petición. Todos se aplican dentro de la inferencia
+(imgsz y ROI al decodificar, clases y max_det en el NMS del modelo) y se
+validan contra límites del servidor para que un cliente no dispare la
+latencia de los demás.
+"""
+
+from typing import NamedTuple, Optional
+
+
+class OptionsError(ValueError):
+    """Parámetro de inferencia inválido o fuera de los límites del servidor"""
+
+
+class InferenceOptions(NamedTuple):
+    """Parámetros que cambian el forward pass (también es la key del micro-batcher)"""
+    conf: float
+    imgsz: int
+    max_det: int
+    classes: Optional[tuple] = None  # Ids de clase ordenados; None = todas
+    model: str = ""                  # Modelo del registro (ver models.ModelRegistry)
+
+    def predict_kwargs(self) -> dict:
+        """Argumentos para InferenceBackend.predict (el modelo se elige aparte)"""
+        kwargs = {"conf": self.conf, "imgsz": self.imgsz, "max_det": self.max_det}
+        if self.classes is not None:
+            kwargs["classes"] = list(self.classes)
+        return kwargs
+
+
+class OptionLimits(NamedTuple):
+    """Límites del servidor para los parámetros por petición"""
+    min_conf: float = 0.05
+    max_det: int = 300
+    min_imgsz: int = 160
+    max_imgsz: int = 640
+    min_roi: int = 32
+    dynamic_imgsz: bool = True  # False si el backend tiene forma fija (torchscript)
+
+
+IMGSZ_STRIDE = 32  # Stride máximo de YOLO: imgsz tiene que ser múltiplo
+
+
+def _is_number(value) -> bool:
+    # Los valores de WebSocket llegan de JSON sin validar (bool es int en Python)
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_integer(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_classes(classes, names: dict) -> Optional[tuple]:
+    """
+    Nombres de clase ("person,car" o lista) → ids ordenados
+
+    Raises:
+        OptionsError: Si alguna clase no existe en el modelo
+    """
+    if classes is None:
+        return None
+    if isinstance(classes, str):
+        classes = [name.strip() for name in classes.split(",") if name.strip()]
+    elif not isinstance(classes, (list, tuple)):
+        raise OptionsError("classes debe ser una lista de nombres o un texto separado por comas")
+    if not all(isinstance(name, (int, str)) for name in classes):
+        raise OptionsError("classes debe contener solo nombres de clase")
+    ids = {name: idx for idx, name in names.items()}
+    unknown = [str(name) for name in classes if name not in ids]
+    if unknown:
+        raise OptionsError(f"Clases desconocidas: {', '.join(unknown)}")
+    return tuple(sorted({ids[name] for name in classes})) or None
+
+
+def build_options(defaults: InferenceOptions, limits: OptionLimits, names: dict,
+                  confidence: Optional[float] = None, classes=None,
+                  max_det: Optional[int] = None, imgsz: Optional[int] = None) -> InferenceOptions:
+    """
+    Validar los parámetros de una petición y combinarlos con los defaults
+
+    Args:
+        defaults: Opciones del servidor (CONFIDENCE, DECODE_SIZE, MAX_DETECTIONS)
+        limits: Límites permitidos
+        names: Nombres de clase del modelo (id -> nombre)
+
+    Raises:
+        OptionsError: Si algún valor es inválido o excede los límites
+    """
+    options = defaults
+    if confidence is not None:
+        if not _is_number(confidence) or not limits.min_conf <= confidence <= 1:
+            raise OptionsError(f"confidence debe estar entre {limits.min_conf} y 1")
+        options = options._replace(conf=float(confidence))
+    if max_det is not None:
+        if not _is_integer(max_det) or not 1 <= max_det <= limits.max_det:
+            raise OptionsError(f"max_det debe estar entre 1 y {limits.max_det}")
+        options = options._replace(max_det=max_det)
+    if imgsz is not None and imgsz != defaults.imgsz:
+        if (not _is_integer(imgsz) or not limits.min_imgsz <= imgsz <= limits.max_imgsz
+                or imgsz % IMGSZ_STRIDE):
+            raise OptionsError(f"imgsz debe ser múltiplo de {IMGSZ_STRIDE} entre "
+                               f"{limits.min_imgsz} y {limits.max_imgsz}")
+        if not limits.dynamic_imgsz:
+            raise OptionsError("El backend actual no admite cambiar imgsz")
+        options = options._replace(imgsz=imgsz)
+    if classes is not None:
+        options = options._replace(classes=parse_classes(classes, names))
+    return options
+
+
+def parse_roi(roi, limits: OptionLimits) -> Optional[tuple]:
+    """
+    "x1,y1,x2,y2" o lista de 4 números (píxeles de la imagen original) → tupla de enteros
+
+    Raises:
+        OptionsError: Si el formato es inválido o la región es demasiado chica
+    """
+    if not roi:
+        return None
+    values = roi.split(",") if isinstance(roi, str) else roi
+    try:
+        x1, y1, x2, y2 = (int(round(float(value))) for value in values)
+    except (TypeError, ValueError, OverflowError):  # OverflowError: inf
+        raise OptionsError("roi debe ser x1,y1,x2,y2 en píxeles de la imagen original") from None
+    if min(x1, y1) < 0 or x2 - x1 < limits.min_roi or y2 - y1 < limits.min_roi:
+        raise OptionsError(f"roi debe tener coordenadas >= 0 y al menos {limits.min_roi}px de lado")
+    return x1, y1, x2, y2
+
+
+def clip_roi(roi: tuple, size: tuple, limits: OptionLimits) -> tuple:
+    """
+    Recortar la ROI a los bordes de la imagen (ancho, alto)
+
+    Raises:
+        OptionsError: Si lo que queda dentro de la imagen es demasiado chico
+    """
+    width, height = size
+    x1, y1, x2, y2 = min(roi[0], width), min(roi[1], height), min(roi[2], width), min(roi[3], height)
+    if x2 - x1 < limits.min_roi or y2 - y1 < limits.min_roi:
+        raise OptionsError(f"roi queda fuera de la imagen ({width}x{height}) o con menos de {limits.min_roi}px de lado")
+    return x1, y1, x2, y2
@@ -0,0 +1,390 @@
+"""
+Perfilado por petición
+
+Una petición de detección se perfila si trae el header X-Profile
+(PROFILE_HEADER) o si sale sorteada (PROFILE_SAMPLE_RATE). El perfil guarda
+cuánto tardó cada etapa (lectura, decode, resize, inferencia, postproceso,
+dibujo, encoding) y cada llamada al pool (espera en cola y ejecución). Además,
+el trabajo que corre en el pool se puede muestrear con un profiler de stacks
+de Python (flame graph) o con el profiler de torch (operadores y Chrome
+trace). Los perfiles quedan en memoria y se descargan desde /admin/profiles.
+
+Sin perfilado configurado el middleware no se instala: los hooks del camino
+caliente son una lectura de ContextVar que devuelve None.
+"""
+
+import hmac
+import importlib.util
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+
+PROFILE_MODES = ("spans", "sample", "torch")
+TORCH_TOP_OPS = 20  # Operadores de torch en el resumen del perfil
+
+# Carriles del Chrome trace (tid dentro del proceso "request")
+LANES = ("request", "pool", "stages")
+
+_active = ContextVar("profile", default=None)
+
+
+def current_profile() -> Optional["Profile"]:
+    """Perfil de la petición en curso (None si no se está perfilando)"""
+    return _active.get()
+
+
+def parse_modes(value: str) -> frozenset:
+    """
+    Modos de perfilado pedidos ("1", "spans", "sample", "torch", o varios separados por coma)
+
+    spans siempre se incluye: sample y torch se suman al desglose por etapa.
+
+    Raises:
+        ValueError: Si algún modo es desconocido o torch no está instalado
+    """
+    modes = {mode.strip().lower() for mode in value.split(",") if mode.strip()}
+    modes = {"spans" if mode in ("1", "true", "yes") else mode for mode in modes}
+    unknown = modes - set(PROFILE_MODES)
+    if unknown:
+        raise ValueError(f"Modo de perfilado inválido: {', '.join(sorted(unknown))} "
+                         f"(opciones: {', '.join(PROFILE_MODES)})")
+    if "torch" in modes and importlib.util.find_spec("torch") is None:
+        raise ValueError("Modo torch no disponible: torch no está instalado")
+    return frozenset(modes | {"spans"})
+
+
+class StackSampler:
+    """
+    Muestrear el stack de un thread cada interval segundos (desde otro thread)
+
+    Los stacks se guardan plegados ("f1;f2;f3" -> muestras), el formato que
+    leen flamegraph.pl, inferno y speedscope. Solo se guardan los frames por
+    debajo de profiled_call (el trabajo, no la maquinaria del executor).
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame.f_code is not _ROOT_CODE:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+def _torch_report(profiler) -> tuple:
+    """Eventos del Chrome trace y operadores con más tiempo propio de un torch.profiler"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace.json")
+        profiler.export_chrome_trace(path)
+        with open(path) as f:
+            trace = json.load(f)
+    events = [event for event in trace.get("traceEvents", [])
+              if event.get("ph") == "X" and isinstance(event.get("ts"), (int, float))]
+    averages = sorted(profiler.key_averages(), key=lambda e: e.self_cpu_time_total, reverse=True)
+    ops = [
+        {
+            "name": e.key,
+            "calls": e.count,
+            "self_cpu_ms": round(e.self_cpu_time_total / 1000, 3),
+            "cpu_ms": round(e.cpu_time_total / 1000, 3),
+        }
+        for e in averages[:TORCH_TOP_OPS]
+    ]
+    return events, ops
+
+
+def profiled_call(fn, args, modes: frozenset, interval: float) -> tuple:
+    """
+    Ejecutar fn(*args) bajo los profilers pedidos (corre en el worker, thread o proceso)
+
+    Returns:
+        (resultado de fn, captura {stacks, torch_events, torch_ops})
+    """
+    capture = {"stacks": {}, "torch_events": [], "torch_ops": []}
+    sampler = StackSampler(threading.get_ident(), interval) if "sample" in modes else None
+    torch_profiler = None
+    if "torch" in modes:
+        from torch.profiler import ProfilerActivity, profile
+        torch_profiler = profile(activities=[ProfilerActivity.CPU], record_shapes=True)
+
+    started = time.monotonic()
+    if sampler is not None:
+        sampler.start()
+    try:
+        if torch_profiler is not None:
+            with torch_profiler:
+                result = fn(*args)
+        else:
+            result = fn(*args)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+            capture["stacks"] = dict(sampler.stacks)
+
+    if torch_profiler is not None:
+        capture["torch_events"], capture["torch_ops"] = _torch_report(torch_profiler)
+    capture["started"] = started
+    return result, capture
+
+
+_ROOT_CODE = profiled_call.__code__
+
+
+class Profile:
+    """
+    Perfil de una petición
+
+    Los tiempos son de time.monotonic (el mismo reloj que mide el pool, también
+    en los workers de proceso) relativos al inicio de la petición.
+    """
+
+    def __init__(self, method: str, path: str, modes: frozenset, interval: float = 0.005):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.modes = modes
+        self.interval = interval
+        self.created_at = time.time()
+        self.start = time.monotonic()
+        self.duration = None
+        self.status = None
+        self.spans = []  # (carril, nombre, inicio, segundos)
+        self.stacks = Counter()  # stack plegado -> muestras
+        self.torch_events = []
+        self.torch_ops = []
+
+    @property
+    def deep(self) -> bool:
+        """Perfilar también dentro del pool (sample o torch), no solo las etapas"""
+        return len(self.modes) > 1
+
+    def stages(self, timings: dict):
+        """
+        Etapas medidas en el pool (solo duraciones): se ubican en orden,
+        una detrás de otra, terminando en el momento en que se registran
+        """
+        end = time.monotonic() - self.start
+        for name, seconds in reversed(list(timings.items())):
+            self.spans.append(("stages", name, end - seconds, seconds))
+            end -= seconds
+
+    def pool_call(self, name: str, submitted: float, started: float, finished: float,
+                  capture: Optional[dict] = None):
+        """Llamada al pool: espera en cola, ejecución y lo que capturaron los profilers"""
+        if started > submitted:
+            self.spans.append(("pool", f"{name} (cola)", submitted - self.start, started - submitted))
+        self.spans.append(("pool", name, started - self.start, finished - started))
+        if capture is None:
+            return
+        self.stacks.update(capture["stacks"])
+        if capture["torch_events"]:
+            # El reloj del trace de torch es otro: alinear su primer evento con el inicio de la llamada
+            shift = (capture["started"] - self.start) * 1e6 - min(e["ts"] for e in capture["torch_events"])
+            self.torch_events += [{**event, "ts": event["ts"] + shift} for event in capture["torch_events"]]
+        self.torch_ops += [{"call": name, **op} for op in capture["torch_ops"]]
+
+    def finish(self, status: Optional[int]):
+        self.duration = time.monotonic() - self.start
+        self.status = status
+        self.spans.append(("request", f"{self.method} {self.path}", 0.0, self.duration))
+
+    def stage_totals(self) -> dict:
+        """Milisegundos por etapa (sumando las repetidas, ej: varias imágenes de un batch)"""
+        totals = {}
+        for lane, name, _, seconds in sorted(self.spans, key=lambda span: span[2]):
+            if lane == "stages":
+                totals[name] = totals.get(name, 0.0) + seconds * 1000
+        return {name: round(ms, 2) for name, ms in totals.items()}
+
+    def server_timing(self) -> str:
+        """Header Server-Timing con las etapas registradas hasta ahora"""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.stage_totals().items())
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "modes": sorted(self.modes),
+            "created_at": self.created_at,
+            "total_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            "stages_ms": self.stage_totals(),
+            "samples": sum(self.stacks.values()),
+            "torch_events": len(self.torch_events),
+        }
+
+    def detail(self) -> dict:
+        """Resumen más cada span y los operadores de torch"""
+        spans = sorted(self.spans, key=lambda span: (LANES.index(span[0]), span[2]))
+        return {
+            **self.summary(),
+            "spans": [
+                {"lane": lane, "name": name, "start_ms": round(start * 1000, 3),
+                 "duration_ms": round(seconds * 1000, 3)}
+                for lane, name, start, seconds in spans
+            ],
+            "torch_ops": self.torch_ops,
+        }
+
+    def chrome_trace(self) -> dict:
+        """Trace para chrome://tracing o Perfetto: carriles request/pool/stages y, si hay, torch"""
+        events = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "request"}}]
+        events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": lane}}
+                   for tid, lane in enumerate(LANES)]
+        events += [
+            {"name": name, "cat": lane, "ph": "X", "pid": 1, "tid": LANES.index(lane),
+             "ts": round(start * 1e6, 1), "dur": round(seconds * 1e6, 1)}
+            for lane, name, start, seconds in self.spans
+        ]
+        if self.torch_events:
+            events.append({"name": "process_name", "ph": "M", "pid": 2, "args": {"name": "torch"}})
+            events += [{**event, "pid": 2} for event in self.torch_events]
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": self.summary()}
+
+    def folded(self) -> str:
+        """Stacks muestreados en formato plegado (una línea "f1;f2;f3 muestras" por stack)"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+class ProfileStore:
+    """Últimos perfiles capturados (en memoria, se descartan los más viejos)"""
+
+    def __init__(self, keep: int = 20):
+        self.keep = max(1, keep)
+        self.captured = 0
+        self._profiles = OrderedDict()
+
+    def add(self, profile: Profile):
+        self._profiles[profile.id] = profile
+        self.captured += 1
+        while len(self._profiles) > self.keep:
+            self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> list:
+        """Resúmenes, del más reciente al más viejo"""
+        return [profile.summary() for profile in reversed(self._profiles.values())]
+
+    def stats(self) -> dict:
+        return {"stored": len(self._profiles), "keep": self.keep, "captured": self.captured}
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI: elegir qué peticiones se perfilan y guardar su perfil
+
+    Args:
+        store: ProfileStore donde se guardan los perfiles terminados
+        header: Aceptar el header X-Profile (modos separados por coma)
+        sample_rate: Fracción de peticiones perfiladas sin header (0-1)
+        sample_modes: Modos de las peticiones sorteadas
+        interval: Período del profiler de stacks en segundos
+        token: X-Profile solo se acepta con X-Profile-Token igual (vacío: nunca)
+        paths: Prefijos de las rutas que se pueden perfilar
+    """
+
+    def __init__(self, app, store: ProfileStore, header: bool = False, sample_rate: float = 0.0,
+                 sample_modes: frozenset = frozenset({"spans"}), interval: float = 0.005,
+                 token: str = "", paths: tuple = ("/detect",)):
+        self.app = app
+        self.store = store
+        self.header = header
+        self.sample_rate = sample_rate
+        self.sample_modes = sample_modes
+        self.interval = interval
+        self.token = token
+        self.paths = paths
+
+    def _modes(self, scope) -> Optional[frozenset]:
+        """
+        Modos con que perfilar la petición (None = no perfilar)
+
+        Raises:
+            PermissionError: Si falta o no coincide X-Profile-Token
+            ValueError: Si X-Profile pide un modo inválido
+        """
+        if self.header:
+            headers = dict(scope["headers"])
+            requested = headers.get(b"x-profile", b"").decode("latin-1")
+            if requested:
+                given = headers.get(b"x-profile-token", b"")
+                if not self.token or not hmac.compare_digest(given, self.token.encode("latin-1")):
+                    raise PermissionError("X-Profile requiere un X-Profile-Token válido")
+                return parse_modes(requested)
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return self.sample_modes
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            modes = self._modes(scope)
+        except (PermissionError, ValueError) as e:
+            response = JSONResponse(
+                status_code=403 if isinstance(e, PermissionError) else 400,
+                content={
+                    "success": False,
+                    "error": str(e)
+                }
+            )
+            await response(scope, receive, send)
+            return
+        if modes is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"], modes, self.interval)
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile.id.encode()))
+                timing = profile.server_timing()
+                if timing:
+                    headers.append((b"server-timing", timing.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _active.set(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _active.reset(token)
+            profile.finish(status)
+            self.store.add(profile)
@@ -0,0 +1,213 @@
+"""
+Modelos cuantizados (INT8 / FP16)
+
+Modos:
+    dynamic  INT8 dinámico con ONNX Runtime (pesos INT8, sin calibración)
+    static   INT8 estático con ONNX Runtime, calibrado con imágenes locales
+    fp16     Precisión reducida con OpenVINO (half=True en el export)
+
+El artefacto cuantizado se genera una sola vez y se guarda en EXPORT_DIR junto
+a los demás exports.
+
+Reporte de precisión vs velocidad contra el modelo float (PyTorch):
+    python quantization.py --mode dynamic --images ../testing ../docs/examples
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import psutil
+from PIL import Image
+from ultralytics import YOLO
+
+from backends import InferenceBackend, check_parity, export_model, export_path, load_backend, sample_images
+
+logger = logging.getLogger(__name__)
+
+# modo -> backend requerido
+QUANTIZE_MODES = {
+    "dynamic": "onnx",
+    "static": "onnx",
+    "fp16": "openvino",
+}
+
+
+class CalibrationReader:
+    """
+    Lector de datos de calibración para onnxruntime.quantization.quantize_static
+
+    Aplica el mismo preprocesado que ultralytics (letterbox, RGB, 0-1, NCHW).
+    """
+
+    def __init__(self, input_name: str, images: list, imgsz: int):
+        self.input_name = input_name
+        self.images = iter(images)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        path = next(self.images, None)
+        if path is None:
+            return None
+        return {self.input_name: letterbox(Image.open(path).convert("RGB"), self.imgsz)}
+
+    def rewind(self):
+        pass
+
+
+def letterbox(img: Image.Image, imgsz: int) -> np.ndarray:
+    """Redimensionar con padding gris a imgsz x imgsz → tensor NCHW float32"""
+    ratio = imgsz / max(img.size)
+    size = (round(img.width * ratio), round(img.height * ratio))
+    canvas = Image.new("RGB", (imgsz, imgsz), (114, 114, 114))
+    canvas.paste(img.resize(size, Image.Resampling.BILINEAR),
+                 ((imgsz - size[0]) // 2, (imgsz - size[1]) // 2))
+    array = np.asarray(canvas, dtype=np.float32) / 255.0
+    return np.ascontiguousarray(array.transpose(2, 0, 1)[None])
+
+
+def quantize_onnx(onnx_path: Path, target: Path, mode: str, imgsz: int, calibration_dir: str):
+    """Cuantizar un modelo ONNX a INT8 (dinámico o estático)"""
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    if mode == "dynamic":
+        quantize_dynamic(str(onnx_path), str(target), weight_type=QuantType.QUInt8)
+        return
+
+    images = sample_images([calibration_dir]) if calibration_dir else []
+    if not images:
+        raise ValueError("quantize=static requiere CALIBRATION_DIR con imágenes de calibración")
+
+    import onnxruntime
+    session = onnxruntime.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"])
+    reader = CalibrationReader(session.get_inputs()[0].name, images, imgsz)
+    del session
+
+    logger.info(f"📐 Calibrando INT8 con {len(images)} imágenes de {calibration_dir}")
+    quantize_static(
+        str(onnx_path), str(target), reader,
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+
+
+def load_quantized(model_name: str, backend: str, mode: str, imgsz: int = 640,
+                   export_dir: str = "exports", calibration_dir: str = "") -> InferenceBackend:
+    """
+    Cargar (y generar si hace falta) el modelo cuantizado
+
+    Raises:
+        ValueError: Si el modo no existe o no es compatible con el backend
+    """
+    if mode not in QUANTIZE_MODES:
+        raise ValueError(f"Cuantización inválida: {mode} (opciones: {', '.join(QUANTIZE_MODES)})")
+    if QUANTIZE_MODES[mode] != backend:
+        raise ValueError(f"quantize={mode} requiere INFERENCE_BACKEND={QUANTIZE_MODES[mode]}")
+
+    if mode == "fp16":
+        weights = export_model(model_name, backend, imgsz, export_dir, tag="fp16", half=True)
+    else:
+        weights = export_path(model_name, backend, imgsz, export_dir, tag=f"int8{mode}")
+        if not weights.exists():
+            start = time.time()
+            onnx_path = export_model(model_name, backend, imgsz, export_dir)
+            logger.info(f"🔧 Cuantizando {onnx_path.name} (INT8 {mode}), solo la primera vez...")
+            quantize_onnx(onnx_path, weights, mode, imgsz, calibration_dir)
+            logger.info(f"✅ Modelo cuantizado en {(time.time() - start):.1f}s: {weights}")
+
+    return InferenceBackend(backend, YOLO(str(weights), task="detect"), str(weights), mode)
+
+
+# ==================== REPORTE ====================
+
+def artifact_size_mb(path: str) -> float:
+    """Tamaño en disco de un modelo (archivo o directorio)"""
+    path = Path(path)
+    if path.is_dir():
+        size = sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+    elif path.exists():
+        size = path.stat().st_size
+    else:
+        return 0.0
+    return round(size / 2**20, 1)
+
+
+def load_measured(loader, warmup_image: str, imgsz: int) -> tuple:
+    """Cargar un backend y medir el aumento de RSS (incluye un warm-up)"""
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    backend = loader()
+    backend.predict(warmup_image, imgsz=imgsz)
+    return backend, round((process.memory_info().rss - rss_before) / 2**20, 1)
+
+
+def quantization_report(model_name: str, mode: str, images: list, imgsz: int, conf: float,
+                        export_dir: str, calibration_dir: str) -> dict:
+    """Comparar latencia, memoria y coincidencia de detecciones float vs cuantizado"""
+    backend = QUANTIZE_MODES[mode]
+    warmup = str(images[0])
+    reference, reference_rss = load_measured(
+        lambda: load_backend(model_name, "torch"), warmup, imgsz)
+    candidate, candidate_rss = load_measured(
+        lambda: load_quantized(model_name, backend, mode, imgsz, export_dir, calibration_dir),
+        warmup, imgsz)
+
+    parity = check_parity(reference, candidate, images, conf, imgsz)
+    rows = parity["per_image"]
+
+    def summary(label, model, rss):
+        latencies = [r[f"{label}_ms"] for r in rows]
+        return {
+            **model.info(),
+            "size_mb": artifact_size_mb(model.weights),
+            "rss_delta_mb": rss,
+            "mean_ms": round(float(np.mean(latencies)), 1),
+            "max_ms": round(float(np.max(latencies)), 1),
+        }
+
+    float_summary = summary("reference", reference, reference_rss)
+    quant_summary = summary("candidate", candidate, candidate_rss)
+    return {
+        "mode": mode,
+        "images": len(rows),
+        "imgsz": imgsz,
+        "float": float_summary,
+        "quantized": quant_summary,
+        "speedup": round(float_summary["mean_ms"] / quant_summary["mean_ms"], 2) if quant_summary["mean_ms"] else None,
+        "agreement_f1": parity["f1"],
+        "per_image": rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reporte de precisión vs velocidad de un modelo cuantizado")
+    parser.add_argument("--model", default=os.getenv("MODEL_NAME", "yolov5n.pt"))
+    parser.add_argument("--mode", required=True, choices=list(QUANTIZE_MODES))
+    parser.add_argument("--imgsz", type=int, default=int(os.getenv("DECODE_SIZE", "640")))
+    parser.add_argument("--conf", type=float, default=float(os.getenv("CONFIDENCE", "0.4")))
+    parser.add_argument("--export-dir", default=os.getenv("EXPORT_DIR", "exports"))
+    parser.add_argument("--calibration-dir", default=os.getenv("CALIBRATION_DIR", "../testing"))
+    parser.add_argument("--images", nargs="+", default=["../testing", "../docs/examples"])
+    parser.add_argument("--output", help="Guardar el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    images = sample_images(args.images)
+    if not images:
+        parser.error("No se encontraron imágenes de muestra")
+
+    report = quantization_report(args.model, args.mode, images, args.imgsz, args.conf,
+                                 args.export_dir, args.calibration_dir)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Dibujo de detecciones y codificación de la imagen de /detect-visual
+
+Las cajas se dibujan directamente sobre la imagen decodificada (no se copia),
+las coordenadas se convierten todas juntas con NumPy y las etiquetas se
+rasterizan una sola vez por texto (cache de glifos). La salida puede ser PNG,
+JPEG o WebP y se escribe por chunks a medida que el encoder avanza.
+"""
+
+import asyncio
+import concurrent.futures
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Colores para diferentes clases (ciclar)
+BOX_COLORS = [
+    (255, 0, 0),      # Red
+    (0, 255, 0),      # Green
+    (0, 0, 255),      # Blue
+    (255, 255, 0),    # Yellow
+    (255, 0, 255),    # Magenta
+    (0, 255, 255),    # Cyan
+    (255, 165, 0),    # Orange
+    (128, 0, 128),    # Purple
+]
+
+# formato -> (formato PIL, media type, extensión)
+RENDER_FORMATS = {
+    "png": ("PNG", "image/png", "png"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+    "webp": ("WEBP", "image/webp", "webp"),
+}
+MEDIA_TYPES = {media_type: fmt for fmt, (_, media_type, _) in RENDER_FORMATS.items()}
+MEDIA_TYPES["image/jpg"] = "jpeg"
+
+LABEL_OFFSET = 20  # La etiqueta va encima de la caja
+LABEL_PADDING = 5
+
+_font = ImageFont.load_default()
+
+
+def negotiate_format(accept: str, default: str) -> str:
+    """
+    Elegir el formato de salida a partir del header Accept
+
+    Se usa el tipo soportado con mayor q (a igual q, el primero listado).
+    Comodines (image/*, */*) o tipos no soportados → default.
+    """
+    best, best_q = default, 0.0
+    for part in (accept or "").split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        fmt = MEDIA_TYPES.get(media_type.lower())
+        if fmt is None:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+@lru_cache(maxsize=2048)
+def label_glyph(text: str) -> tuple:
+    """Máscara L del texto de una etiqueta y su offset (se rasteriza una vez por texto)"""
+    left, top, right, bottom = _font.getbbox(text)
+    mask = Image.new("L", (max(1, right - left), max(1, bottom - top)))
+    ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=_font)
+    return mask, (left, top)
+
+
+def draw_detections(image: Image.Image, objects: dict, scale: tuple = (1.0, 1.0)):
+    """
+    Dibujar cajas y etiquetas sobre la imagen (en el lugar, sin copiarla)
+
+    Args:
+        image: Imagen RGB decodificada (se modifica)
+        objects: Columnas {class, confidence, bbox} en coordenadas de la imagen original
+        scale: Factor (x, y) decodificada -> original
+    """
+    if not objects["bbox"]:
+        return
+
+    # Coordenadas de la imagen original → imagen decodificada, todas juntas
+    sx, sy = scale
+    boxes = (np.asarray(objects["bbox"], dtype=np.float64) / (sx, sy, sx, sy)).tolist()
+
+    draw = ImageDraw.Draw(image)
+    for idx, ((x1, y1, x2, y2), class_name, conf) in enumerate(
+            zip(boxes, objects["class"], objects["confidence"])):
+        color = BOX_COLORS[idx % len(BOX_COLORS)]
+
+        # Rectángulo
+        draw.rectangle([x1, y1, x2, y2], outline=color, width=3)
+
+        # Etiqueta: fondo del color de la caja + glifo cacheado en blanco
+        mask, (left, top) = label_glyph(f"{class_name} {conf:.2f}")
+        x, y = round(x1 + left), round(y1 - LABEL_OFFSET + top)
+        draw.rectangle([x, y, x + mask.width + LABEL_PADDING, y + mask.height + LABEL_PADDING], fill=color)
+        image.paste((255, 255, 255), (x, y, x + mask.width, y + mask.height), mask)
+
+
+def encode_image(image: Image.Image, fp, fmt: str, quality: int = 85):
+    """
+    Codificar la imagen en fp (cualquier objeto con write)
+
+    Args:
+        fmt: png | jpeg | webp
+        quality: Calidad 1-100 (JPEG/WebP; PNG es sin pérdida)
+    """
+    pil_format, _, _ = RENDER_FORMATS[fmt]
+    if fmt == "png":
+        # optimize=True prueba varias estrategias de zlib: lento y casi sin ganancia
+        options = {"compress_level": 3}
+    elif fmt == "jpeg":
+        options = {"quality": quality}
+    else:
+        # method=2: bastante más rápido que el default (4) con tamaño similar
+        options = {"quality": quality, "method": 2}
+    image.save(fp, format=pil_format, **options)
+
+
+_END = object()  # Fin del stream de chunks (con error si ChunkStream._error está puesto)
+
+
+class ChunkStream:
+    """
+    Canal de chunks de un encoder (en un thread del pool) hacia el event loop
+
+    El worker llama write()/close()/fail(); el event loop espera ready() y
+    después itera los chunks con `async for`. La cola está acotada: con un
+    cliente lento write() bloquea al encoder en vez de acumular el body entero
+    en memoria. Si el cliente se va (o no lee en write_timeout segundos),
+    write() falla y el encoder se corta: el worker no queda bloqueado.
+
+    Args:
+        loop: Event loop que consume los chunks
+        max_chunks: Chunks en vuelo como máximo (PIL escribe de a ~64KB)
+        write_timeout: Segundos máximos que un write() espera lugar en la cola
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_chunks: int = 8,
+                 write_timeout: float = 30.0):
+        self._loop = loop
+        self.write_timeout = write_timeout
+        self._queue = asyncio.Queue(maxsize=max(1, max_chunks))
+        self._ready = loop.create_future()
+        self._error = None
+        self._finished = False
+        self._abandoned = False
+
+    # --- Lado del worker (thread-safe) ---
+
+    def write(self, data) -> int:
+        self._put_blocking(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._put_blocking(_END)
+
+    def fail(self, exc: BaseException):
+        """Terminar con error (desde el worker o desde el event loop: no bloquea)"""
+        self._loop.call_soon_threadsafe(self._fail, exc)
+
+    def _put_blocking(self, item):
+        if self._abandoned:
+            raise ConnectionAbortedError("El cliente cerró la conexión")
+        future = asyncio.run_coroutine_threadsafe(self._put(item), self._loop)
+        try:
+            future.result(self.write_timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self._abandoned = True
+            raise ConnectionAbortedError("El cliente no lee la respuesta") from None
+
+    # --- Lado del event loop ---
+
+    async def _put(self, item):
+        if not self._ready.done():
+            self._ready.set_result(None)
+        await self._queue.put(item)
+
+    def _fail(self, exc: BaseException):
+        if self._finished:
+            return
+        self._finished = True
+        self._error = exc
+        if not self._ready.done():
+            self._ready.set_exception(exc)
+            return
+        # Con la cola llena no se puede bloquear el loop: encolar el fin sin esperar
+        self._loop.create_task(self._queue.put(_END))
+
+    def abort(self):
+        """El consumidor se fue: vaciar la cola (libera al encoder) y cortar las escrituras"""
+        self._abandoned = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    async def ready(self):
+        """Esperar el primer chunk; propaga el error si falló antes de empezar"""
+        await self._ready
+
+    async def __aiter__(self):
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _END:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                yield item
+        finally:
+            self.abort()
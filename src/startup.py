@@ -0,0 +1,98 @@
+"""
+Arranque en etapas con readiness separada de liveness
+
+uvicorn empieza a aceptar conexiones apenas importa la app; la carga de
+modelos, el warm-up y el pool corren en segundo plano. Mientras tanto
+/health responde (el proceso está vivo) y /ready y los endpoints de detección
+responden 503 con Retry-After. El tiempo de cada etapa queda registrado para
+el log, /ready y /metrics.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import psutil
+
+from workers import PoolSaturatedError
+
+logger = logging.getLogger(__name__)
+
+
+class NotReadyError(PoolSaturatedError):
+    """El servicio todavía está arrancando (o falló el arranque)"""
+
+    def __init__(self, retry_after: int, phase: str):
+        super().__init__(retry_after)
+        self.phase = phase
+        self.args = (f"Servicio arrancando ({phase}), reintentar en {retry_after}s",)
+
+
+class StartupTracker:
+    """
+    Etapas del arranque y su duración
+
+    La primera etapa (imports) va desde que arrancó el proceso hasta begin():
+    intérprete, uvicorn, FastAPI y los módulos de la app.
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()  # etapa -> segundos
+        self.phase = "imports"
+        self.ready = False
+        self.error = None
+        self._started = None
+
+    def begin(self):
+        """Marcar el inicio del pipeline de arranque (evento startup de la app)"""
+        self._started = time.time()
+        try:
+            process_start = psutil.Process().create_time()
+        except psutil.Error:
+            process_start = self._started
+        self.phases["imports"] = max(0.0, self._started - process_start)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Medir una etapa; las etapas repetidas (un modelo por vez) se acumulan"""
+        self.phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def finish(self):
+        """Arranque completo: el servicio acepta trabajo"""
+        self.phase = "ready"
+        self.ready = True
+        breakdown = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in self.phases.items())
+        logger.info(f"⏱️  Arranque listo en {self.total:.1f}s: {breakdown}")
+
+    def fail(self, error: Exception):
+        self.phase = "failed"
+        self.error = str(error)
+
+    @property
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+    def check(self, retry_after: int = 5):
+        """
+        Verificar que el servicio esté listo para inferencia
+
+        Raises:
+            NotReadyError: Si el arranque no terminó
+        """
+        if not self.ready:
+            raise NotReadyError(retry_after, self.phase)
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "phase": self.phase,
+            "total_s": round(self.total, 2),
+            "phases_s": {name: round(seconds, 2) for name, seconds in self.phases.items()},
+            "error": self.error,
+        }
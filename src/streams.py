@@ -0,0 +1,336 @@
+"""
+Ingesta de video y streams MJPEG
+
+Fuentes soportadas:
+    MJPEG   JPEGs concatenados o multipart/x-mixed-replace (cámaras IP por
+            HTTP, archivos .mjpg o uploads)
+    Video   Archivos de video y streams rtsp:// vía OpenCV (dependencia de
+            ultralytics)
+
+Los frames se muestrean a un FPS objetivo antes de decodificarlos: en MJPEG
+solo se decodifican los JPEG elegidos y en video los descartados se saltan con
+grab() sin decodificar. Los frames casi idénticos al último procesado se
+detectan con una firma de baja resolución y no pasan por el modelo.
+"""
+
+import os
+import time
+import urllib.request
+from pathlib import Path
+from typing import Iterator, NamedTuple, Union
+from urllib.parse import urlsplit
+
+import numpy as np
+
+
+class StreamError(Exception):
+    """Fuente de video inválida o imposible de abrir"""
+
+
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mkv", ".mov", ".webm", ".m4v", ".ts"}
+MJPEG_EXTENSIONS = {".mjpg", ".mjpeg"}
+MJPEG_CONTENT_TYPES = ("video/x-motion-jpeg", "multipart/x-mixed-replace", "image/mjpeg")
+
+READ_CHUNK = 64 * 1024
+MAX_FRAME_BYTES = 16 * 1024 * 1024  # Sin EOI a esta altura el stream está corrupto
+SIGNATURE_SIDE = 32
+
+
+class Frame(NamedTuple):
+    """Frame elegido por el muestreo"""
+    index: int                       # Posición en la fuente (incluye los descartados)
+    timestamp: float                 # Segundos desde el inicio de la fuente
+    data: Union[bytes, np.ndarray]   # JPEG (MJPEG) o array BGR (video)
+
+
+class FrameSampler:
+    """
+    Elegir frames a un FPS objetivo según su timestamp
+
+    Args:
+        fps: Frames por segundo a procesar (0 = todos)
+    """
+
+    def __init__(self, fps: float):
+        self.interval = 1 / fps if fps > 0 else 0.0
+        self._next = None
+
+    def accept(self, timestamp: float) -> bool:
+        if self._next is not None and timestamp < self._next - 1e-6:
+            return False
+        # Avanzar desde el slot anterior (no desde el frame) para no derivar
+        if self._next is None or timestamp - self._next >= self.interval:
+            self._next = timestamp + self.interval
+        else:
+            self._next += self.interval
+        return True
+
+
+def frame_signature(array: np.ndarray) -> np.ndarray:
+    """Miniatura en gris (~32px de lado) para comparar frames barato"""
+    step = max(1, max(array.shape[:2]) // SIGNATURE_SIDE)
+    return array[::step, ::step].mean(axis=2, dtype=np.float32)
+
+
+def frame_change(previous: np.ndarray, current: np.ndarray) -> float:
+    """Diferencia media absoluta entre dos firmas, de 0 (iguales) a 1"""
+    if previous is None or previous.shape != current.shape:
+        return 1.0
+    return float(np.abs(current - previous).mean() / 255)
+
+
+class FrameSource:
+    """
+    Base de las fuentes: frames(sampler) itera los frames elegidos
+
+    Args:
+        delete_path: Archivo temporal a borrar al cerrar (uploads)
+    """
+
+    live = False  # True si los frames llegan en tiempo real (cámara)
+
+    def __init__(self, delete_path: str = ""):
+        self.delete_path = delete_path
+
+    def frames(self, sampler: FrameSampler) -> Iterator[Frame]:
+        raise NotImplementedError
+
+    def _release(self):
+        pass
+
+    def close(self):
+        self._release()
+        if self.delete_path:
+            try:
+                os.unlink(self.delete_path)
+            except FileNotFoundError:
+                pass
+
+
+# ==================== MJPEG ====================
+
+def _jpeg_end(buffer: bytearray, start: int) -> int:
+    """
+    Posición siguiente al EOI del JPEG que empieza en start (-1 si está incompleto)
+
+    Recorre los segmentos por su longitud (así un thumbnail EXIF con su propio
+    EOI no corta el frame) y después del SOS busca el EOI: en los datos
+    comprimidos 0xFF va siempre seguido de 0x00 o de un marcador RST.
+    """
+    i = start + 2
+    while i + 2 <= len(buffer):
+        if buffer[i] != 0xFF:
+            raise StreamError("JPEG inválido en el stream MJPEG")
+        marker = buffer[i + 1]
+        if marker == 0xFF:  # Relleno
+            i += 1
+            continue
+        if marker == 0xD9:
+            return i + 2
+        if marker == 0xDA:
+            end = buffer.find(b"\xff\xd9", i + 2)
+            return -1 if end < 0 else end + 2
+        if i + 4 > len(buffer):
+            break
+        i += 2 + int.from_bytes(buffer[i + 2:i + 4], "big")
+    return -1
+
+
+def split_mjpeg(stream) -> Iterator[bytes]:
+    """
+    Separar los JPEG de un stream MJPEG (bloqueante)
+
+    Acepta JPEGs concatenados o multipart/x-mixed-replace: los headers de cada
+    parte se ignoran y se busca el SOI del siguiente frame.
+    """
+    buffer = bytearray()
+    while True:
+        start = buffer.find(b"\xff\xd8")
+        end = _jpeg_end(buffer, start) if start >= 0 else -1
+        if end >= 0:
+            yield bytes(buffer[start:end])
+            del buffer[:end]
+            continue
+
+        if start > 0:
+            del buffer[:start]
+        elif start < 0:
+            del buffer[:-1]  # Conservar un posible 0xFF del próximo SOI
+        if len(buffer) > MAX_FRAME_BYTES:
+            raise StreamError("Frame MJPEG demasiado grande o stream corrupto")
+
+        chunk = stream.read(READ_CHUNK)
+        if not chunk:
+            return
+        buffer += chunk
+
+
+class MJPEGSource(FrameSource):
+    """
+    Fuente MJPEG (archivo, upload o respuesta HTTP)
+
+    Args:
+        stream: Objeto con read()
+        nominal_fps: FPS de grabación para calcular timestamps; 0 = reloj real
+            (streams en vivo, donde los frames llegan a su ritmo)
+    """
+
+    def __init__(self, stream, nominal_fps: float = 0.0, delete_path: str = ""):
+        super().__init__(delete_path)
+        self.stream = stream
+        self.nominal_fps = nominal_fps
+        self.live = nominal_fps <= 0
+
+    def frames(self, sampler: FrameSampler) -> Iterator[Frame]:
+        start = time.monotonic()
+        try:
+            for index, jpeg in enumerate(split_mjpeg(self.stream)):
+                if self.nominal_fps > 0:
+                    timestamp = index / self.nominal_fps
+                else:
+                    timestamp = time.monotonic() - start
+                if sampler.accept(timestamp):
+                    yield Frame(index, timestamp, jpeg)
+        except OSError as e:
+            # Conexión cortada o timeout a mitad del stream
+            raise StreamError(f"Error leyendo el stream: {e}") from e
+
+    def _release(self):
+        self.stream.close()
+
+
+# ==================== VIDEO ====================
+
+class VideoSource(FrameSource):
+    """Archivo de video o stream RTSP leído con OpenCV"""
+
+    def __init__(self, location: str, delete_path: str = ""):
+        super().__init__(delete_path)
+        try:
+            import cv2
+        except ImportError as e:
+            raise StreamError("Leer video requiere OpenCV (opencv-python)") from e
+
+        self._cv2 = cv2
+        self.live = "://" in location
+        self.capture = cv2.VideoCapture(location)
+        if not self.capture.isOpened():
+            raise StreamError(f"No se pudo abrir el video: {location}")
+
+    def frames(self, sampler: FrameSampler) -> Iterator[Frame]:
+        index = 0
+        try:
+            # grab() avanza sin decodificar; retrieve() solo para los frames elegidos
+            while self.capture.grab():
+                timestamp = self.capture.get(self._cv2.CAP_PROP_POS_MSEC) / 1000
+                if sampler.accept(timestamp):
+                    ok, array = self.capture.retrieve()
+                    if ok:
+                        yield Frame(index, timestamp, array)
+                index += 1
+        except self._cv2.error as e:
+            raise StreamError(f"Error leyendo el video: {e}") from e
+
+    def _release(self):
+        self.capture.release()
+
+
+def is_mjpeg(name: str = "", content_type: str = "") -> bool:
+    """True si el nombre o content type corresponden a MJPEG"""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    return content_type in MJPEG_CONTENT_TYPES or Path(name or "").suffix.lower() in MJPEG_EXTENSIONS
+
+
+def is_video(name: str = "", content_type: str = "") -> bool:
+    """True si el nombre o content type corresponden a un archivo de video"""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    return content_type.startswith("video/") or Path(name or "").suffix.lower() in VIDEO_EXTENSIONS
+
+
+def open_file(path: str, nominal_fps: float = 0.0, mjpeg: bool = False,
+              delete: bool = False) -> FrameSource:
+    """
+    Abrir un archivo local como fuente
+
+    Args:
+        mjpeg: Forzar MJPEG (si no, se decide por la extensión)
+        delete: Borrar el archivo al cerrar la fuente (uploads temporales)
+    """
+    delete_path = str(path) if delete else ""
+    if mjpeg or is_mjpeg(str(path)):
+        return MJPEGSource(open(path, "rb"), nominal_fps, delete_path)
+    return VideoSource(str(path), delete_path)
+
+
+def host_allowed(url: str, allowed_hosts) -> bool:
+    """True si el host (o host:puerto) de la URL está en allowed_hosts (en minúsculas)"""
+    try:
+        parts = urlsplit(url)
+        host, port = (parts.hostname or "").lower(), parts.port
+    except ValueError:  # Puerto inválido
+        return False
+    return bool(host) and (host in allowed_hosts or f"{host}:{port}" in allowed_hosts)
+
+
+class _AllowedRedirects(urllib.request.HTTPRedirectHandler):
+    """Seguir redirecciones solo hacia hosts permitidos"""
+
+    def __init__(self, allowed_hosts):
+        self.allowed_hosts = allowed_hosts
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not host_allowed(newurl, self.allowed_hosts):
+            raise StreamError(f"Redirección a un host no permitido: {newurl}")
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def open_source(location: str, nominal_fps: float = 0.0, allowed_dir: str = "",
+                timeout: float = 10.0, allowed_hosts=()) -> FrameSource:
+    """
+    Abrir una fuente por URL o ruta
+
+    Args:
+        location: http(s):// (MJPEG), rtsp:// o ruta local
+        nominal_fps: FPS de archivos MJPEG locales (los HTTP usan el reloj real)
+        allowed_dir: Directorio desde el que se permiten rutas locales ("" = ninguna)
+        timeout: Timeout de conexión para fuentes HTTP
+        allowed_hosts: Hosts (o host:puerto, en minúsculas) de los que se permiten
+            URLs (vacío = ninguna: el servidor no se conecta a URLs arbitrarias)
+
+    Raises:
+        StreamError: Si la fuente no está permitida o no se puede abrir
+    """
+    scheme = location.split("://", 1)[0].lower() if "://" in location else ""
+
+    if scheme and not host_allowed(location, allowed_hosts):
+        raise StreamError("Host no permitido: agregarlo a STREAM_ALLOWED_HOSTS" if allowed_hosts
+                          else "Las URLs están deshabilitadas (STREAM_ALLOWED_HOSTS)")
+
+    if scheme in ("http", "https"):
+        opener = urllib.request.build_opener(_AllowedRedirects(allowed_hosts))
+        try:
+            response = opener.open(location, timeout=timeout)
+        except OSError as e:
+            raise StreamError(f"No se pudo abrir {location}: {e}") from e
+        if not is_mjpeg(location, response.headers.get("Content-Type", "")):
+            response.close()
+            raise StreamError("La URL no es un stream MJPEG")
+        return MJPEGSource(response)
+
+    if scheme in ("rtsp", "rtsps", "rtmp"):
+        return VideoSource(location)
+
+    if scheme:
+        raise StreamError(f"Esquema no soportado: {scheme}")
+
+    # Rutas locales solo dentro de allowed_dir
+    if not allowed_dir:
+        raise StreamError("Las rutas locales están deshabilitadas (STREAM_ALLOWED_DIR)")
+    root = Path(allowed_dir).resolve()
+    path = (root / location).resolve()
+    if root not in path.parents or not path.is_file():
+        raise StreamError(f"Archivo no encontrado en {allowed_dir}: {location}")
+
+    if not (is_mjpeg(path.name) or is_video(path.name)):
+        raise StreamError(f"Formato no soportado: {path.suffix}")
+    return open_file(path, nominal_fps)
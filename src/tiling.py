@@ -0,0 +1,110 @@
+"""
+Inferencia por tiles (sliced inference)
+
+Para imágenes grandes (cámaras 4K gran angular) reducir todo a 640px hace
+desaparecer los objetos chicos. En modo tiles la imagen se corta en ventanas
+de tile x tile píxeles que se solapan, todas van al modelo en un solo batch
+(más una pasada de la imagen completa para los objetos grandes) y las cajas se
+fusionan entre tiles.
+
+El costo está acotado: si la grilla a resolución completa supera max_tiles,
+la imagen se decodifica más chica hasta que entre.
+"""
+
+import math
+
+import numpy as np
+
+
+def tile_starts(length: int, tile: int, overlap: float) -> list:
+    """Inicio de cada tile sobre un eje; el último queda pegado al borde"""
+    if length <= tile:
+        return [0]
+    stride = max(1, round(tile * (1 - overlap)))
+    count = math.ceil((length - tile) / stride) + 1
+    # Repartir parejo en lugar de dejar un último tile casi todo solapado
+    return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+
+def tile_count(size: tuple, tile: int, overlap: float) -> int:
+    width, height = size
+    return len(tile_starts(width, tile, overlap)) * len(tile_starts(height, tile, overlap))
+
+
+def fit_size(size: tuple, tile: int, overlap: float, max_tiles: int) -> tuple:
+    """
+    Mayor tamaño (<= original, misma proporción) cuya grilla entra en max_tiles
+
+    Args:
+        size: (ancho, alto) original
+        max_tiles: Máximo de tiles de la grilla
+    """
+    width, height = size
+    factor = 1.0
+    while True:
+        fitted = (max(1, round(width * factor)), max(1, round(height * factor)))
+        if tile_count(fitted, tile, overlap) <= max(1, max_tiles):
+            return fitted
+        factor *= 0.9
+
+
+def tile_windows(size: tuple, tile: int, overlap: float) -> list:
+    """Ventanas (x1, y1, x2, y2) que cubren la imagen con el solapamiento pedido"""
+    width, height = size
+    return [
+        (x, y, min(x + tile, width), min(y + tile, height))
+        for y in tile_starts(height, tile, overlap)
+        for x in tile_starts(width, tile, overlap)
+    ]
+
+
+def box_ios(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Intersección sobre la caja más chica (N x M)
+
+    A diferencia de IoU, una caja cortada por el borde de un tile contra la
+    caja completa del tile vecino da cerca de 1.
+    """
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (np.minimum(area_a[:, None], area_b[None, :]) + 1e-9)
+
+
+def merge_detections(parts: list, threshold: float = 0.5) -> np.ndarray:
+    """
+    Unir detecciones de varios tiles con NMS greedy por clase
+
+    Cada caja conservada absorbe (unión de extensiones) a las de su clase que
+    la solapan por encima de threshold (IoS), así un objeto partido entre dos
+    tiles sale como una sola caja completa con la mejor confianza.
+
+    Args:
+        parts: Arrays [x1, y1, x2, y2, conf, cls] ya en coordenadas de la imagen completa
+
+    Returns:
+        Array [x1, y1, x2, y2, conf, cls] fusionado
+    """
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return np.zeros((0, 6))
+    data = np.concatenate(parts).astype(np.float64)
+    order = np.argsort(-data[:, 4], kind="stable")
+
+    merged = []
+    while len(order):
+        best, rest = order[0], order[1:]
+        same_class = data[rest, 5] == data[best, 5]
+        overlaps = box_ios(data[best:best + 1, :4], data[rest, :4])[0]
+        matched = rest[same_class & (overlaps >= threshold)]
+
+        row = data[best].copy()
+        if len(matched):
+            row[:2] = np.minimum(row[:2], data[matched, :2].min(axis=0))
+            row[2:4] = np.maximum(row[2:4], data[matched, 2:4].max(axis=0))
+        merged.append(row)
+        order = rest[~np.isin(rest, matched)]
+
+    return np.stack(merged)
@@ -0,0 +1,244 @@
+"""
+Seguimiento de objetos entre frames de una misma cámara
+
+Los clientes que consultan la misma cámara una y otra vez mandan un
+stream_id: cada caja recibe un track_id persistente (asociación por IoU con la
+posición que predice un filtro de Kalman de velocidad constante). Se puede
+correr el detector solo cada N frames y propagar los tracks con el filtro en
+los intermedios, y responder solo lo que cambió (objetos nuevos, movidos y
+desaparecidos) respecto de lo que ya se le mandó al cliente.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU entre dos conjuntos de cajas x1,y1,x2,y2 (N x M)"""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+class KalmanBox:
+    """
+    Filtro de Kalman de una caja: estado (cx, cy, w, h) y sus velocidades
+
+    El paso es un frame; el ruido escala con el tamaño de la caja, así una
+    caja grande puede moverse más píxeles por frame que una chica.
+    """
+
+    F = np.eye(8)
+    F[:4, 4:] = np.eye(4)
+    H = np.eye(4, 8)
+
+    def __init__(self, box: np.ndarray):
+        self.x = np.concatenate([self._measure(box), np.zeros(4)])
+        scale = max(self.x[2], self.x[3])
+        self.P = np.diag(np.square([0.1 * scale] * 4 + [0.5 * scale] * 4))
+
+    @staticmethod
+    def _measure(box: np.ndarray) -> np.ndarray:
+        x1, y1, x2, y2 = box
+        return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=float)
+
+    def _noise(self, position: float, velocity: float) -> np.ndarray:
+        scale = max(self.x[2], self.x[3], 1.0)
+        return np.diag(np.square([position * scale] * 4 + [velocity * scale] * 4))
+
+    def predict(self):
+        self.x = self.F @ self.x
+        self.x[2:4] = np.maximum(self.x[2:4], 1.0)
+        self.P = self.F @ self.P @ self.F.T + self._noise(0.05, 0.02)
+
+    def update(self, box: np.ndarray):
+        R = self._noise(0.05, 0)[:4, :4]
+        S = self.H @ self.P @ self.H.T + R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (self._measure(box) - self.H @ self.x)
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+
+    @property
+    def box(self) -> np.ndarray:
+        cx, cy, w, h = self.x[:4]
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+
+class Track:
+    """Objeto seguido entre frames"""
+
+    def __init__(self, track_id: int, box: np.ndarray, class_name: str, confidence: float):
+        self.id = track_id
+        self.kalman = KalmanBox(box)
+        self.class_name = class_name
+        self.confidence = confidence
+        self.hits = 1
+        self.misses = 0  # Frames con detección seguidos sin asociar
+
+
+class StreamTracker:
+    """
+    Tracks de un stream y lo último que se le mandó al cliente
+
+    Args:
+        iou_threshold: IoU mínimo para asociar una detección a un track
+        max_age: Frames con detección sin asociar antes de dar el track por perdido
+                 (mientras tanto sigue reportándose en la posición predicha)
+        min_hits: Asociaciones necesarias para reportar un track nuevo
+        move_iou: Un track cuenta como movido si su IoU con lo último reportado baja de esto
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_age: int = 3, min_hits: int = 1,
+                 move_iou: float = 0.9):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.move_iou = move_iou
+        self.tracks = []
+        self.frames = 0
+        self.last_seen = time.monotonic()
+        self.lock = asyncio.Lock()  # Un frame a la vez por stream, en orden de llegada
+        self._next_id = 1
+        self._reported = {}  # track_id -> caja mandada al cliente
+
+    def needs_detection(self, detect_every: int) -> bool:
+        """Correr el detector en este frame (cada detect_every, o si no hay nada que propagar)"""
+        return not self.tracks or self.frames % detect_every == 0
+
+    def predict(self):
+        """Frame sin detección: avanzar los tracks con el filtro"""
+        self.frames += 1
+        self.last_seen = time.monotonic()
+        for track in self.tracks:
+            track.kalman.predict()
+
+    def update(self, objects: dict):
+        """
+        Frame con detección: asociar las detecciones (columnas class/confidence/bbox) a los tracks
+
+        Asociación greedy por IoU decreciente entre cajas de la misma clase; las
+        detecciones sin track abren uno nuevo.
+        """
+        self.predict()
+        boxes = np.asarray(objects["bbox"], dtype=float).reshape(-1, 4)
+        classes = objects["class"]
+        matched = set()
+        if self.tracks and len(boxes):
+            predicted = np.stack([track.kalman.box for track in self.tracks])
+            iou = box_iou(predicted, boxes)
+            same_class = np.array([[track.class_name == name for name in classes] for track in self.tracks])
+            iou[~same_class] = 0
+            used_tracks = set()
+            for t, d in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+                if iou[t, d] < self.iou_threshold:
+                    break
+                if t in used_tracks or d in matched:
+                    continue
+                track = self.tracks[t]
+                track.kalman.update(boxes[d])
+                track.confidence = objects["confidence"][d]
+                track.hits += 1
+                track.misses = 0
+                used_tracks.add(t)
+                matched.add(d)
+            for t, track in enumerate(self.tracks):
+                if t not in used_tracks:
+                    track.misses += 1
+        else:
+            for track in self.tracks:
+                track.misses += 1
+
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_age]
+        for d in range(len(boxes)):
+            if d not in matched:
+                self.tracks.append(Track(self._next_id, boxes[d], classes[d], objects["confidence"][d]))
+                self._next_id += 1
+
+    def visible(self) -> list:
+        """Tracks a reportar: los confirmados (min_hits) que no se dieron por perdidos"""
+        return [track for track in self.tracks if track.hits >= self.min_hits]
+
+    def objects(self, size: tuple) -> dict:
+        """Tracks visibles en columnas (class, confidence, bbox, track_id), recortados a la imagen"""
+        tracks = self.visible()
+        width, height = size
+        bboxes = [np.clip(track.kalman.box, 0, [width, height, width, height]) for track in tracks]
+        return {
+            "class": [track.class_name for track in tracks],
+            "confidence": [round(float(track.confidence), 3) for track in tracks],
+            "bbox": [np.rint(box).astype(int).tolist() for box in bboxes],
+            "track_id": [track.id for track in tracks],
+        }
+
+    def delta(self, objects: dict) -> dict:
+        """
+        Cambios respecto de lo último mandado al cliente (y registrarlos como mandados)
+
+        Returns:
+            added y moved en columnas (mismo esquema que objects), removed como lista de track_id
+        """
+        added, moved = [], []
+        for index, (track_id, box) in enumerate(zip(objects["track_id"], objects["bbox"])):
+            previous = self._reported.get(track_id)
+            if previous is None:
+                added.append(index)
+            elif box_iou(np.array([previous], dtype=float), np.array([box], dtype=float))[0, 0] < self.move_iou:
+                moved.append(index)
+        removed = [track_id for track_id in self._reported if track_id not in set(objects["track_id"])]
+
+        for index in added + moved:
+            self._reported[objects["track_id"][index]] = objects["bbox"][index]
+        for track_id in removed:
+            del self._reported[track_id]
+
+        def select(indices):
+            return {key: [values[i] for i in indices] for key, values in objects.items()}
+
+        return {"added": select(added), "moved": select(moved), "removed": removed}
+
+    def report(self, objects: dict):
+        """Registrar que el cliente recibió la lista completa"""
+        self._reported = dict(zip(objects["track_id"], objects["bbox"]))
+
+
+class TrackerRegistry:
+    """
+    Trackers por stream_id con desalojo LRU y vencimiento por inactividad
+
+    Args:
+        max_streams: Streams seguidos a la vez (se desaloja el menos reciente)
+        ttl: Segundos sin frames tras los que se olvida un stream
+    """
+
+    def __init__(self, max_streams: int = 64, ttl: float = 300, **tracker_kwargs):
+        self.max_streams = max_streams
+        self.ttl = ttl
+        self.tracker_kwargs = tracker_kwargs
+        self._streams = OrderedDict()
+
+    def get(self, stream_id: str) -> StreamTracker:
+        """Tracker del stream (nuevo si no existía o venció)"""
+        now = time.monotonic()
+        for key in [key for key, tracker in self._streams.items() if now - tracker.last_seen > self.ttl]:
+            del self._streams[key]
+        tracker = self._streams.get(stream_id)
+        if tracker is None:
+            tracker = StreamTracker(**self.tracker_kwargs)
+            self._streams[stream_id] = tracker
+            while len(self._streams) > self.max_streams:
+                self._streams.popitem(last=False)
+        self._streams.move_to_end(stream_id)
+        return tracker
+
+    def stats(self) -> dict:
+        return {
+            "streams": len(self._streams),
+            "max_streams": self.max_streams,
+            "tracks": sum(len(tracker.visible()) for tracker in self._streams.values()),
+        }
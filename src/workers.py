@@ -0,0 +1,342 @@
+"""
+Pool de workers para inferencia
+
+Ejecuta el trabajo bloqueante (decodificación, inferencia, encoding) fuera del
+event loop de uvicorn, con una cola acotada y control de admisión: si la cola
+está llena se rechaza la petición en lugar de encolarla indefinidamente.
+
+En modo process los workers se crean con fork después de cargar y calentar los
+modelos: los pesos quedan en páginas compartidas copy-on-write en lugar de una
+copia por worker. gc.freeze() antes del fork evita que el GC de cada worker
+toque (y duplique) esas páginas. Cada worker recibe su parte de los cores
+(afinidad) y de los threads intra-op de torch, para que N workers no compitan
+por los mismos cores.
+
+El fork solo es seguro al arrancar, antes de que existan otros threads (los de
+anyio, el muestreo de memoria) que podrían tener tomado un lock en el momento
+del fork y dejarlo tomado para siempre en el hijo. Si un worker muere con el
+servicio ya atendiendo, el pool se recrea con spawn: los workers nuevos
+arrancan de cero (importan main) y cargan sus modelos en el primer uso.
+"""
+
+import asyncio
+import gc
+import logging
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from profiling import current_profile, profiled_call
+
+logger = logging.getLogger(__name__)
+
+CGROUP_CPU_FILES = (
+    "/sys/fs/cgroup/cpu.max",                # cgroup v2: "quota period" o "max period"
+    "/sys/fs/cgroup/cpu/cpu.cfs_quota_us",   # cgroup v1 (período en cpu.cfs_period_us)
+)
+
+_worker_index = None  # Índice del worker en este proceso (None en el proceso principal)
+
+
+class PoolSaturatedError(Exception):
+    """La cola de inferencia está llena; el cliente debe reintentar más tarde"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Cola de inferencia llena, reintentar en {retry_after}s")
+        self.retry_after = retry_after
+
+
+class WorkerLostError(PoolSaturatedError):
+    """Un worker de proceso murió durante el trabajo (el pool se recreó); reintentar"""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__(retry_after)
+        self.args = (f"Un worker de inferencia murió, reintentar en {retry_after}s",)
+
+
+def available_cores() -> list:
+    """Cores que el proceso puede usar (afinidad heredada del contenedor)"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # Sin sched_getaffinity (macOS)
+        return list(range(os.cpu_count() or 1))
+
+
+def detect_cpu_quota() -> Optional[float]:
+    """Cuota de CPU del contenedor en cores (docker --cpus), None si no hay límite"""
+    for path in CGROUP_CPU_FILES:
+        try:
+            with open(path) as f:
+                fields = f.read().split()
+            if len(fields) == 1:  # cgroup v1: la cuota y el período están en archivos separados
+                with open(os.path.join(os.path.dirname(path), "cpu.cfs_period_us")) as f:
+                    fields.append(f.read().strip())
+        except OSError:
+            continue
+        if len(fields) == 2 and fields[0].isdigit() and fields[1].isdigit() and int(fields[1]):
+            return int(fields[0]) / int(fields[1])
+    return None
+
+
+def plan_cores(workers: int, cores: list, quota: Optional[float] = None, threads: int = 0) -> tuple:
+    """
+    Repartir cores y threads intra-op entre los workers
+
+    Args:
+        cores: Cores disponibles (available_cores())
+        quota: Cuota de CPU del contenedor; limita los threads aunque haya más cores
+        threads: Threads por worker (0 = repartir los cores utilizables)
+
+    Returns:
+        (cores de cada worker, threads por worker)
+    """
+    usable = min(len(cores), max(1, math.floor(quota))) if quota else len(cores)
+    threads = threads or max(1, usable // workers)
+    if workers <= len(cores):
+        # Bloques contiguos; los cores que sobran de la división van a los primeros workers
+        per_worker, extra = divmod(len(cores), workers)
+        plan = []
+        start = 0
+        for i in range(workers):
+            end = start + per_worker + (i < extra)
+            plan.append(tuple(cores[start:end]))
+            start = end
+    else:
+        plan = [(cores[i % len(cores)],) for i in range(workers)]
+    return plan, threads
+
+
+def set_inference_threads(threads: int):
+    """Threads intra-op de torch (los backends exportados fijan los suyos al crear la sesión)"""
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+
+def worker_index() -> Optional[int]:
+    """Índice del worker de inferencia actual (None fuera de un worker de proceso)"""
+    return _worker_index
+
+
+def _init_worker(counter, plan: list, threads: int, pin: bool):
+    """Inicializar un worker de proceso: índice, afinidad y threads"""
+    global _worker_index
+    with counter.get_lock():
+        _worker_index = counter.value
+        counter.value += 1
+    cores = plan[_worker_index % len(plan)]
+    if pin:
+        try:
+            os.sched_setaffinity(0, cores)
+        except (AttributeError, OSError) as e:
+            logger.warning(f"⚠️ Worker {_worker_index}: no se pudo fijar afinidad ({e})")
+    set_inference_threads(threads)
+    logger.info(f"🧵 Worker {_worker_index} (pid {os.getpid()}): "
+                f"cores {','.join(map(str, cores)) if pin else 'todos'}, {threads} thread(s)")
+
+
+def _noop():
+    return None
+
+
+def _timed_call(fn, args):
+    """Ejecutar fn(*args) midiendo inicio y fin (reloj monotónico compartido entre procesos)"""
+    started = time.monotonic()
+    result = fn(*args)
+    return result, started, time.monotonic()
+
+
+class InferencePool:
+    """
+    Pool acotado de threads o procesos para trabajo de inferencia
+
+    Args:
+        workers: Número de workers en paralelo
+        queue_size: Trabajos que pueden esperar además de los que están corriendo
+        kind: "thread" o "process" (procesos creados con fork tras cargar el modelo)
+        threads: Threads intra-op de torch por worker (0 = cores utilizables / workers)
+        pin_cores: Fijar cada worker de proceso a su parte de los cores
+    """
+
+    def __init__(self, workers: int = 1, queue_size: int = 8, kind: str = "thread",
+                 threads: int = 0, pin_cores: bool = True):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Tipo de pool inválido: {kind}")
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.kind = kind
+        self.pin_cores = pin_cores and kind == "process"
+        self.core_plan, self.threads = plan_cores(self.workers, available_cores(),
+                                                  detect_cpu_quota(), max(0, threads))
+        # Un solo thread worker sin threads explícitos deja el default de torch
+        self._split_threads = kind == "process" or threads > 0 or self.workers > 1
+        self._executor = None
+        self._started_at = None
+
+        # Estado (solo se modifica desde el event loop)
+        self._pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._busy_total = 0.0
+
+    def start(self, method: str = "fork"):
+        """
+        Crear el executor (llamar después de cargar el modelo)
+
+        Args:
+            method: Cómo crear los workers de proceso: "fork" al arrancar (heredan
+                los modelos) o "spawn" con el servicio en marcha (ver _restart)
+        """
+        if self._executor is not None:
+            return
+        if self.kind == "process":
+            if method == "fork":
+                # Congelar lo que ya existe (modelos, módulos): el GC de los workers no
+                # lo recorre, así sus páginas siguen compartidas después del fork
+                gc.collect()
+                gc.freeze()
+            # fork: los workers heredan el modelo ya cargado en el proceso padre
+            context = multiprocessing.get_context(method)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(context.Value("i", 0), self.core_plan, self.threads, self.pin_cores),
+            )
+            # Crear los workers ahora (con fork, desde un padre quieto) y no en la primera petición
+            for _ in range(self.workers):
+                self._executor.submit(_noop)
+        else:
+            # Los threads comparten el pool intra-op de torch: repartirlo entre ellos
+            if self._split_threads:
+                set_inference_threads(self.threads)
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="inference",
+            )
+        self._started_at = time.monotonic()
+        threads = f", {self.threads} thread(s) por worker" if self._split_threads else ""
+        logger.info(f"⚙️  Pool de inferencia: {self.workers} {self.kind}(s), cola máx. {self.queue_size}"
+                    f"{threads}{', cores fijos' if self.pin_cores else ''}")
+
+    def _restart(self, broken):
+        """Reemplazar un executor de procesos roto (un worker murió, ej: OOM killer)"""
+        if self._executor is not broken:
+            return  # Otra llamada que falló junto con esta ya lo reemplazó
+        self.restarts += 1
+        logger.error(f"💥 Un worker de inferencia murió: recreando el pool (reinicio {self.restarts})")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        # Con el servicio atendiendo hay threads vivos que pueden tener locks tomados:
+        # hacer fork ahora puede dejar al worker colgado. spawn arranca un intérprete limpio
+        self.start("spawn")
+
+    def shutdown(self):
+        """Detener el executor esperando los trabajos en curso"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    @property
+    def in_flight(self) -> int:
+        """Trabajos admitidos (corriendo + en cola)"""
+        return self._pending
+
+    @property
+    def queue_depth(self) -> int:
+        """Trabajos esperando un worker libre"""
+        return max(0, self._pending - self.workers)
+
+    def retry_after(self) -> int:
+        """Estimar en segundos cuándo habrá lugar en la cola"""
+        avg_service = self._busy_total / self.completed if self.completed else 1.0
+        return max(1, math.ceil(avg_service * (self.queue_depth + 1) / self.workers))
+
+    async def run(self, fn, *args, profiles=None):
+        """
+        Ejecutar fn(*args) en el pool
+
+        Args:
+            profiles: Perfiles donde registrar la llamada (default: el de la petición
+                en curso). Un batch pasa los de todas las peticiones que agrupa
+
+        Raises:
+            PoolSaturatedError: Si ya hay workers + queue_size trabajos admitidos, o si
+                un worker de proceso murió durante el trabajo (el pool se recrea)
+        """
+        if self._executor is None:
+            raise RuntimeError("Pool de inferencia no iniciado")
+        if self._pending >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise PoolSaturatedError(self.retry_after())
+
+        # Petición perfilada: registrar la llamada y, si se pidió, perfilar dentro del worker
+        if profiles is None:
+            profiles = [current_profile()]
+        profiles = [profile for profile in profiles if profile is not None]
+        # Solo una llamada de una sola petición se perfila a fondo (no mezclar las de otras)
+        deep = profiles[0] if len(profiles) == 1 and profiles[0].deep else None
+        call = (fn, args)
+        if deep is not None:
+            call = (profiled_call, (fn, args, deep.modes, deep.interval))
+
+        self._pending += 1
+        submitted = time.monotonic()
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            result, started, finished = await loop.run_in_executor(executor, _timed_call, *call)
+        except BrokenProcessPool:
+            # El executor queda inutilizable para siempre: recrearlo y pedir reintento (503)
+            self.failed += 1
+            self._restart(executor)
+            raise WorkerLostError() from None
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._pending -= 1
+
+        wait = max(0.0, started - submitted)
+        self._wait_total += wait
+        self._wait_max = max(self._wait_max, wait)
+        self._busy_total += finished - started
+        self.completed += 1
+        capture = None
+        if deep is not None:
+            result, capture = result
+        for profile in profiles:
+            profile.pool_call(getattr(fn, "__name__", "call"), submitted, started, finished,
+                              capture if profile is deep else None)
+        return result
+
+    def stats(self) -> dict:
+        """Métricas para dimensionar el pool"""
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        utilization = self._busy_total / (uptime * self.workers) if uptime > 0 else 0.0
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "threads_per_worker": self.threads if self._split_threads else None,
+            "cores": [list(cores) for cores in self.core_plan] if self.pin_cores else None,
+            "queue_size": self.queue_size,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "busy_workers": min(self._pending, self.workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "avg_wait_ms": round(self._wait_total / self.completed * 1000, 1) if self.completed else 0.0,
+            "max_wait_ms": round(self._wait_max * 1000, 1),
+            "utilization": round(min(1.0, utilization), 3),
+        }
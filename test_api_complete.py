@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Script completo para testing de YOLO Light API
-Prueba todos los endpoints y mide rendimiento
+Prueba todos los endpoints (para medir rendimiento: benchmarks/bench_api.py)
 """
 
 import requests
@@ -74,25 +74,17 @@ def test_detect_image(image_path):
     try:
         with open(image_path, 'rb') as f:
             files = {'file': (Path(image_path).name, f, 'image/jpeg')}
-            start_time = time.time()
             response = requests.post(f"{API_URL}/detect", files=files, timeout=TIMEOUT)
-            elapsed = (time.time() - start_time) * 1000
         
         if response.status_code == 200:
             data = response.json()
             success = data.get('success', False)
             count = data.get('count', 0)
-            inference_time = data.get('inference_time_ms', 0)
-            mode = data.get('mode', 'Unknown')
             
-            print_result(f"POST /detect ({Path(image_path).name})", success, 
-                        f"{count} objetos, {inference_time:.2f}ms")
+            print_result(f"POST /detect ({Path(image_path).name})", success, f"{count} objetos")
             
             if success and count > 0:
-                print(f"  Mode: {mode}")
-                print(f"  Total request time: {elapsed:.2f}ms")
-                print(f"  Inference time: {inference_time:.2f}ms")
-                print(f"  \n  Detecciones:")
+                print(f"  Detecciones:")
                 for obj in data.get('objects', []):
                     bbox = obj.get('bbox', {})
                     print(f"    - {obj['class']} ({obj['id']}) - Confianza: {obj['confidence']:.2%}")
@@ -126,58 +118,21 @@ def test_invalid_file():
         print_result("Invalid file rejection", False, str(e))
         return False
 
-def test_performance(image_path, iterations=5):
-    """Test performance with multiple requests"""
-    print(f"\n{Colors.INFO}=== Performance Test ({iterations} iterations) ==={Colors.END}")
-    
-    if not Path(image_path).exists():
-        print_result("Performance test", False, "Archivo no encontrado")
-        return False
-    
-    times = []
-    successful = 0
-    
-    try:
-        with open(image_path, 'rb') as f:
-            image_data = f.read()
-        
-        for i in range(iterations):
-            files = {'file': (Path(image_path).name, image_data, 'image/jpeg')}
-            start_time = time.time()
-            response = requests.post(f"{API_URL}/detect", files=files, timeout=TIMEOUT)
-            elapsed = (time.time() - start_time) * 1000
-            
-            if response.status_code == 200:
-                data = response.json()
-                inference_time = data.get('inference_time_ms', 0)
-                times.append(inference_time)
-                successful += 1
-                print(f"  Iteración {i+1}: {elapsed:.2f}ms (inferencia: {inference_time:.2f}ms)")
-        
-        if times:
-            avg_time = sum(times) / len(times)
-            min_time = min(times)
-            max_time = max(times)
-            print_result("Performance", successful == iterations,
-                        f"Avg: {avg_time:.2f}ms, Min: {min_time:.2f}ms, Max: {max_time:.2f}ms")
-            return True
-        else:
-            print_result("Performance", False, "No respuestas válidas")
-            return False
-            
-    except Exception as e:
-        print_result("Performance", False, str(e))
-        return False
-
 def main():
     print(f"\n{Colors.INFO}╔════════════════════════════════════════════════════════╗{Colors.END}")
     print(f"{Colors.INFO}║         YOLO Light API - Test Suite                     ║{Colors.END}")
     print(f"{Colors.INFO}║         API URL: {API_URL:<35} ║{Colors.END}")
     print(f"{Colors.INFO}╚════════════════════════════════════════════════════════╝{Colors.END}")
     
-    # Verificar conexión
+    # Verificar conexión y esperar a que el modelo esté cargado (/ready)
     try:
         response = requests.get(f"{API_URL}/health", timeout=5)
+        for _ in range(60):
+            if response.status_code != 200:
+                break
+            if requests.get(f"{API_URL}/ready", timeout=5).status_code == 200:
+                break
+            time.sleep(2)
         if response.status_code != 200:
             print(f"\n{Colors.FAIL}✗ API no responde en {API_URL}{Colors.END}")
             print(f"  Asegúrate que Docker está corriendo:")
@@ -207,10 +162,6 @@ def main():
         if Path(image).exists():
             results.append((f"detect_{Path(image).name}", test_detect_image(image)))
     
-    # Performance test
-    if Path("testing/foto.jpg").exists():
-        results.append(("performance", test_performance("testing/foto.jpg", iterations=3)))
-    
     # Resumen
     print(f"\n{Colors.INFO}=== Resumen ==={Colors.END}")
     passed = sum(1 for _, r in results if r)